@@ -0,0 +1,96 @@
+"""Benchmark of the AggregationEngine against per-message Python
+aggregation, with 10k temperature sensor feeds grouped by sensor model.
+
+Run from the 'python' folder: python -m benchmarks.aggregation_benchmark
+"""
+
+import argparse
+import random
+from statistics import mean
+import time
+
+from helpers.aggregation import AggregationEngine
+
+
+def python_baseline(readings, sensor_models, window_count: int, tick: int) -> float:
+    # Lists per sensor and a recomputation from scratch of the group averages
+    windows = {}
+    start: float = time.perf_counter()
+    for n, (sensor_id, reading) in enumerate(readings, start=1):
+        window = windows.setdefault(sensor_id, [])
+        window.append(reading)
+        del window[:-window_count]
+        if n % tick == 0:
+            per_model = {}
+            for window_sensor_id, values in windows.items():
+                per_model.setdefault(sensor_models[window_sensor_id], []).extend(values)
+            {model: mean(values) for model, values in per_model.items()}
+
+    return time.perf_counter() - start
+
+
+def engine_run(readings, sensor_models, window_count: int, tick: int) -> float:
+    engine = AggregationEngine(
+        window_count=window_count, initial_feeds=len(sensor_models)
+    )
+    for sensor_id, model in sensor_models.items():
+        engine.add_feed(sensor_id, group=model)
+
+    start: float = time.perf_counter()
+    for n, (sensor_id, reading) in enumerate(readings, start=1):
+        engine.add(sensor_id, reading)
+        if n % tick == 0:
+            engine.group_stats()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--feeds", type=int, default=10000)
+    parser.add_argument("--models", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument(
+        "--tick", type=int, default=10000, help="messages between two evaluations"
+    )
+    args = parser.parse_args()
+
+    sensor_models = {
+        f"sensor_{n}": f"model_{n % args.models}" for n in range(args.feeds)
+    }
+    sensor_ids = list(sensor_models)
+    readings = [
+        (random.choice(sensor_ids), random.uniform(10, 30))
+        for _ in range(args.messages)
+    ]
+    ticks: int = args.messages // args.tick
+
+    print(
+        f"{args.feeds} feeds in {args.models} groups, window of {args.window} values, "
+        f"{args.messages} messages, {ticks} evaluations"
+    )
+    for name, run in (
+        ("Python lists", python_baseline),
+        ("AggregationEngine", engine_run),
+    ):
+        seconds: float = run(readings, sensor_models, args.window, args.tick)
+        print(f"  {name:20} {args.messages / seconds:12.0f} messages/s")
+
+    engine = AggregationEngine(window_count=args.window, initial_feeds=args.feeds)
+    for sensor_id, model in sensor_models.items():
+        engine.add_feed(sensor_id, group=model)
+    for sensor_id, reading in readings:
+        engine.add(sensor_id, reading)
+    for name, evaluation in (
+        ("evaluate", engine.evaluate),
+        ("group_stats", engine.group_stats),
+    ):
+        start: float = time.perf_counter()
+        for _ in range(10):
+            evaluation()
+        print(f"  {name:20} {(time.perf_counter() - start) / 10 * 1000:12.2f} ms/tick")
+
+
+if __name__ == "__main__":
+    main()
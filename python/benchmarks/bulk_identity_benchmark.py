@@ -0,0 +1,58 @@
+"""Measure twin identities created per second by
+create_twins_with_control_delegation for an increasing number of processes.
+
+Run from the 'python' folder: python -m benchmarks.bulk_identity_benchmark
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.mock_host import MockHost
+from helpers.bulk_identity import TwinIdentitySpec, create_twins_with_control_delegation
+from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--twins", type=int, default=200)
+    parser.add_argument("--io-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with MockHost() as mock_host:
+        identity_api = get_rest_high_level_identity_api(resolver_url=mock_host.url)
+        seed: bytes = identity_api.create_seed()
+        _, agent_identity = identity_api.create_user_and_agent_with_auth_delegation(
+            user_seed=seed,
+            user_key_name="BenchmarkUser",
+            agent_seed=seed,
+            agent_key_name="BenchmarkAgent",
+        )
+
+        print(f"{args.twins} twins against {mock_host.url}")
+        processes: int = 1
+        while processes <= (os.cpu_count() or 1):
+            # A new key name prefix for each run, so that every twin is new
+            specs = [
+                TwinIdentitySpec(twin_key_name=f"Twin{processes}x{n}", twin_seed=seed)
+                for n in range(args.twins)
+            ]
+            start: float = time.perf_counter()
+            results = create_twins_with_control_delegation(
+                resolver_url=mock_host.url,
+                specs=specs,
+                agent_identity=agent_identity,
+                processes=processes,
+                io_concurrency=args.io_concurrency,
+            )
+            elapsed: float = time.perf_counter() - start
+            errors: int = sum(1 for result in results if result.error)
+            print(
+                f"{processes:3} processes: {args.twins / elapsed:8.1f} twins/s "
+                f"({errors} errors)"
+            )
+            processes *= 2
+
+
+if __name__ == "__main__":
+    main()
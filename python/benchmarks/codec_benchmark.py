@@ -0,0 +1,98 @@
+"""Micro-benchmarks of the feed payload codecs against the original
+base64 + json round trip, for small sensor readings and large payloads.
+
+Run from the 'python' folder: python -m benchmarks.codec_benchmark
+"""
+
+import argparse
+import base64
+import json
+import timeit
+
+from helpers.codec import JSON_CODEC, NumericCodec
+
+SMALL_READING = {"reading": 21.5}
+LARGE_PAYLOAD = {
+    "readings": [{"sensor": f"sensor_{n}", "reading": n * 0.5} for n in range(1000)]
+}
+
+
+def original_encode(data: dict) -> str:
+    return base64.b64encode(json.dumps(data).encode()).decode()
+
+
+def original_decode(data: str):
+    return json.loads(base64.b64decode(data).decode("ascii"))
+
+
+def report(name: str, statement, number: int, values_per_call: int = 1):
+    seconds: float = min(timeit.repeat(statement, number=number, repeat=5))
+    print(f"{name:40} {number * values_per_call / seconds:12.0f} values/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    numeric_codec = NumericCodec(labels=["reading"])
+    small: str = JSON_CODEC.encode(SMALL_READING)
+    small_numeric: str = numeric_codec.encode(SMALL_READING)
+    large: str = JSON_CODEC.encode(LARGE_PAYLOAD)
+    batch = [SMALL_READING] * args.batch
+    encoded_batch = [small] * args.batch
+    large_number: int = max(1, args.number // 1000)
+    batch_number: int = max(1, args.number // args.batch)
+
+    print("Small sensor reading")
+    report("  encode original", lambda: original_encode(SMALL_READING), args.number)
+    report("  encode JsonCodec", lambda: JSON_CODEC.encode(SMALL_READING), args.number)
+    report(
+        "  encode NumericCodec",
+        lambda: numeric_codec.encode(SMALL_READING),
+        args.number,
+    )
+    report("  decode original", lambda: original_decode(small), args.number)
+    report("  decode JsonCodec", lambda: JSON_CODEC.decode(small), args.number)
+    report(
+        "  decode NumericCodec",
+        lambda: numeric_codec.decode(small_numeric),
+        args.number,
+    )
+
+    print(f"Large payload ({len(large)} bytes encoded)")
+    report("  encode original", lambda: original_encode(LARGE_PAYLOAD), large_number)
+    report("  encode JsonCodec", lambda: JSON_CODEC.encode(LARGE_PAYLOAD), large_number)
+    report("  decode original", lambda: original_decode(large), large_number)
+    report("  decode JsonCodec", lambda: JSON_CODEC.decode(large), large_number)
+
+    print(f"Batches of {args.batch} small readings")
+    report(
+        "  encode original",
+        lambda: [original_encode(value) for value in batch],
+        batch_number,
+        args.batch,
+    )
+    report(
+        "  encode JsonCodec.encode_many",
+        lambda: JSON_CODEC.encode_many(batch),
+        batch_number,
+        args.batch,
+    )
+    report(
+        "  decode original",
+        lambda: [original_decode(value) for value in encoded_batch],
+        batch_number,
+        args.batch,
+    )
+    report(
+        "  decode JsonCodec.decode_many",
+        lambda: JSON_CODEC.decode_many(encoded_batch),
+        batch_number,
+        args.batch,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""End-to-end benchmark of the connector paths against the local mock host:
+REST shares (publisher), STOMP feed delivery (follower), input messages
+(sender and receiver), follow + aggregate + send input (synthesiser) and
+streamed searches. No IOTICSpace is needed, so it can run offline in CI.
+
+Messages are sent open-loop at '--rate' per second and latencies are
+measured from the time each message was scheduled, so a stalled client
+shows up in the percentiles instead of silently lowering the send rate.
+The exit code is 1 if any message was lost.
+
+Run from the 'python' folder: python -m benchmarks.e2e_benchmark
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sys
+import threading
+import time
+from typing import Callable, List
+
+from benchmarks.mock_host import MockHost
+from helpers.aggregation import AggregationEngine
+from helpers.bulk_provisioning import BulkProvisioner, TwinSpec, twin_payload
+from helpers.constants import (
+    PROPERTY_KEY_TYPE,
+    SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+    SEARCH_TWINS,
+    SEND_INPUT_MESSAGE,
+    SHARE_FEED_DATA,
+    SUBSCRIBE_TO_FEED,
+    SUBSCRIBE_TO_INPUT,
+)
+from helpers.rest_client import RestClient
+from helpers.stomp_client import StompClient
+from helpers.utilities import decode_data, encode_data, search_twins
+
+SENSOR_TYPE = "https://example.com/benchmark#Sensor"
+FEED_ID = "temperature"
+INPUT_ID = "on_off_switch"
+FOLLOWER_ID = "did:iotics:benchmark-follower"
+SENDER_ID = "did:iotics:benchmark-sender"
+SENSOR_MODELS = ["T1000", "T2000"]
+
+
+class Recorder:
+    """Thread-safe collection of the latencies of one scenario"""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.sent: int = 0
+        self._latencies: List[float] = []
+        self._lock: threading.Lock = threading.Lock()
+        self._start: float = time.perf_counter()
+        self._end: float = self._start
+
+    def record(self, scheduled_at: float):
+        now: float = time.perf_counter()
+        with self._lock:
+            self._latencies.append(now - scheduled_at)
+            self._end = now
+
+    @property
+    def received(self) -> int:
+        return len(self._latencies)
+
+    def wait(self, timeout: float = 5.0):
+        """Wait for the messages still in flight"""
+
+        deadline: float = time.perf_counter() + timeout
+        while self.received < self.sent and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def report(self) -> str:
+        latencies: List[float] = sorted(self._latencies)
+        seconds: float = self._end - self._start
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return float("nan")
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+        return (
+            f"{self.name:14} {self.sent:8} {self.received:9} "
+            f"{self.received / seconds if seconds else 0:10.0f} "
+            f"{percentile(0.5):9.2f} {percentile(0.99):9.2f}"
+        )
+
+
+def send_open_loop(
+    rate: float, duration: float, threads: int, send: Callable, recorder
+):
+    """Call 'send(n, scheduled_at)' 'rate' times per second for 'duration' seconds"""
+
+    total: int = int(rate * duration)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start: float = time.perf_counter()
+        for n in range(total):
+            scheduled_at: float = start + n / rate
+            delay: float = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, n, scheduled_at)
+            recorder.sent += 1
+
+
+def provision(host: MockHost, twin_ids: List[str], with_input: bool = False):
+    specs = [
+        TwinSpec(
+            twin_key_name=twin_id,
+            properties=[
+                {"key": PROPERTY_KEY_TYPE, "uriValue": {"value": SENSOR_TYPE}},
+                {
+                    "key": SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+                    "stringLiteralValue": {
+                        "value": SENSOR_MODELS[n % len(SENSOR_MODELS)]
+                    },
+                },
+            ],
+            feeds=[{"id": FEED_ID}],
+            inputs=[{"id": INPUT_ID}] if with_input else [],
+        )
+        for n, twin_id in enumerate(twin_ids)
+    ]
+    BulkProvisioner(host_url=host.url, headers={}).upsert(
+        twin_payload(twin_id, spec) for twin_id, spec in zip(twin_ids, specs)
+    )
+
+
+def share(client: RestClient, host: MockHost, twin_id: str, scheduled_at: float):
+    client.call(
+        SHARE_FEED_DATA,
+        payload={
+            "sample": {
+                "data": encode_data({"reading": 21, "sent_at": scheduled_at}),
+                "mime": "application/json",
+            }
+        },
+        host=host.url,
+        twin_id=twin_id,
+        feed_id=FEED_ID,
+    )
+
+
+def send_input(client: RestClient, host: MockHost, twin_id: str, data: dict):
+    client.call(
+        SEND_INPUT_MESSAGE,
+        payload={"message": {"data": encode_data(data), "mime": "application/json"}},
+        host=host.url,
+        twin_sender_id=SENDER_ID,
+        twin_receiver_host_id=host.host_id,
+        twin_receiver_id=twin_id,
+        input_id=INPUT_ID,
+    )
+
+
+def follow_feeds(stomp: StompClient, host: MockHost, twin_ids: List[str], callback):
+    for twin_id in twin_ids:
+        stomp.subscribe(
+            topic=SUBSCRIBE_TO_FEED.url.format(
+                twin_follower_id=FOLLOWER_ID,
+                twin_publisher_host_id=host.host_id,
+                twin_publisher_id=twin_id,
+                feed_id=FEED_ID,
+            ),
+            subscription_id=twin_id,
+            callback=callback,
+        )
+
+
+def publisher(host: MockHost, client: RestClient, args) -> Recorder:
+    twin_ids = [f"did:iotics:publisher{n}" for n in range(args.twins)]
+    provision(host, twin_ids)
+    recorder = Recorder("publisher")
+
+    def send(n: int, scheduled_at: float):
+        share(client, host, twin_ids[n % len(twin_ids)], scheduled_at)
+        recorder.record(scheduled_at)
+
+    send_open_loop(args.rate, args.duration, args.threads, send, recorder)
+
+    return recorder
+
+
+def follower(host: MockHost, client: RestClient, args) -> Recorder:
+    twin_ids = [f"did:iotics:followed{n}" for n in range(args.twins)]
+    provision(host, twin_ids)
+    recorder = Recorder("follower")
+
+    def on_frame(headers, body):
+        recorder.record(decode_data(json.loads(body)["feedData"]["data"])["sent_at"])
+
+    stomp = StompClient(stomp_endpoint=host.stomp_url, callback=None, token="token")
+    follow_feeds(stomp, host, twin_ids, on_frame)
+
+    send_open_loop(
+        args.rate,
+        args.duration,
+        args.threads,
+        lambda n, scheduled_at: share(
+            client, host, twin_ids[n % len(twin_ids)], scheduled_at
+        ),
+        recorder,
+    )
+    recorder.wait()
+    stomp.disconnect()
+
+    return recorder
+
+
+def sender_receiver(host: MockHost, client: RestClient, args) -> Recorder:
+    twin_ids = [f"did:iotics:receiver{n}" for n in range(args.twins)]
+    provision(host, twin_ids, with_input=True)
+    recorder = Recorder("sender/receiver")
+
+    def on_message(headers, body):
+        recorder.record(decode_data(json.loads(body)["message"]["data"])["sent_at"])
+
+    stomp = StompClient(
+        stomp_endpoint=host.stomp_url, callback=on_message, token="token"
+    )
+    for twin_id in twin_ids:
+        stomp.subscribe(
+            topic=SUBSCRIBE_TO_INPUT.url.format(
+                twin_receiver_id=twin_id, input_id=INPUT_ID
+            ),
+            subscription_id=twin_id,
+        )
+
+    send_open_loop(
+        args.rate,
+        args.duration,
+        args.threads,
+        lambda n, scheduled_at: send_input(
+            client, host, twin_ids[n % len(twin_ids)], {"sent_at": scheduled_at}
+        ),
+        recorder,
+    )
+    recorder.wait()
+    stomp.disconnect()
+
+    return recorder
+
+
+def synthesiser(host: MockHost, client: RestClient, args) -> Recorder:
+    """Sensor share -> follower -> average per model -> radiator input"""
+
+    sensor_ids = [f"did:iotics:sensor{n}" for n in range(args.twins)]
+    radiator_id = "did:iotics:radiator"
+    provision(host, sensor_ids)
+    provision(host, [radiator_id], with_input=True)
+    recorder = Recorder("synthesiser")
+
+    readings = AggregationEngine(window_count=1, initial_feeds=len(sensor_ids))
+    sensor_models = {}
+    for n, sensor_id in enumerate(sensor_ids):
+        sensor_models[sensor_id] = SENSOR_MODELS[n % len(SENSOR_MODELS)]
+        readings.add_feed(sensor_id, group=sensor_models[sensor_id])
+
+    def on_reading(headers, body):
+        frame: dict = json.loads(body)
+        sensor_id: str = frame["interest"]["followedFeedId"]["twinId"]
+        data: dict = decode_data(frame["feedData"]["data"])
+        readings.add(sensor_id, data["reading"])
+        model_average: float = readings.group_stats()[sensor_models[sensor_id]].mean
+        send_input(
+            client,
+            host,
+            radiator_id,
+            {"turn_on": model_average < 20, "sent_at": data["sent_at"]},
+        )
+
+    def on_input(headers, body):
+        recorder.record(decode_data(json.loads(body)["message"]["data"])["sent_at"])
+
+    stomp = StompClient(stomp_endpoint=host.stomp_url, callback=None, token="token")
+    follow_feeds(stomp, host, sensor_ids, on_reading)
+    stomp.subscribe(
+        topic=SUBSCRIBE_TO_INPUT.url.format(
+            twin_receiver_id=radiator_id, input_id=INPUT_ID
+        ),
+        subscription_id=radiator_id,
+        callback=on_input,
+    )
+
+    send_open_loop(
+        args.rate,
+        args.duration,
+        args.threads,
+        lambda n, scheduled_at: share(
+            client, host, sensor_ids[n % len(sensor_ids)], scheduled_at
+        ),
+        recorder,
+    )
+    recorder.wait()
+    stomp.disconnect()
+
+    return recorder
+
+
+def search(host: MockHost, client: RestClient, args) -> Recorder:
+    twin_ids = [f"did:iotics:searched{n}" for n in range(args.twins)]
+    provision(host, twin_ids)
+    recorder = Recorder("search")
+
+    def send(n: int, scheduled_at: float):
+        twins = search_twins(
+            method=SEARCH_TWINS.method,
+            endpoint=SEARCH_TWINS.url.format(host=host.url),
+            headers={},
+            payload={
+                "responseType": "FULL",
+                "filter": {
+                    "properties": [
+                        {"key": PROPERTY_KEY_TYPE, "uriValue": {"value": SENSOR_TYPE}}
+                    ]
+                },
+            },
+            scope="GLOBAL",
+        )
+        if twins:
+            recorder.record(scheduled_at)
+
+    # Searches are much heavier than shares
+    send_open_loop(max(1, args.rate / 100), args.duration, args.threads, send, recorder)
+
+    return recorder
+
+
+SCENARIOS = {
+    "publisher": publisher,
+    "follower": follower,
+    "sender_receiver": sender_receiver,
+    "synthesiser": synthesiser,
+    "search": search,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--twins", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=500, help="messages per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{args.twins} twins, {args.rate:.0f} messages/s for {args.duration:.0f}s "
+        f"over {args.threads} threads"
+    )
+    print(
+        f"{'scenario':14} {'sent':>8} {'received':>9} {'msgs/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9}"
+    )
+
+    lost: bool = False
+    with MockHost(search_hosts=3) as host:
+        client = RestClient(pool_maxsize=args.threads)
+        for name in args.scenarios:
+            recorder: Recorder = SCENARIOS[name](host, client, args)
+            print(recorder.report())
+            lost = lost or recorder.received < recorder.sent
+        client.close()
+
+    sys.exit(1 if lost else 0)
+
+
+if __name__ == "__main__":
+    main()
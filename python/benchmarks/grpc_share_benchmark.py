@@ -0,0 +1,116 @@
+"""Compare shares/s of blocking ShareFeedData calls, one per thread,
+against the GrpcSharePipeline, against a local gRPC FeedAPI server that
+answers after '--latency' milliseconds to simulate the round trip to a
+remote IOTICSpace.
+
+Both runs share the same values, each to a feed of its own: the pipeline
+never coalesces them, so both rates count the same completed shares.
+
+Run from the 'python' folder: python -m benchmarks.grpc_share_benchmark
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from typing import Tuple
+
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+from helpers.grpc_share_pipeline import GrpcSharePipeline, share_feed_data_request
+from iotics.api import feed_pb2, feed_pb2_grpc
+
+
+class SlowFeedApi(feed_pb2_grpc.FeedAPIServicer):
+    def __init__(self, latency: float):
+        self._latency: float = latency
+        self.shares: int = 0
+
+    async def ShareFeedData(self, request, context):
+        await asyncio.sleep(self._latency)
+        self.shares += 1
+        return feed_pb2.ShareFeedDataResponse()
+
+
+def start_server(servicer: SlowFeedApi) -> int:
+    """Run the server on its own event loop thread and return its port"""
+
+    started = threading.Event()
+    port: list = []
+
+    async def serve():
+        server = grpc.aio.server()
+        feed_pb2_grpc.add_FeedAPIServicer_to_server(servicer, server)
+        port.append(server.add_insecure_port("127.0.0.1:0"))
+        await server.start()
+        started.set()
+        await server.wait_for_termination()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    started.wait()
+
+    return port[0]
+
+
+def feed_of(n: int, twins: int) -> Tuple[str, str]:
+    # A feed per value: a value waiting for a slot is never replaced
+    return f"did:iotics:twin{n % twins}", f"feed{n // twins}"
+
+
+def blocking(channel: grpc.Channel, shares: int, twins: int, threads: int) -> float:
+    # Built up front, like the pipeline does before issuing each call
+    requests = [
+        share_feed_data_request(*feed_of(n, twins), {"n": n}, Timestamp())
+        for n in range(shares)
+    ]
+    stub = feed_pb2_grpc.FeedAPIStub(channel)
+
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in executor.map(stub.ShareFeedData, requests):
+            pass
+
+    return shares / (time.perf_counter() - start)
+
+
+def pipelined(channel: grpc.Channel, shares: int, twins: int, window: int):
+    pipeline = GrpcSharePipeline(channel, window=window)
+
+    start: float = time.perf_counter()
+    for n in range(shares):
+        pipeline.share(*feed_of(n, twins), {"n": n})
+    pipeline.flush()
+    stats = pipeline.stats()
+
+    return stats.completed / (time.perf_counter() - start), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shares", type=int, default=20000)
+    parser.add_argument("--twins", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--window", type=int, default=512)
+    args = parser.parse_args()
+
+    servicer = SlowFeedApi(args.latency / 1000)
+    channel = grpc.insecure_channel(f"127.0.0.1:{start_server(servicer)}")
+
+    print(f"{args.shares} shares to {args.twins} twins, {args.latency:.0f}ms latency")
+    rate: float = blocking(channel, args.shares, args.twins, args.threads)
+    print(f"blocking, {args.threads} threads: {rate:10.0f} shares/s")
+
+    rate, stats = pipelined(channel, args.shares, args.twins, args.window)
+    print(
+        f"pipelined, window {args.window}: {rate:10.0f} shares/s "
+        f"({stats.completed} completed, {stats.failed} failed, "
+        f"p50 {stats.latency_p50 * 1000:.1f}ms, p99 {stats.latency_p99 * 1000:.1f}ms)"
+    )
+
+    channel.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare the start-up time of a connector that creates a user, an agent
+and N twins with an empty IdentityCache (cold start) and with the cache
+filled by the previous run (warm start).
+
+Run from the 'python' folder: python -m benchmarks.identity_cache_benchmark
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.mock_host import MockHost
+from helpers.identity_cache import CachedIdentityApi, IdentityCache
+from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
+
+
+def start_connector(
+    resolver_url: str, cache_path: str, seed: bytes, twins: int
+) -> float:
+    start: float = time.perf_counter()
+
+    identity_api = CachedIdentityApi(
+        get_rest_high_level_identity_api(resolver_url=resolver_url),
+        IdentityCache(path=cache_path, resolver_url=resolver_url),
+    )
+    _, agent_identity = identity_api.create_user_and_agent_with_auth_delegation(
+        user_seed=seed,
+        user_key_name="BenchmarkUser",
+        agent_seed=seed,
+        agent_key_name="BenchmarkAgent",
+    )
+    for n in range(twins):
+        identity_api.create_twin_with_control_delegation(
+            twin_seed=seed,
+            twin_key_name=f"BenchmarkTwin{n}",
+            agent_registered_identity=agent_identity,
+        )
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--twins", type=int, default=100)
+    args = parser.parse_args()
+
+    with MockHost() as mock_host, tempfile.TemporaryDirectory() as cache_dir:
+        cache_path: str = os.path.join(cache_dir, "identities.jsonl")
+        seed: bytes = get_rest_high_level_identity_api(mock_host.url).create_seed()
+
+        # The second start finds the identities registered by the first one in the cache
+        cold: float = start_connector(mock_host.url, cache_path, seed, args.twins)
+        warm: float = start_connector(mock_host.url, cache_path, seed, args.twins)
+
+    print(f"User, agent and {args.twins} twins against {mock_host.url}")
+    print(f"cold start: {cold:8.2f} s")
+    print(f"warm start: {warm:8.2f} s ({cold / warm:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import base64
+from datetime import datetime, timezone
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+from benchmarks.mock_stomp import STOMP_PATH, StompBroker, upgrade
+from helpers.constants import INDEX_JSON_PATH
+
+
+class MockHostHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep the connection alive between calls
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid the delayed-ACK stall
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length: int = int(self.headers.get("Content-Length", 0))
+
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(
+        self, body: Optional[dict], status: int = 200, headers: Optional[dict] = None
+    ):
+        data: bytes = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json_lines(self, lines: List[dict], status: int = 200):
+        # Chunked, one chunk per line, like the streamed search responses
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data: bytes = json.dumps(line).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _dispatch(self):
+        path: str = self.path.split("?", 1)[0]
+
+        if path == STOMP_PATH and self.command == "GET":
+            websocket = upgrade(self)
+            if websocket:
+                self.server.broker.serve(websocket)
+                self.close_connection = True
+                return
+
+        request_body: bytes = self._read_body()
+
+        for method, pattern, route in self.server.routes:
+            if method != self.command:
+                continue
+            match = pattern.fullmatch(path)
+            if match:
+                # Routes return (status, body) or (status, body, headers),
+                # a list body is streamed as JSON lines
+                status, body, *headers = route(self, match, request_body)
+                if isinstance(body, list):
+                    self._send_json_lines(body, status)
+                else:
+                    self._send_json(body, status, *headers)
+                return
+
+        self._send_json({"error": f"{self.command} {path} not found"}, 404)
+
+    do_GET = _dispatch
+    do_PUT = _dispatch
+    do_POST = _dispatch
+    do_DELETE = _dispatch
+
+
+def _now() -> str:
+    return datetime.now(tz=timezone.utc).isoformat()
+
+
+def _index_json(handler: MockHostHandler, match, body: bytes) -> tuple:
+    host: str = handler.server.url
+    etag: str = f'"{host}"'
+
+    if handler.headers.get("If-None-Match") == etag:
+        return 304, None, {"ETag": etag}
+
+    stomp: str = host.replace("http", "ws", 1) + STOMP_PATH
+
+    return 200, {"resolver": host, "grpc": host, "stomp": stomp}, {"ETag": etag}
+
+
+def _upsert_twin(handler: MockHostHandler, match, body: bytes) -> Tuple[int, dict]:
+    twin: dict = json.loads(body or b"{}")
+    twin_id: str = twin.get("twinId", {}).get("id", "")
+    with handler.server.lock:
+        handler.server.twins[twin_id] = twin
+
+    return 200, {"twinId": {"id": twin_id}}
+
+
+def _share_feed_data(handler: MockHostHandler, match, body: bytes) -> Tuple[int, dict]:
+    sample: dict = json.loads(body or b"{}").get("sample", {})
+    handler.server.broker.publish_feed_data(
+        twin_id=match.group("twin_id"),
+        feed_id=match.group("feed_id"),
+        body=json.dumps(
+            {
+                "interest": {
+                    "followedFeedId": {
+                        "hostId": handler.server.host_id,
+                        "twinId": match.group("twin_id"),
+                        "id": match.group("feed_id"),
+                    }
+                },
+                "feedData": {
+                    "data": sample.get("data"),
+                    "mime": sample.get("mime"),
+                    "occurredAt": sample.get("timestamp") or _now(),
+                },
+            }
+        ).encode(),
+    )
+
+    return 200, {}
+
+
+def _send_input_message(
+    handler: MockHostHandler, match, body: bytes
+) -> Tuple[int, dict]:
+    message: dict = json.loads(body or b"{}").get("message", {})
+    handler.server.broker.publish_input_message(
+        twin_id=match.group("twin_id"),
+        input_id=match.group("input_id"),
+        body=json.dumps(
+            {
+                "input": {
+                    "id": {
+                        "hostId": handler.server.host_id,
+                        "twinId": match.group("twin_id"),
+                        "id": match.group("input_id"),
+                    }
+                },
+                "message": {
+                    "data": message.get("data"),
+                    "mime": message.get("mime"),
+                    "occurredAt": message.get("timestamp") or _now(),
+                },
+            }
+        ).encode(),
+    )
+
+    return 200, {}
+
+
+def _describe_input(handler: MockHostHandler, match, body: bytes) -> Tuple[int, dict]:
+    with handler.server.lock:
+        twin: Optional[dict] = handler.server.twins.get(match.group("twin_id"))
+    for twin_input in (twin or {}).get("inputs", []):
+        if twin_input.get("id") == match.group("input_id"):
+            return 200, {"result": twin_input}
+
+    return 404, {"error": "not found"}
+
+
+def _delete_twin(handler: MockHostHandler, match, body: bytes) -> Tuple[int, dict]:
+    with handler.server.lock:
+        twin: Optional[dict] = handler.server.twins.pop(match.group("twin_id"), None)
+    if twin is None:
+        return 404, {"error": "not found"}
+
+    return 200, {"twinId": {"id": match.group("twin_id")}}
+
+
+def _property_matches(twin: dict, wanted: dict) -> bool:
+    # A filter property matches a twin property with the same key and value
+    return any(
+        all(twin_property.get(name) == value for name, value in wanted.items())
+        for twin_property in twin.get("properties", [])
+    )
+
+
+def _search_result(twin: dict, host_id: str, response_type: str) -> dict:
+    result: dict = {"twinId": {"id": twin["twinId"]["id"], "hostId": host_id}}
+    if response_type == "MINIMAL":
+        return result
+
+    result["properties"] = twin.get("properties", [])
+    result["feeds"] = [
+        {"feedId": {"id": feed.get("id")}} for feed in twin.get("feeds", [])
+    ]
+    result["inputs"] = [
+        {"inputId": {"id": twin_input.get("id")}}
+        for twin_input in twin.get("inputs", [])
+    ]
+    if twin.get("location"):
+        result["location"] = twin["location"]
+
+    return result
+
+
+def _search_twins(handler: MockHostHandler, match, body: bytes) -> Tuple[int, list]:
+    search: dict = json.loads(body or b"{}")
+    wanted: List[dict] = search.get("filter", {}).get("properties", [])
+    response_type: str = search.get("responseType", "FULL")
+    host_id: str = handler.server.host_id
+
+    with handler.server.lock:
+        twins: List[dict] = list(handler.server.twins.values())
+    found: List[dict] = [
+        _search_result(twin, host_id, response_type)
+        for twin in twins
+        if all(_property_matches(twin, wanted_property) for wanted_property in wanted)
+    ]
+
+    # One line per Host: this one, then the (empty) other Hosts of a GLOBAL search
+    lines: List[dict] = [{"result": {"payload": {"hostId": host_id, "twins": found}}}]
+    if "scope=GLOBAL" in handler.path:
+        lines.extend(
+            {"result": {"payload": {"hostId": f"did:iotics:remote{n}", "twins": []}}}
+            for n in range(1, handler.server.search_hosts)
+        )
+
+    return 200, lines
+
+
+def _resolver_register(
+    handler: MockHostHandler, match, body: bytes
+) -> Tuple[int, dict]:
+    # The token is a JWT: the register document is in its (unverified) payload
+    token: str = body.decode()
+    claims: str = token.split(".")[1]
+    doc_id: str = json.loads(
+        base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4))
+    )["doc"]["id"]
+    handler.server.resolver_tokens[doc_id] = token
+
+    return 200, {}
+
+
+def _resolver_discover(
+    handler: MockHostHandler, match, body: bytes
+) -> Tuple[int, dict]:
+    token = handler.server.resolver_tokens.get(match.group("doc_id"))
+    if token is None:
+        return 404, {"error": "not found"}
+
+    return 200, {"token": token}
+
+
+class MockHost:
+    """Minimal local stand-in for an IOTICSpace: the REST API, a STOMP
+    broker fanning out shares and input messages to the followers and
+    receivers, and the resolver. Good enough to measure the connectors
+    without a live space.
+
+    Twins are kept in memory. A GLOBAL search gets one response line from
+    this host and an empty one from each of 'search_hosts' - 1 other hosts."""
+
+    ROUTES: List[Tuple[str, str, Callable]] = [
+        ("GET", INDEX_JSON_PATH, _index_json),
+        ("PUT", "/qapi/twins", _upsert_twin),
+        (
+            "POST",
+            "/qapi/twins/(?P<twin_id>[^/]+)/feeds/(?P<feed_id>[^/]+)/shares",
+            _share_feed_data,
+        ),
+        (
+            "POST",
+            "/qapi/twins/[^/]+/interests/hosts/[^/]+/twins/(?P<twin_id>[^/]+)"
+            "/inputs/(?P<input_id>[^/]+)/messages",
+            _send_input_message,
+        ),
+        (
+            "GET",
+            "/qapi/twins/(?P<twin_id>[^/]+)/inputs/(?P<input_id>[^/]+)",
+            _describe_input,
+        ),
+        ("POST", "/qapi/searches", _search_twins),
+        ("DELETE", "/qapi/twins/(?P<twin_id>[^/]+)", _delete_twin),
+        ("POST", "/1.0/register", _resolver_register),
+        ("GET", "/1.0/discover/(?P<doc_id>[^/]+)", _resolver_discover),
+    ]
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, search_hosts: int = 1):
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer(
+            (host, port), MockHostHandler
+        )
+        self._server.daemon_threads = True
+        self._server.routes = [
+            (method, re.compile(pattern), route)
+            for method, pattern, route in self.ROUTES
+        ]
+        self._server.url = self.url
+        self._server.resolver_tokens = {}
+        self._server.host_id = "did:iotics:mockhost"
+        self._server.search_hosts = search_hosts
+        self._server.lock = threading.Lock()
+        self._server.twins = {}
+        self._server.broker = StompBroker()
+        self._thread: threading.Thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+
+        return f"http://{host}:{port}"
+
+    @property
+    def stomp_url(self) -> str:
+        return self.url.replace("http", "ws", 1) + STOMP_PATH
+
+    @property
+    def host_id(self) -> str:
+        return self._server.host_id
+
+    @property
+    def broker(self) -> StompBroker:
+        return self._server.broker
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,318 @@
+"""Minimal STOMP 1.2 over websocket broker for the mock host, stdlib only.
+
+It understands what the connectors send (CONNECT, SUBSCRIBE, UNSUBSCRIBE,
+DISCONNECT) and fans out the feed shares and input messages posted to the
+mock host's REST API as MESSAGE frames to the matching subscriptions.
+"""
+
+import base64
+import hashlib
+import itertools
+import re
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from helpers.constants import SUBSCRIBE_TO_FEED, SUBSCRIBE_TO_INPUT
+
+STOMP_PATH = "/ws"
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_OPCODE_CONTINUATION = 0x0
+_OPCODE_TEXT = 0x1
+_OPCODE_BINARY = 0x2
+_OPCODE_CLOSE = 0x8
+_OPCODE_PING = 0x9
+_OPCODE_PONG = 0xA
+
+
+def _topic_pattern(url: str) -> re.Pattern:
+    return re.compile(re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", url))
+
+
+_HEADERS_END = re.compile(rb"\r?\n\r?\n")
+_FEED_TOPIC = _topic_pattern(SUBSCRIBE_TO_FEED.url)
+_INPUT_TOPIC = _topic_pattern(SUBSCRIBE_TO_INPUT.url)
+
+
+def websocket_accept(key: str) -> str:
+    digest: bytes = hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()
+
+    return base64.b64encode(digest).decode()
+
+
+class WebSocket:
+    """Server side of a websocket connection on an upgraded HTTP socket"""
+
+    def __init__(self, rfile, wfile):
+        self._rfile = rfile
+        self._wfile = wfile
+        self._write_lock: threading.Lock = threading.Lock()
+        self.closed: bool = False
+
+    def _read_exactly(self, size: int) -> bytes:
+        data: bytes = self._rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("websocket closed")
+
+        return data
+
+    def _read_frame(self) -> Tuple[bool, int, bytes]:
+        first, second = self._read_exactly(2)
+        length: int = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", self._read_exactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", self._read_exactly(8))
+        mask: bytes = self._read_exactly(4) if second & 0x80 else b""
+        payload: bytes = self._read_exactly(length)
+
+        if mask:
+            # XOR with the 4-byte key repeated over the payload, as one big int
+            key: int = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+            payload = (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+
+        return bool(first & 0x80), first & 0x0F, payload
+
+    def receive(self) -> Optional[bytes]:
+        """Next text or binary message, None once the connection is closed"""
+
+        message: bytes = b""
+        while True:
+            try:
+                fin, opcode, payload = self._read_frame()
+            except (ConnectionError, OSError, ValueError):
+                self.closed = True
+                return None
+
+            if opcode == _OPCODE_CLOSE:
+                self.send(payload[:2], opcode=_OPCODE_CLOSE)
+                self.closed = True
+                return None
+            if opcode == _OPCODE_PING:
+                self.send(payload, opcode=_OPCODE_PONG)
+                continue
+            if opcode == _OPCODE_PONG:
+                continue
+            if opcode in (_OPCODE_TEXT, _OPCODE_BINARY, _OPCODE_CONTINUATION):
+                message += payload
+                if fin:
+                    return message
+
+    def send(self, payload: bytes, opcode: int = _OPCODE_TEXT):
+        length: int = len(payload)
+        if length < 126:
+            header: bytes = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+        with self._write_lock:
+            if self.closed and opcode != _OPCODE_CLOSE:
+                return
+            try:
+                self._wfile.write(header + payload)
+                self._wfile.flush()
+            except OSError:
+                self.closed = True
+
+
+def parse_frames(data: bytes) -> Tuple[List[Tuple[str, dict, bytes]], bytes]:
+    """Complete STOMP frames of 'data', skipping heart-beats, and the bytes
+    of a frame not complete yet. A frame can be split across websocket
+    messages, so pass those bytes back in with the next message."""
+
+    frames: List[Tuple[str, dict, bytes]] = []
+    while data:
+        data = data.lstrip(b"\r\n")
+        if not data:
+            break
+
+        headers_end = _HEADERS_END.search(data)
+        if not headers_end:
+            break
+
+        head, rest = data[: headers_end.start()], data[headers_end.end() :]
+        lines: List[str] = head.decode().replace("\r", "").split("\n")
+        headers: dict = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            # STOMP 1.2: the first occurrence of a repeated header wins
+            headers.setdefault(name, value)
+
+        if "content-length" in headers:
+            length: int = int(headers["content-length"])
+            if len(rest) <= length:
+                # The body or its NUL terminator is still to come
+                break
+            body, remainder = rest[:length], rest[length + 1 :]
+        else:
+            body, terminator, remainder = rest.partition(b"\x00")
+            if not terminator:
+                break
+        frames.append((lines[0], headers, body))
+        data = remainder
+
+    return frames, data
+
+
+def build_frame(command: str, headers: dict, body: bytes = b"") -> bytes:
+    head: str = "".join(f"{name}:{value}\n" for name, value in headers.items())
+
+    return f"{command}\n{head}content-length:{len(body)}\n\n".encode() + body + b"\x00"
+
+
+class StompBroker:
+    """Subscriptions of all the websocket connections of the mock host,
+    indexed by the followed twin and feed (or receiver twin and input) so
+    that a share is fanned out without scanning all the subscriptions."""
+
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        # (twin_id, feed_id or input_id) -> {(websocket, subscription_id): destination}
+        self._feeds: Dict[tuple, Dict[tuple, str]] = {}
+        self._inputs: Dict[tuple, Dict[tuple, str]] = {}
+        self._message_ids = itertools.count()
+        self.frames_sent: int = 0
+
+    def _index(self, destination: str) -> Tuple[Optional[dict], Optional[tuple]]:
+        match = _FEED_TOPIC.fullmatch(destination)
+        if match:
+            return self._feeds, (
+                match.group("twin_publisher_id"),
+                match.group("feed_id"),
+            )
+
+        match = _INPUT_TOPIC.fullmatch(destination)
+        if match:
+            return self._inputs, (
+                match.group("twin_receiver_id"),
+                match.group("input_id"),
+            )
+
+        return None, None
+
+    def serve(self, websocket: WebSocket):
+        """Handle the STOMP frames of a connection until it is closed"""
+
+        subscriptions: Dict[str, str] = {}
+        # Start of a frame split across websocket messages
+        pending: bytes = b""
+        try:
+            while True:
+                message: Optional[bytes] = websocket.receive()
+                if message is None:
+                    return
+
+                frames, pending = parse_frames(pending + message)
+                for command, headers, _ in frames:
+                    if command in ("CONNECT", "STOMP"):
+                        # No heart-beats: the connection is local
+                        websocket.send(
+                            build_frame(
+                                "CONNECTED",
+                                {"version": "1.2", "heart-beat": "0,0"},
+                            )
+                        )
+                    elif command == "SUBSCRIBE":
+                        subscriptions[headers["id"]] = headers["destination"]
+                        self._subscribe(
+                            websocket, headers["id"], headers["destination"]
+                        )
+                    elif command == "UNSUBSCRIBE":
+                        destination: Optional[str] = subscriptions.pop(
+                            headers["id"], None
+                        )
+                        if destination:
+                            self._unsubscribe(websocket, headers["id"], destination)
+                    elif command == "DISCONNECT":
+                        if "receipt" in headers:
+                            websocket.send(
+                                build_frame(
+                                    "RECEIPT", {"receipt-id": headers["receipt"]}
+                                )
+                            )
+                        return
+        finally:
+            websocket.closed = True
+            for subscription_id, destination in subscriptions.items():
+                self._unsubscribe(websocket, subscription_id, destination)
+
+    def _subscribe(self, websocket: WebSocket, subscription_id: str, destination: str):
+        index, key = self._index(destination)
+        if index is None:
+            websocket.send(
+                build_frame("ERROR", {"message": f"unknown destination {destination}"})
+            )
+            return
+
+        with self._lock:
+            index.setdefault(key, {})[(websocket, subscription_id)] = destination
+
+    def _unsubscribe(
+        self, websocket: WebSocket, subscription_id: str, destination: str
+    ):
+        index, key = self._index(destination)
+        if index is None:
+            return
+
+        with self._lock:
+            subscribers: dict = index.get(key, {})
+            subscribers.pop((websocket, subscription_id), None)
+            if not subscribers:
+                index.pop(key, None)
+
+    def _publish(self, index: dict, key: tuple, body: bytes):
+        with self._lock:
+            subscribers: list = list(index.get(key, {}).items())
+            self.frames_sent += len(subscribers)
+
+        for (websocket, subscription_id), destination in subscribers:
+            websocket.send(
+                build_frame(
+                    "MESSAGE",
+                    {
+                        "destination": destination,
+                        "subscription": subscription_id,
+                        "message-id": str(next(self._message_ids)),
+                        "content-type": "application/json",
+                    },
+                    body,
+                )
+            )
+
+    def publish_feed_data(self, twin_id: str, feed_id: str, body: bytes):
+        self._publish(self._feeds, (twin_id, feed_id), body)
+
+    def publish_input_message(self, twin_id: str, input_id: str, body: bytes):
+        self._publish(self._inputs, (twin_id, input_id), body)
+
+
+def upgrade(handler) -> Optional[WebSocket]:
+    """Complete the websocket handshake of an HTTP request handler"""
+
+    key: Optional[str] = handler.headers.get("Sec-WebSocket-Key")
+    if handler.headers.get("Upgrade", "").lower() != "websocket" or not key:
+        return None
+
+    handler.send_response(101, "Switching Protocols")
+    handler.send_header("Upgrade", "websocket")
+    handler.send_header("Connection", "Upgrade")
+    handler.send_header("Sec-WebSocket-Accept", websocket_accept(key))
+    protocols: List[str] = [
+        protocol.strip()
+        for protocol in handler.headers.get("Sec-WebSocket-Protocol", "").split(",")
+        if protocol.strip()
+    ]
+    if protocols:
+        handler.send_header(
+            "Sec-WebSocket-Protocol",
+            "v12.stomp" if "v12.stomp" in protocols else protocols[0],
+        )
+    handler.end_headers()
+    handler.wfile.flush()
+    handler.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return WebSocket(handler.rfile, handler.wfile)
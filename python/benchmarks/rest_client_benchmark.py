@@ -0,0 +1,59 @@
+"""Compare calls/s to SHARE_FEED_DATA with a new connection per call
+(plain requests.request) against the pooled RestClient.
+
+Run from the 'python' folder: python -m benchmarks.rest_client_benchmark
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from benchmarks.mock_host import MockHost
+from helpers.constants import SHARE_FEED_DATA
+from helpers.rest_client import RestClient
+from helpers.utilities import encode_data
+
+
+def run(call, calls: int, threads: int) -> float:
+    start: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in executor.map(lambda _: call(), range(calls)):
+            pass
+
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with MockHost() as mock_host:
+        url: str = SHARE_FEED_DATA.url.format(
+            host=mock_host.url, twin_id="did:iotics:twin", feed_id="temperature"
+        )
+        payload: dict = {
+            "sample": {"data": encode_data({"reading": 21}), "mime": "application/json"}
+        }
+
+        def unpooled_call():
+            requests.request(method=SHARE_FEED_DATA.method, url=url, json=payload)
+
+        client = RestClient(pool_maxsize=args.threads)
+
+        def pooled_call():
+            client.request(method=SHARE_FEED_DATA.method, url=url, payload=payload)
+
+        unpooled: float = run(unpooled_call, args.calls, args.threads)
+        pooled: float = run(pooled_call, args.calls, args.threads)
+        client.close()
+
+    print(f"{args.calls} calls over {args.threads} threads against {mock_host.url}")
+    print(f"requests.request: {unpooled:10.1f} calls/s")
+    print(f"RestClient:       {pooled:10.1f} calls/s ({pooled / unpooled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
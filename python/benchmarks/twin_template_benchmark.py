@@ -0,0 +1,253 @@
+"""Compare the construction and serialisation of the UPSERT_TWIN payloads
+of many temperature sensor twins, built from scratch for each twin against
+a TwinTemplate, for the REST JSON body and the gRPC UpsertTwinRequest.
+
+Run from the 'python' folder: python -m benchmarks.twin_template_benchmark
+"""
+
+import argparse
+import json
+import time
+
+from helpers.constants import (
+    PROPERTY_KEY_COMMENT,
+    PROPERTY_KEY_HOST_ALLOW_LIST,
+    PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+    PROPERTY_KEY_LABEL,
+    PROPERTY_KEY_TYPE,
+    PROPERTY_VALUE_ALLOW_ALL,
+    SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+    SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
+    UNIT_DEGREE_CELSIUS,
+)
+from helpers.twin_template import TwinTemplate
+from iotics.api import common_pb2, twin_pb2
+from iotics.lib.grpc.helpers import (
+    create_feed_with_meta,
+    create_headers,
+    create_location,
+    create_property,
+    create_value,
+)
+
+FEED_ID = "temperature"
+COMMENT = "A temperature sensor that shares temperature data"
+LOCATION = {"lat": 51.5, "lon": -0.1}
+
+TEMPLATE = TwinTemplate(
+    properties=[
+        {
+            "key": PROPERTY_KEY_COMMENT,
+            "langLiteralValue": {"value": COMMENT, "lang": "en"},
+        },
+        {
+            "key": PROPERTY_KEY_HOST_ALLOW_LIST,
+            "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+        },
+        {
+            "key": PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+            "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+        },
+        {
+            "key": PROPERTY_KEY_TYPE,
+            "uriValue": {"value": SAREF_TEMPERATURE_SENSOR_ONTOLOGY},
+        },
+    ],
+    feeds=[
+        {
+            "id": FEED_ID,
+            "storeLast": True,
+            "properties": [
+                {
+                    "key": PROPERTY_KEY_LABEL,
+                    "langLiteralValue": {"value": "Temperature", "lang": "en"},
+                }
+            ],
+            "values": [
+                {
+                    "comment": "Temperature in degrees Celsius",
+                    "dataType": "decimal",
+                    "label": "reading",
+                    "unit": UNIT_DEGREE_CELSIUS,
+                }
+            ],
+        }
+    ],
+)
+
+
+def model_property(n: int) -> dict:
+    return {
+        "key": SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+        "stringLiteralValue": {"value": f"T{n % 10}000"},
+    }
+
+
+def naive_rest(n: int) -> bytes:
+    payload: dict = {
+        "twinId": {"id": f"did:iotics:sensor{n}"},
+        "properties": [
+            {
+                "key": PROPERTY_KEY_COMMENT,
+                "langLiteralValue": {"value": COMMENT, "lang": "en"},
+            },
+            {
+                "key": PROPERTY_KEY_HOST_ALLOW_LIST,
+                "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+            },
+            {
+                "key": PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+                "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+            },
+            {
+                "key": PROPERTY_KEY_TYPE,
+                "uriValue": {"value": SAREF_TEMPERATURE_SENSOR_ONTOLOGY},
+            },
+            {
+                "key": PROPERTY_KEY_LABEL,
+                "langLiteralValue": {"value": f"Temperature Sensor {n}", "lang": "en"},
+            },
+            model_property(n),
+        ],
+        "feeds": [
+            {
+                "id": FEED_ID,
+                "storeLast": True,
+                "properties": [
+                    {
+                        "key": PROPERTY_KEY_LABEL,
+                        "langLiteralValue": {"value": "Temperature", "lang": "en"},
+                    }
+                ],
+                "values": [
+                    {
+                        "comment": "Temperature in degrees Celsius",
+                        "dataType": "decimal",
+                        "label": "reading",
+                        "unit": UNIT_DEGREE_CELSIUS,
+                    }
+                ],
+            }
+        ],
+        "inputs": [],
+        "location": dict(LOCATION),
+    }
+
+    # What requests does with 'json=payload'
+    return json.dumps(payload).encode()
+
+
+def template_rest_payload(n: int) -> bytes:
+    return json.dumps(
+        TEMPLATE.rest_payload(
+            f"did:iotics:sensor{n}",
+            label=f"Temperature Sensor {n}",
+            properties=[model_property(n)],
+            location=LOCATION,
+        )
+    ).encode()
+
+
+def template_rest_body(n: int) -> bytes:
+    return TEMPLATE.rest_body(
+        f"did:iotics:sensor{n}",
+        label=f"Temperature Sensor {n}",
+        properties=[model_property(n)],
+        location=LOCATION,
+    )
+
+
+def naive_grpc(n: int) -> bytes:
+    request = twin_pb2.UpsertTwinRequest(
+        headers=create_headers(),
+        payload=twin_pb2.UpsertTwinRequest.Payload(
+            twinId=common_pb2.TwinID(id=f"did:iotics:sensor{n}"),
+            location=create_location(lat=LOCATION["lat"], lon=LOCATION["lon"]),
+            properties=[
+                create_property(
+                    PROPERTY_KEY_LABEL, f"Temperature Sensor {n}", language="en"
+                ),
+                create_property(PROPERTY_KEY_COMMENT, COMMENT, language="en"),
+                create_property(
+                    PROPERTY_KEY_HOST_ALLOW_LIST, PROPERTY_VALUE_ALLOW_ALL, is_uri=True
+                ),
+                create_property(
+                    PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+                    PROPERTY_VALUE_ALLOW_ALL,
+                    is_uri=True,
+                ),
+                create_property(
+                    PROPERTY_KEY_TYPE, SAREF_TEMPERATURE_SENSOR_ONTOLOGY, is_uri=True
+                ),
+                create_property(
+                    SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY, f"T{n % 10}000"
+                ),
+            ],
+            feeds=[
+                create_feed_with_meta(
+                    feed_id=FEED_ID,
+                    properties=[
+                        create_property(
+                            PROPERTY_KEY_LABEL, "Temperature", language="en"
+                        )
+                    ],
+                    values=[
+                        create_value(
+                            label="reading",
+                            comment="Temperature in degrees Celsius",
+                            unit=UNIT_DEGREE_CELSIUS,
+                            data_type="decimal",
+                        )
+                    ],
+                )
+            ],
+        ),
+    )
+
+    # What the stub does before sending the request
+    return request.SerializeToString()
+
+
+def template_grpc(n: int) -> bytes:
+    return TEMPLATE.grpc_request(
+        f"did:iotics:sensor{n}",
+        label=f"Temperature Sensor {n}",
+        properties=[
+            create_property(
+                SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY, f"T{n % 10}000"
+            )
+        ],
+        location=create_location(lat=LOCATION["lat"], lon=LOCATION["lon"]),
+    ).SerializeToString()
+
+
+def run(build, twins: int) -> float:
+    start: float = time.perf_counter()
+    for n in range(twins):
+        build(n)
+
+    return twins / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--twins", type=int, default=50000)
+    args = parser.parse_args()
+
+    # Same twins whichever way they are built
+    assert json.loads(naive_rest(7)) == json.loads(template_rest_body(7))
+    assert json.loads(template_rest_payload(7)) == json.loads(template_rest_body(7))
+
+    print(f"{args.twins} twin payloads built and serialised")
+    for name, build in (
+        ("REST, from scratch", naive_rest),
+        ("REST, template payload", template_rest_payload),
+        ("REST, template body", template_rest_body),
+        ("gRPC, from scratch", naive_grpc),
+        ("gRPC, template", template_grpc),
+    ):
+        print(f"{name:24} {run(build, args.twins):10.0f} twins/s")
+
+
+if __name__ == "__main__":
+    main()
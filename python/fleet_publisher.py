@@ -0,0 +1,120 @@
+"""Publisher worker for 'helpers/connector_runner.py': each worker process
+creates the twins of its shard, each with a temperature feed, and shares a
+reading per twin every 'period' seconds until the supervisor stops it.
+
+Run from the 'python' folder, against the local mock host:
+    python -m helpers.connector_runner fleet.example.json --workers 2 --mock
+
+or against an IOTICSpace by setting 'host_url' in 'fleet.example.json'.
+The user and agent seeds are those of 'helpers/constants.py'.
+
+Fleet 'config' keys:
+- host_url: URL of the IOTICSpace;
+- period: seconds between two readings of a twin, default 5;
+- agent_key_name: key name of the agent identity, default "FleetPublisher";
+- mock: set by '--mock', no identities are created.
+Each twin of 'twins' has a 'key_name' and an optional 'label'.
+"""
+
+import logging
+from random import randint
+from typing import List, Tuple
+
+from helpers.bulk_identity import TwinIdentitySpec
+from helpers.bulk_provisioning import BulkProvisioner, ProvisioningReport
+from helpers.connector_runner import WorkerContext
+from helpers.constants import (
+    AGENT_SEED,
+    PROPERTY_KEY_TYPE,
+    SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
+    TOKEN_DURATION,
+    USER_KEY_NAME,
+    USER_SEED,
+)
+from helpers.identity_auth import Identity
+from helpers.rest_client import RestClient
+from helpers.share_engine import ShareEngine
+from helpers.twin_template import TwinTemplate
+from helpers.utilities import generate_headers, get_host_endpoints
+
+AGENT_KEY_NAME = "FleetPublisher"
+FEED_ID = "temperature"
+
+TEMPLATE = TwinTemplate(
+    properties=[
+        {
+            "key": PROPERTY_KEY_TYPE,
+            "uriValue": {"value": SAREF_TEMPERATURE_SENSOR_ONTOLOGY},
+        }
+    ],
+    feeds=[{"id": FEED_ID, "storeLast": True}],
+)
+
+
+def _twin_ids(context: WorkerContext, host_url: str) -> Tuple[dict, List[str]]:
+    """Headers of the worker's own token and the IDs of its twins"""
+
+    key_names: List[str] = [twin["key_name"] for twin in context.twins]
+    if context.config.get("mock"):
+        return {}, [f"did:iotics:{key_name}" for key_name in key_names]
+
+    endpoints: dict = get_host_endpoints(host_url=host_url)
+    identity = Identity(
+        resolver_url=endpoints.get("resolver"), grpc_endpoint=endpoints.get("grpc")
+    )
+    user_identity, agent_identity = identity.create_user_and_agent_with_auth_delegation(
+        user_seed=USER_SEED,
+        user_key_name=USER_KEY_NAME,
+        agent_seed=AGENT_SEED,
+        agent_key_name=context.config.get("agent_key_name", AGENT_KEY_NAME),
+    )
+    token_manager = identity.start_token_refresh(
+        agent_identity=agent_identity,
+        user_did=user_identity.did,
+        duration=TOKEN_DURATION,
+    )
+    headers: dict = generate_headers(token=token_manager)
+
+    # One process per shard already, don't fan out to more of them
+    identity_results = identity.create_twins_with_control_delegation(
+        specs=[
+            TwinIdentitySpec(twin_key_name=key_name, twin_seed=AGENT_SEED)
+            for key_name in key_names
+        ],
+        agent_identity=agent_identity,
+        processes=1,
+    )
+    failures = [result for result in identity_results if result.error]
+    if failures:
+        raise RuntimeError(
+            f"Can't create the identity of {len(failures)} twins, "
+            f"e.g. {failures[0].spec.twin_key_name}: {failures[0].error}"
+        )
+
+    return headers, [result.identity.did for result in identity_results]
+
+
+def publish(context: WorkerContext):
+    host_url: str = context.config["host_url"]
+    period: float = context.config.get("period", 5)
+
+    headers, twin_ids = _twin_ids(context, host_url)
+    client = RestClient()
+    report: ProvisioningReport = BulkProvisioner(
+        host_url=host_url, headers=headers, client=client
+    ).upsert(
+        TEMPLATE.rest_payload(twin_id, label=twin.get("label", twin["key_name"]))
+        for twin_id, twin in zip(twin_ids, context.twins)
+    )
+    if report.failed:
+        raise RuntimeError(f"Can't create {len(report.failed)} twins: {report}")
+    logging.info("Shard %s: publishing %s twins", context.shard, len(twin_ids))
+
+    with ShareEngine(host_url=host_url, headers=headers, client=client) as engine:
+        while not context.stop.is_set():
+            for twin_id in twin_ids:
+                engine.share(twin_id, FEED_ID, {"reading": randint(0, 30)})
+            context.stop.wait(timeout=period)
+
+    logging.info("Shard %s: %s", context.shard, engine.stats())
+    client.close()
@@ -0,0 +1,245 @@
+from collections import namedtuple
+import threading
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+WindowStats = namedtuple("WindowStats", ["count", "mean", "min", "max"])
+
+
+class AggregationEngine:
+    """Rolling aggregates of many numeric feeds, e.g. the readings of
+    thousands of temperature sensors.
+
+    Each feed keeps its last 'window_count' values in one row of a NumPy
+    ring buffer shared by all the feeds. If 'window_seconds' is set, values
+    older than that are also left out. Feeds can belong to a group (e.g. the
+    sensor model) to aggregate across twins.
+
+    'add' is O(1) and keeps a running sum, min and max per feed. The sum is
+    re-computed once per 'window_count' values so float errors don't build
+    up, and min/max only when the value leaving the window was the min or
+    the max. 'evaluate' and 'group_stats' compute the aggregates of all the
+    feeds at once with vectorised operations, so call them once per tick
+    rather than once per message."""
+
+    def __init__(
+        self,
+        window_count: int = 10,
+        window_seconds: Optional[float] = None,
+        initial_feeds: int = 1024,
+    ):
+        if window_count < 1:
+            raise ValueError(f"window_count must be at least 1, not {window_count}")
+        if initial_feeds < 1:
+            raise ValueError(f"initial_feeds must be at least 1, not {initial_feeds}")
+
+        self._window_count: int = window_count
+        self._window_seconds: Optional[float] = window_seconds
+        self._lock: threading.Lock = threading.Lock()
+
+        self._feeds: Dict[Hashable, int] = {}
+        self._groups: Dict[Hashable, int] = {}
+        self._group_keys: list = []
+
+        self._values: np.ndarray = np.zeros((initial_feeds, window_count))
+        # -inf marks an empty slot
+        self._timestamps: np.ndarray = np.full((initial_feeds, window_count), -np.inf)
+        self._positions: np.ndarray = np.zeros(initial_feeds, dtype=np.int64)
+        self._counts: np.ndarray = np.zeros(initial_feeds, dtype=np.int64)
+        self._sums: np.ndarray = np.zeros(initial_feeds)
+        self._mins: np.ndarray = np.full(initial_feeds, np.inf)
+        self._maxs: np.ndarray = np.full(initial_feeds, -np.inf)
+        # Feeds whose min or max left the window, re-computed by '_window'
+        self._stale: np.ndarray = np.zeros(initial_feeds, dtype=bool)
+        self._group_ids: np.ndarray = np.full(initial_feeds, -1, dtype=np.int64)
+
+    def _grow(self):
+        size: int = len(self._positions)
+
+        self._values = np.concatenate([self._values, np.zeros_like(self._values)])
+        self._timestamps = np.concatenate(
+            [self._timestamps, np.full_like(self._timestamps, -np.inf)]
+        )
+        self._positions = np.concatenate([self._positions, np.zeros(size, np.int64)])
+        self._counts = np.concatenate([self._counts, np.zeros(size, np.int64)])
+        self._sums = np.concatenate([self._sums, np.zeros(size)])
+        self._mins = np.concatenate([self._mins, np.full(size, np.inf)])
+        self._maxs = np.concatenate([self._maxs, np.full(size, -np.inf)])
+        self._stale = np.concatenate([self._stale, np.zeros(size, bool)])
+        self._group_ids = np.concatenate([self._group_ids, np.full(size, -1, np.int64)])
+
+    def add_feed(self, feed_key: Hashable, group: Optional[Hashable] = None) -> int:
+        """Register a feed, optionally in a group. Feeds are also registered,
+        with no group, by their first 'add'."""
+
+        with self._lock:
+            return self._add_feed(feed_key, group)
+
+    def _add_feed(self, feed_key: Hashable, group: Optional[Hashable] = None) -> int:
+        row: Optional[int] = self._feeds.get(feed_key)
+        if row is None:
+            row = len(self._feeds)
+            if row == len(self._positions):
+                self._grow()
+            self._feeds[feed_key] = row
+
+        if group is not None:
+            group_id: Optional[int] = self._groups.get(group)
+            if group_id is None:
+                group_id = len(self._group_keys)
+                self._groups[group] = group_id
+                self._group_keys.append(group)
+            self._group_ids[row] = group_id
+
+        return row
+
+    def add(self, feed_key: Hashable, value: float, timestamp: Optional[float] = None):
+        """Add a value of a feed; 'timestamp' defaults to now (time.time())."""
+
+        with self._lock:
+            row: Optional[int] = self._feeds.get(feed_key)
+            if row is None:
+                row = self._add_feed(feed_key)
+
+            position: int = self._positions[row]
+            if self._counts[row] == self._window_count:
+                # The slot holds the oldest value of the window
+                oldest: float = self._values[row, position]
+                self._sums[row] -= oldest
+                if oldest == self._mins[row] or oldest == self._maxs[row]:
+                    self._stale[row] = True
+            else:
+                self._counts[row] += 1
+            self._values[row, position] = value
+            self._timestamps[row, position] = (
+                time.time() if timestamp is None else timestamp
+            )
+            self._sums[row] += value
+            if value < self._mins[row]:
+                self._mins[row] = value
+            if value > self._maxs[row]:
+                self._maxs[row] = value
+            position = (position + 1) % self._window_count
+            self._positions[row] = position
+            if position == 0 and self._counts[row] == self._window_count:
+                # Re-base the running sum once per window
+                self._sums[row] = self._values[row].sum()
+
+    def _window(self, now: Optional[float]) -> Tuple[np.ndarray, ...]:
+        """Count, sum, min and max of the current window of every feed"""
+
+        size: int = len(self._feeds)
+        values: np.ndarray = self._values[:size]
+
+        if self._window_seconds is None:
+            stale: np.ndarray = np.flatnonzero(self._stale[:size])
+            if len(stale):
+                valid: np.ndarray = self._timestamps[stale] > -np.inf
+                self._mins[stale] = np.where(valid, values[stale], np.inf).min(axis=1)
+                self._maxs[stale] = np.where(valid, values[stale], -np.inf).max(axis=1)
+                self._stale[stale] = False
+
+            return (
+                self._counts[:size].copy(),
+                self._sums[:size].copy(),
+                self._mins[:size].copy(),
+                self._maxs[:size].copy(),
+            )
+
+        # Values also leave the window as time passes, scan the whole window
+        cutoff: float = (time.time() if now is None else now) - self._window_seconds
+        valid = self._timestamps[:size] >= cutoff
+        counts: np.ndarray = valid.sum(axis=1)
+        sums: np.ndarray = np.where(valid, values, 0).sum(axis=1)
+        mins: np.ndarray = np.where(valid, values, np.inf).min(axis=1)
+        maxs: np.ndarray = np.where(valid, values, -np.inf).max(axis=1)
+
+        return counts, sums, mins, maxs
+
+    def evaluate(self, now: Optional[float] = None) -> Dict[Hashable, WindowStats]:
+        """Aggregates of every feed with at least one value in its window"""
+
+        with self._lock:
+            counts, sums, mins, maxs = self._window(now)
+            feed_keys: list = list(self._feeds)
+
+        rows: np.ndarray = np.flatnonzero(counts)
+        counts = counts[rows]
+
+        return {
+            feed_keys[row]: WindowStats(*stats)
+            for row, stats in zip(
+                rows.tolist(),
+                zip(
+                    counts.tolist(),
+                    (sums[rows] / counts).tolist(),
+                    mins[rows].tolist(),
+                    maxs[rows].tolist(),
+                ),
+            )
+        }
+
+    def feed_stats(
+        self, feed_key: Hashable, now: Optional[float] = None
+    ) -> Optional[WindowStats]:
+        """Aggregates of one feed, None if its window is empty"""
+
+        with self._lock:
+            row: Optional[int] = self._feeds.get(feed_key)
+            if row is None:
+                return None
+
+            values: np.ndarray = self._values[row]
+            if self._window_seconds is None:
+                valid: np.ndarray = self._timestamps[row] > -np.inf
+            else:
+                cutoff: float = (
+                    time.time() if now is None else now
+                ) - self._window_seconds
+                valid = self._timestamps[row] >= cutoff
+            if not valid.any():
+                return None
+
+            window: np.ndarray = values[valid]
+
+            return WindowStats(
+                count=len(window),
+                mean=float(window.mean()),
+                min=float(window.min()),
+                max=float(window.max()),
+            )
+
+    def group_stats(self, now: Optional[float] = None) -> Dict[Hashable, WindowStats]:
+        """Aggregates over all the values in the windows of each group's feeds"""
+
+        with self._lock:
+            counts, sums, mins, maxs = self._window(now)
+            group_ids: np.ndarray = self._group_ids[: len(self._feeds)].copy()
+            group_keys: list = list(self._group_keys)
+
+        grouped: np.ndarray = (group_ids >= 0) & (counts > 0)
+        group_ids = group_ids[grouped]
+        group_count: int = len(group_keys)
+
+        group_counts: np.ndarray = np.bincount(
+            group_ids, weights=counts[grouped], minlength=group_count
+        )
+        group_sums: np.ndarray = np.bincount(
+            group_ids, weights=sums[grouped], minlength=group_count
+        )
+        group_mins: np.ndarray = np.full(group_count, np.inf)
+        np.minimum.at(group_mins, group_ids, mins[grouped])
+        group_maxs: np.ndarray = np.full(group_count, -np.inf)
+        np.maximum.at(group_maxs, group_ids, maxs[grouped])
+
+        return {
+            group_keys[group_id]: WindowStats(
+                count=int(group_counts[group_id]),
+                mean=float(group_sums[group_id] / group_counts[group_id]),
+                min=float(group_mins[group_id]),
+                max=float(group_maxs[group_id]),
+            )
+            for group_id in np.flatnonzero(group_counts)
+        }
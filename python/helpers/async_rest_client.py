@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Optional
+
+import aiohttp
+
+from helpers.constants import RestEndpoint
+from helpers.endpoint_registry import get_endpoint_registry
+from helpers.metrics import Metrics, endpoint_label, get_metrics
+from helpers.rest_client import (
+    IDEMPOTENT_METHODS,
+    RETRY_STATUS_CODES,
+    RestClientError,
+    jittered_backoff,
+)
+
+
+class AsyncRestClient:
+    """asyncio counterpart of RestClient. All the calls share one pooled
+    aiohttp session and at most 'max_concurrency' of them are in flight at
+    any time; the others wait on a semaphore.
+
+    Retries follow RestClient's policy: only the calls of 'retry_methods'
+    are retried on any connection error or 'retry_status_codes', the others
+    (e.g. the POST of a share or an input message, which the host may have
+    processed before the connection broke) only when the connection
+    couldn't be made or on a 429. 'retry' overrides this per call."""
+
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        max_concurrency: int = 100,
+        limit_per_host: int = 100,
+        max_retries: int = 3,
+        backoff_factor: float = 0.2,
+        backoff_max: float = 10.0,
+        timeout: float = 30.0,
+        retry_status_codes: Iterable[int] = RETRY_STATUS_CODES,
+        retry_methods: Iterable[str] = IDEMPOTENT_METHODS,
+    ):
+        self._headers: dict = headers or {}
+        self._max_concurrency: int = max_concurrency
+        self._limit_per_host: int = limit_per_host
+        self._max_retries: int = max_retries
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+        self._timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout)
+        self._retry_status_codes: frozenset = frozenset(retry_status_codes)
+        self._retry_methods: frozenset = frozenset(retry_methods)
+        # Both are bound to the running event loop, so they are created lazily
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers=self._headers,
+                timeout=self._timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self._max_concurrency, limit_per_host=self._limit_per_host
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        return self._session
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[dict] = None,
+        payload: Optional[dict] = None,
+        params: Optional[dict] = None,
+        data: Optional[bytes] = None,
+        retry: bool = True,
+    ) -> aiohttp.ClientResponse:
+        session: aiohttp.ClientSession = self._get_session()
+        attempt: int = 0
+
+        while True:
+            try:
+                resp: aiohttp.ClientResponse = await session.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    json=payload,
+                    data=data,
+                    params=params,
+                )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+                # A timeout or a reset may come after the host processed it,
+                # a connection that couldn't be made can't
+                if attempt >= self._max_retries or not (
+                    retry or isinstance(ex, aiohttp.ClientConnectorError)
+                ):
+                    raise RestClientError(f"{method} {url} failed: {ex}") from ex
+                logging.warning("%s %s failed (%s), retrying", method, url, ex)
+            else:
+                if resp.ok:
+                    return resp
+
+                resp.release()
+                if (
+                    resp.status not in self._retry_status_codes
+                    or (not retry and resp.status != 429)
+                    or attempt >= self._max_retries
+                ):
+                    raise RestClientError(
+                        f"{method} {url} failed: {resp.status} {resp.reason}",
+                        status_code=resp.status,
+                    )
+
+                logging.warning("%s %s returned %s, retrying", method, url, resp.status)
+
+            await asyncio.sleep(
+                jittered_backoff(attempt, self._backoff_factor, self._backoff_max)
+            )
+            attempt += 1
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[dict] = None,
+        payload: Optional[dict] = None,
+        params: Optional[dict] = None,
+        data: Optional[bytes] = None,
+        retry: Optional[bool] = None,
+    ) -> dict:
+        """'data' is a JSON body already encoded, e.g. by
+        'TwinTemplate.rest_body', sent instead of 'payload'. 'retry' True or
+        False overrides 'retry_methods' for this call."""
+
+        if retry is None:
+            retry = method in self._retry_methods
+
+        if data is not None:
+            headers = {"Content-Type": "application/json", **(headers or {})}
+
+        metrics: Optional[Metrics] = get_metrics()
+        self._get_session()
+        async with self._semaphore:
+            start: float = time.perf_counter()
+            try:
+                async with await self._send(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    payload=payload,
+                    params=params,
+                    data=data,
+                    retry=retry,
+                ) as resp:
+                    body: bytes = await resp.read()
+            except RestClientError as ex:
+                if metrics:
+                    metrics.rest_call(
+                        endpoint_label(method, url),
+                        time.perf_counter() - start,
+                        status=str(ex.status_code or "error"),
+                    )
+                raise
+
+        if metrics:
+            metrics.rest_call(
+                endpoint_label(method, url),
+                time.perf_counter() - start,
+                status=str(resp.status),
+                request_bytes=len(data or b""),
+                response_bytes=len(body),
+            )
+
+        return json.loads(body) if body else {}
+
+    async def call(
+        self,
+        endpoint: RestEndpoint,
+        headers: Optional[dict] = None,
+        payload: Optional[dict] = None,
+        params: Optional[dict] = None,
+        data: Optional[bytes] = None,
+        retry: Optional[bool] = None,
+        **url_params,
+    ) -> dict:
+        """Await one of the RestEndpoint constants, e.g.
+        await client.call(SHARE_FEED_DATA, headers, payload, host=..., twin_id=..., feed_id=...)
+        'data' is an already encoded body, sent instead of 'payload'.
+        """
+
+        if not endpoint.method:
+            raise ValueError(f"{endpoint.url} is a STOMP topic, not a REST endpoint")
+
+        return await self.request(
+            method=endpoint.method,
+            url=endpoint.url.format(**url_params),
+            headers=headers,
+            payload=payload,
+            params=params,
+            data=data,
+            retry=retry,
+        )
+
+    async def get_host_endpoints(self, host_url: str) -> dict:
+        """The space's '/index.json', from the shared EndpointRegistry. It
+        blocks only when the entry is stale, so it runs in the default
+        executor rather than on the event loop."""
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, get_endpoint_registry().get, host_url
+        )
+
+    async def search_twins(
+        self, method: str, endpoint: str, headers: dict, payload: dict, scope: str
+    ) -> AsyncIterator[dict]:
+        """Async iterator over the Twins found by a Search operation. Twins are
+        yielded as soon as each Host's response chunk is received."""
+
+        search_headers = headers.copy()
+        search_headers.update(
+            {
+                "Iotics-RequestTimeout": (
+                    datetime.now(tz=timezone.utc) + timedelta(seconds=3)
+                ).isoformat()
+            }
+        )
+
+        self._get_session()
+        async with self._semaphore:
+            async with await self._send(
+                method=method,
+                url=endpoint,
+                headers=search_headers,
+                payload=payload,
+                params={"scope": scope},
+                # A search only reads: retried like a GET
+                retry=True,
+            ) as resp:
+                # Each Host's response is one line of the stream. Lines can be
+                # larger than aiohttp's readline limit, so split them by hand;
+                # only the new data is split, the start of an unfinished line
+                # is kept aside until its end arrives.
+                line_start: List[bytes] = []
+                async for data in resp.content.iter_any():
+                    *chunks, tail = data.split(b"\n")
+                    if chunks:
+                        chunks[0] = b"".join(line_start + [chunks[0]])
+                        line_start = []
+                    line_start.append(tail)
+                    for chunk in chunks:
+                        for twin in _twins_in_chunk(chunk):
+                            yield twin
+
+                for twin in _twins_in_chunk(b"".join(line_start)):
+                    yield twin
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _twins_in_chunk(chunk: bytes) -> list:
+    if not chunk.strip():
+        return []
+
+    try:
+        return json.loads(chunk)["result"]["payload"]["twins"]
+    except (KeyError, TypeError, ValueError):
+        # An error response, or a malformed chunk
+        logging.warning("Ignoring a search response chunk: %.200r", chunk)
+        return []
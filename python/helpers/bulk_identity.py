@@ -0,0 +1,96 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+from typing import List, Optional
+
+from iotics.lib.identity.api.high_level_api import (
+    HighLevelIdentityApi,
+    RegisteredIdentity,
+    get_rest_high_level_identity_api,
+)
+
+TwinIdentitySpec = namedtuple("TwinIdentitySpec", ["twin_key_name", "twin_seed"])
+TwinIdentityResult = namedtuple("TwinIdentityResult", ["spec", "identity", "error"])
+
+# Identity API of the current worker process, set by '_init_worker'
+_worker_identity_api: Optional[HighLevelIdentityApi] = None
+
+
+def _init_worker(resolver_url: str):
+    global _worker_identity_api
+
+    _worker_identity_api = get_rest_high_level_identity_api(resolver_url=resolver_url)
+
+
+def _create_twin(spec: TwinIdentitySpec, agent_identity: RegisteredIdentity) -> tuple:
+    try:
+        twin_identity = _worker_identity_api.create_twin_with_control_delegation(
+            twin_seed=spec.twin_seed,
+            twin_key_name=spec.twin_key_name,
+            agent_registered_identity=agent_identity,
+        )
+    except Exception as ex:
+        # Identity library errors are not guaranteed to be picklable
+        return None, f"{type(ex).__name__}: {ex}"
+
+    return twin_identity, None
+
+
+def _create_twins_chunk(
+    specs: List[TwinIdentitySpec],
+    agent_identity: RegisteredIdentity,
+    io_concurrency: int,
+) -> List[tuple]:
+    # Key derivation and signing use this process' core while up to
+    # 'io_concurrency' twins wait on the resolver
+    with ThreadPoolExecutor(max_workers=io_concurrency) as executor:
+        return list(
+            executor.map(lambda spec: _create_twin(spec, agent_identity), specs)
+        )
+
+
+def create_twins_with_control_delegation(
+    resolver_url: str,
+    specs: List[TwinIdentitySpec],
+    agent_identity: RegisteredIdentity,
+    processes: Optional[int] = None,
+    io_concurrency: int = 8,
+) -> List[TwinIdentityResult]:
+    """Create and register many twin identities, each delegating control to
+    'agent_identity'. The twins are spread over a pool of 'processes' worker
+    processes (default: one per core), each registering up to 'io_concurrency'
+    twins against the resolver at once.
+
+    Results are returned in the same order as 'specs'. A failure only affects
+    its own twin: the result has 'identity' None and the reason in 'error'."""
+
+    if not specs:
+        return []
+
+    processes = processes or os.cpu_count() or 1
+    # A few chunks per process so that a slow chunk doesn't leave cores idle
+    chunk_size: int = max(1, -(-len(specs) // (processes * 4)))
+    chunks = [specs[i : i + chunk_size] for i in range(0, len(specs), chunk_size)]
+
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(resolver_url,)
+    ) as executor:
+        futures = [
+            executor.submit(_create_twins_chunk, chunk, agent_identity, io_concurrency)
+            for chunk in chunks
+        ]
+
+        results: List[TwinIdentityResult] = []
+        for chunk, future in zip(chunks, futures):
+            try:
+                chunk_results = future.result()
+            except Exception as ex:
+                # e.g. the worker process died: fail the chunk, not the batch
+                chunk_results = [(None, f"{type(ex).__name__}: {ex}")] * len(chunk)
+
+            results.extend(
+                TwinIdentityResult(spec=spec, identity=identity, error=error)
+                for spec, (identity, error) in zip(chunk, chunk_results)
+            )
+
+    return results
@@ -0,0 +1,230 @@
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from helpers.constants import DELETE_TWIN, UPSERT_TWIN
+from helpers.rate_limiter import RateLimiter
+from helpers.rest_client import RestClient, RestClientError
+
+UPSERTED = "upserted"
+UNCHANGED = "unchanged"
+DELETED = "deleted"
+NOT_FOUND = "not-found"
+FAILED = "failed"
+
+TwinSpec = namedtuple(
+    "TwinSpec",
+    ["twin_key_name", "properties", "feeds", "inputs", "location"],
+    defaults=((), (), (), None),
+)
+TwinOutcome = namedtuple("TwinOutcome", ["twin_id", "status", "error", "seconds"])
+
+
+def twin_payload(twin_id: str, spec: TwinSpec) -> dict:
+    """UPSERT_TWIN payload of a twin, see 'TwinSpec'"""
+
+    payload: dict = {
+        "twinId": {"id": twin_id},
+        "properties": list(spec.properties),
+        "feeds": list(spec.feeds),
+        "inputs": list(spec.inputs),
+    }
+    if spec.location:
+        payload["location"] = spec.location
+
+    return payload
+
+
+class ProvisioningReport:
+    def __init__(self, outcomes: List[TwinOutcome], seconds: float):
+        self.outcomes: List[TwinOutcome] = outcomes
+        self.seconds: float = seconds
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return dict(Counter(outcome.status for outcome in self.outcomes))
+
+    @property
+    def failed(self) -> List[TwinOutcome]:
+        return [outcome for outcome in self.outcomes if outcome.status == FAILED]
+
+    @property
+    def throughput(self) -> float:
+        """Twins per second"""
+
+        return len(self.outcomes) / self.seconds if self.seconds else 0
+
+    def __str__(self) -> str:
+        counts: str = ", ".join(
+            f"{count} {status}" for status, count in sorted(self.counts.items())
+        )
+
+        return (
+            f"{len(self.outcomes)} twins in {self.seconds:.1f}s "
+            f"({self.throughput:.0f} twins/s): {counts or 'nothing to do'}"
+        )
+
+
+class BulkProvisioner:
+    """Upserts and deletes many twins with up to 'concurrency' calls in
+    flight and, if 'rate' is set, at most 'rate' calls per second.
+    Transient failures (connection errors, 429 and 5xx) are retried by the
+    RestClient with jittered backoff, up to 'max_retries' times.
+
+    Re-running is safe: upserts replace the twin and deleting a twin that
+    is already gone is reported as NOT_FOUND. If 'state_path' is set, the
+    hash of each upserted payload is saved there, under the host URL, and
+    twins whose payload hasn't changed since are skipped (UNCHANGED) instead
+    of upserted again. One state file can be shared by several hosts."""
+
+    def __init__(
+        self,
+        host_url: str,
+        headers: dict,
+        concurrency: int = 16,
+        rate: Optional[float] = None,
+        max_retries: int = 5,
+        state_path: Optional[str] = None,
+        client: Optional[RestClient] = None,
+    ):
+        self._host_url: str = host_url
+        self._headers: dict = headers
+        self._concurrency: int = concurrency
+        self._rate_limiter: Optional[RateLimiter] = RateLimiter(rate) if rate else None
+        self._client: RestClient = client or RestClient(
+            pool_maxsize=concurrency, max_retries=max_retries
+        )
+        self._state_path: Optional[str] = state_path
+        self._state: Dict[str, str] = self._load_state()
+        self._state_lock: threading.Lock = threading.Lock()
+
+    def _read_state_file(self) -> Dict[str, Dict[str, str]]:
+        """host URL -> twin ID -> payload hash"""
+
+        try:
+            with open(self._state_path, encoding="utf-8") as state_file:
+                hosts: dict = json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+
+        # Drop anything that isn't keyed by host, e.g. a file of the old format
+        return {
+            host_url: twins
+            for host_url, twins in hosts.items()
+            if isinstance(twins, dict)
+        }
+
+    def _load_state(self) -> Dict[str, str]:
+        if not self._state_path:
+            return {}
+
+        return self._read_state_file().get(self._host_url, {})
+
+    def _save_state(self):
+        if not self._state_path:
+            return
+
+        # Keep the twins of the other hosts
+        hosts: Dict[str, Dict[str, str]] = self._read_state_file()
+        with self._state_lock:
+            hosts[self._host_url] = dict(self._state)
+
+        tmp_path: str = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(hosts, state_file)
+        os.replace(tmp_path, self._state_path)
+
+    def provisioned_twin_ids(self) -> List[str]:
+        """IDs of the twins this host's state records as upserted"""
+
+        with self._state_lock:
+            return list(self._state)
+
+    def _run(self, operation: Callable, items: Iterable) -> ProvisioningReport:
+        start: float = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            outcomes: List[TwinOutcome] = list(executor.map(operation, items))
+        seconds: float = time.perf_counter() - start
+
+        self._save_state()
+
+        return ProvisioningReport(outcomes=outcomes, seconds=seconds)
+
+    def _upsert(self, payload: dict) -> TwinOutcome:
+        twin_id: str = payload["twinId"]["id"]
+        payload_hash: str = hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode()
+        ).hexdigest()
+        if self._state.get(twin_id) == payload_hash:
+            return TwinOutcome(twin_id=twin_id, status=UNCHANGED, error=None, seconds=0)
+
+        if self._rate_limiter:
+            self._rate_limiter.acquire()
+
+        start: float = time.perf_counter()
+        try:
+            self._client.call(
+                UPSERT_TWIN, headers=self._headers, payload=payload, host=self._host_url
+            )
+        except RestClientError as ex:
+            return TwinOutcome(
+                twin_id=twin_id,
+                status=FAILED,
+                error=str(ex),
+                seconds=time.perf_counter() - start,
+            )
+
+        with self._state_lock:
+            self._state[twin_id] = payload_hash
+
+        return TwinOutcome(
+            twin_id=twin_id,
+            status=UPSERTED,
+            error=None,
+            seconds=time.perf_counter() - start,
+        )
+
+    def _delete(self, twin_id: str) -> TwinOutcome:
+        if self._rate_limiter:
+            self._rate_limiter.acquire()
+
+        start: float = time.perf_counter()
+        status: str = DELETED
+        error: Optional[str] = None
+        try:
+            self._client.call(
+                DELETE_TWIN,
+                headers=self._headers,
+                host=self._host_url,
+                twin_id=twin_id,
+            )
+        except RestClientError as ex:
+            if ex.status_code == 404:
+                status = NOT_FOUND
+            else:
+                status, error = FAILED, str(ex)
+
+        if status != FAILED:
+            with self._state_lock:
+                self._state.pop(twin_id, None)
+
+        return TwinOutcome(
+            twin_id=twin_id,
+            status=status,
+            error=error,
+            seconds=time.perf_counter() - start,
+        )
+
+    def upsert(self, payloads: Iterable[dict]) -> ProvisioningReport:
+        """Upsert twins from their UPSERT_TWIN payloads, see 'twin_payload'.
+        Outcomes are in the same order as 'payloads'."""
+
+        return self._run(self._upsert, payloads)
+
+    def delete(self, twin_ids: Iterable[str]) -> ProvisioningReport:
+        return self._run(self._delete, twin_ids)
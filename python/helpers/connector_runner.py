@@ -0,0 +1,474 @@
+"""Run a connector over all the cores of a node: the twins of a fleet are
+sharded across worker processes, which are restarted if they crash, and
+the metrics of the workers are added up.
+
+Run from the 'python' folder:
+python -m helpers.connector_runner fleet.example.json --workers 8 --metrics-port 9100
+
+with 'fleet.example.json' as:
+{
+    "worker": "fleet_publisher:publish",
+    "workers": 8,
+    "config": {"host_url": "https://my-space.iotics.space", "period": 5},
+    "twins": [{"key_name": "sensor_1", ...}, {"key_name": "sensor_2", ...}]
+}
+
+'--mock' runs the fleet against a local mock host instead of 'host_url'.
+"""
+
+import argparse
+from collections import deque, namedtuple
+import importlib
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Deque, Hashable, List, Optional, Tuple
+import zlib
+
+from helpers.metrics import Metrics, enable_metrics, get_metrics
+from helpers.rest_client import jittered_backoff
+
+# What a worker process is given: its shard of the fleet's twins, the
+# fleet's 'config', a threading.Event set when it must stop and how many
+# times it was restarted
+WorkerContext = namedtuple(
+    "WorkerContext", ["shard", "shards", "twins", "config", "stop", "restarts"]
+)
+SupervisorStats = namedtuple(
+    "SupervisorStats", ["workers", "alive", "restarts", "finished", "failed"]
+)
+
+
+def load_fleet(path: str) -> dict:
+    with open(path, encoding="utf-8") as fleet_file:
+        fleet: dict = json.load(fleet_file)
+
+    if "worker" not in fleet or "twins" not in fleet:
+        raise ValueError(f"{path}: a fleet needs a 'worker' and 'twins'")
+
+    return fleet
+
+
+def twin_key(twin) -> Hashable:
+    """Shard key of a twin of the fleet: its 'key_name', which its identity
+    is made from, so that a twin always lands in the same worker"""
+
+    return twin["key_name"] if isinstance(twin, dict) else twin
+
+
+def shard_of(key: Hashable, shards: int) -> int:
+    # Stable across processes and runs, unlike hash() of a str
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def _import_worker(target: str) -> Callable[[WorkerContext], None]:
+    module_name, _, function_name = target.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _run_worker(
+    target: str,
+    context: WorkerContext,
+    stop_reader: Connection,
+    snapshots: multiprocessing.Queue,
+    metrics_interval: float,
+):
+    """Entry point of a worker process"""
+
+    # Ctrl-C goes to the supervisor, which stops the workers with 'context.stop'
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s worker {context.shard} %(levelname)s %(message)s",
+    )
+
+    # Not a multiprocessing.Event: a worker crashing while waiting on one
+    # would leave it broken. The pipe also ends if the supervisor dies.
+    context = context._replace(stop=threading.Event())
+
+    def watch_stop():
+        try:
+            stop_reader.recv()
+        except (EOFError, OSError):
+            pass
+        context.stop.set()
+
+    threading.Thread(target=watch_stop, name="worker_stop", daemon=True).start()
+
+    enable_metrics()
+
+    def send_metrics():
+        snapshots.put((context.shard, get_metrics().to_dict()))
+
+    def report():
+        while not context.stop.wait(timeout=metrics_interval):
+            send_metrics()
+
+    threading.Thread(target=report, name="worker_metrics", daemon=True).start()
+
+    try:
+        _import_worker(target)(context)
+    except Exception:
+        logging.exception("Worker of shard %s failed", context.shard)
+        send_metrics()
+        sys.exit(1)
+
+    send_metrics()
+
+
+class _Shard:
+    def __init__(self, index: int, twins: list):
+        self.index: int = index
+        self.twins: list = twins
+        self.process: Optional[multiprocessing.Process] = None
+        self.stop_writer: Optional[Connection] = None
+        self.restarts: int = 0
+        self.crashed_at: Deque[float] = deque()
+        self.restart_at: Optional[float] = None
+        self.finished: bool = False
+        self.failed: bool = False
+        # Metrics of the running process, and the sum of those of the
+        # processes before it so that the counters keep growing
+        self.snapshot: Optional[dict] = None
+        self.retired: Optional[dict] = None
+
+
+class ConnectorSupervisor:
+    """Shards 'twins' across 'workers' processes (default: one per core)
+    which each run 'target', a "module:function" called with a
+    WorkerContext. Each worker is a fresh process, not a fork, and must
+    make its own identity API, token, REST session and STOMP or gRPC
+    connection for its twins: nothing is shared between workers.
+
+    A worker that returns is done; one that crashes or exits with an error
+    is restarted with jittered backoff and the same twins, unless it
+    crashed more than 'max_restarts' times in 'restart_window' seconds.
+    'context.stop' is set when the supervisor stops, workers must then
+    return within the 'stop' timeout or they are terminated.
+
+    The metrics workers collect with 'get_metrics()' are sent to the
+    supervisor every 'metrics_interval' seconds and added up in 'metrics',
+    which can be served with 'metrics.serve_prometheus()'."""
+
+    def __init__(
+        self,
+        target: str,
+        twins: list,
+        workers: Optional[int] = None,
+        config: Optional[dict] = None,
+        key: Callable[[object], Hashable] = twin_key,
+        metrics_interval: float = 5.0,
+        max_restarts: int = 5,
+        restart_window: float = 300.0,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        self._target: str = target
+        self._workers: int = workers or multiprocessing.cpu_count()
+        self._config: dict = config or {}
+        self._metrics_interval: float = metrics_interval
+        self._max_restarts: int = max_restarts
+        self._restart_window: float = restart_window
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+
+        shard_twins: List[list] = [[] for _ in range(self._workers)]
+        for twin in twins:
+            shard_twins[shard_of(key(twin), self._workers)].append(twin)
+        self._shards: List[_Shard] = [
+            _Shard(index, twins) for index, twins in enumerate(shard_twins) if twins
+        ]
+
+        # gRPC and the REST sessions are not fork-safe
+        self._mp = multiprocessing.get_context("spawn")
+        self._stopping: bool = False
+        self._snapshots: multiprocessing.Queue = self._mp.Queue()
+        self._lock: threading.Lock = threading.Lock()
+        self._done: threading.Event = threading.Event()
+        self._running: bool = False
+        self._monitor: Optional[threading.Thread] = None
+        self.metrics: Metrics = Metrics()
+
+    def start(self):
+        self._stopping = False
+        self._done.clear()
+        self._running = True
+        with self._lock:
+            for shard in self._shards:
+                self._spawn(shard)
+
+        self._monitor = threading.Thread(
+            target=self._run, name="connector_supervisor", daemon=True
+        )
+        self._monitor.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            self._stopping = True
+            for shard in self._shards:
+                self._signal_stop(shard)
+
+        deadline: float = time.monotonic() + timeout
+        for shard in self._shards:
+            if shard.process is not None:
+                shard.process.join(timeout=max(0, deadline - time.monotonic()))
+        for shard in self._shards:
+            if shard.process is not None and shard.process.is_alive():
+                logging.warning("Terminating the worker of shard %s", shard.index)
+                shard.process.terminate()
+                shard.process.join()
+
+        self._running = False
+        if self._monitor:
+            self._monitor.join()
+        self._collect(block=False)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for all the workers to be done or to have failed for good"""
+
+        return self._done.wait(timeout=timeout)
+
+    def stats(self) -> SupervisorStats:
+        with self._lock:
+            return SupervisorStats(
+                workers=len(self._shards),
+                alive=sum(
+                    1
+                    for shard in self._shards
+                    if shard.process is not None and shard.process.is_alive()
+                ),
+                restarts=sum(shard.restarts for shard in self._shards),
+                finished=sum(1 for shard in self._shards if shard.finished),
+                failed=sum(1 for shard in self._shards if shard.failed),
+            )
+
+    def _spawn(self, shard: _Shard):
+        context = WorkerContext(
+            shard=shard.index,
+            shards=self._workers,
+            twins=shard.twins,
+            config=self._config,
+            stop=None,
+            restarts=shard.restarts,
+        )
+        stop_reader, shard.stop_writer = self._mp.Pipe(duplex=False)
+        shard.process = self._mp.Process(
+            target=_run_worker,
+            args=(
+                self._target,
+                context,
+                stop_reader,
+                self._snapshots,
+                self._metrics_interval,
+            ),
+            name=f"connector_worker_{shard.index}",
+        )
+        shard.process.start()
+        stop_reader.close()
+        shard.restart_at = None
+
+    def _signal_stop(self, shard: _Shard):
+        if shard.stop_writer is not None:
+            try:
+                shard.stop_writer.send(None)
+            except OSError:
+                # The worker is gone already
+                pass
+            shard.stop_writer.close()
+            shard.stop_writer = None
+
+    def _collect(self, block: bool):
+        """Add up the metrics the workers sent"""
+
+        received: List[Tuple[int, dict]] = self._receive(block)
+        if received:
+            with self._lock:
+                self._load_snapshots(received)
+
+    def _receive(self, block: bool) -> List[Tuple[int, dict]]:
+        """(shard index, metrics) the workers sent since the last call"""
+
+        received: List[Tuple[int, dict]] = []
+        while True:
+            try:
+                received.append(
+                    self._snapshots.get(timeout=0.5 if block and not received else 0.01)
+                )
+            except queue.Empty:
+                return received
+
+    def _load_snapshots(self, received: List[Tuple[int, dict]]):
+        # Called with the lock held
+        for index, snapshot in received:
+            for shard in self._shards:
+                if shard.index == index:
+                    shard.snapshot = snapshot
+
+        self.metrics.load(
+            snapshot
+            for shard in self._shards
+            for snapshot in (shard.retired, shard.snapshot)
+            if snapshot
+        )
+
+    def _retire(self, shard: _Shard):
+        if shard.snapshot:
+            retired = Metrics()
+            retired.load(
+                snapshot for snapshot in (shard.retired, shard.snapshot) if snapshot
+            )
+            shard.retired = retired.to_dict()
+            shard.snapshot = None
+
+    def _check(self, shard: _Shard, now: float):
+        # Called with the lock held, so 'stop' can't run in between
+        if shard.finished or shard.failed:
+            return
+
+        if shard.restart_at is not None:
+            if now >= shard.restart_at and not self._stopping:
+                shard.restarts += 1
+                logging.info(
+                    "Restarting the worker of shard %s (restart %s)",
+                    shard.index,
+                    shard.restarts,
+                )
+                self._spawn(shard)
+            return
+
+        if shard.process is None or shard.process.exitcode is None:
+            return
+
+        self._signal_stop(shard)
+        if shard.process.exitcode == 0:
+            shard.finished = True
+            return
+
+        # The last metrics it sent may still be in the queue
+        received: List[Tuple[int, dict]] = self._receive(block=False)
+        if received:
+            self._load_snapshots(received)
+        self._retire(shard)
+
+        shard.crashed_at.append(now)
+        while shard.crashed_at and shard.crashed_at[0] < now - self._restart_window:
+            shard.crashed_at.popleft()
+        if len(shard.crashed_at) > self._max_restarts:
+            logging.error(
+                "The worker of shard %s crashed %s times in %ss, giving up on its %s twins",
+                shard.index,
+                len(shard.crashed_at),
+                self._restart_window,
+                len(shard.twins),
+            )
+            shard.failed = True
+            return
+
+        backoff: float = jittered_backoff(
+            len(shard.crashed_at), self._backoff_factor, self._backoff_max
+        )
+        logging.warning(
+            "The worker of shard %s exited with %s, restarting it in %.1fs",
+            shard.index,
+            shard.process.exitcode,
+            backoff,
+        )
+        shard.restart_at = now + backoff
+
+    def _run(self):
+        while self._running:
+            self._collect(block=True)
+
+            with self._lock:
+                # Checked under the lock: no restart is spawned once 'stop' began
+                if self._stopping:
+                    continue
+
+                now: float = time.monotonic()
+                for shard in self._shards:
+                    self._check(shard, now)
+
+                if all(shard.finished or shard.failed for shard in self._shards):
+                    self._done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("fleet", help="JSON fleet definition")
+    parser.add_argument("--workers", type=int, help="default: one per core")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics")
+    parser.add_argument("--metrics-dump", help="JSON file the metrics are written to")
+    parser.add_argument("--metrics-interval", type=float, default=5.0)
+    parser.add_argument(
+        "--mock", action="store_true", help="run against a local mock host"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    fleet: dict = load_fleet(args.fleet)
+    config: dict = fleet.get("config", {})
+    mock_host = None
+    if args.mock:
+        from benchmarks.mock_host import MockHost
+
+        mock_host = MockHost()
+        mock_host.start()
+        config = {**config, "host_url": mock_host.url, "mock": True}
+
+    supervisor = ConnectorSupervisor(
+        target=fleet["worker"],
+        twins=fleet["twins"],
+        workers=args.workers or fleet.get("workers"),
+        config=config,
+        metrics_interval=args.metrics_interval,
+    )
+    if args.metrics_port:
+        supervisor.metrics.serve_prometheus(port=args.metrics_port)
+    if args.metrics_dump:
+        supervisor.metrics.start_dump(args.metrics_dump, args.metrics_interval)
+
+    # SIGTERM stops the workers like Ctrl-C does
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    supervisor.start()
+    logging.info(
+        "%s twins on %s workers", len(fleet["twins"]), supervisor.stats().workers
+    )
+    try:
+        supervisor.wait()
+    except KeyboardInterrupt:
+        logging.info("Stopping the workers")
+    finally:
+        # 'stop' terminates the workers that don't stop in time anyway
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        supervisor.stop()
+        if args.metrics_dump:
+            supervisor.metrics.stop_dump()
+            supervisor.metrics.dump_json(args.metrics_dump)
+        if mock_host is not None:
+            mock_host.stop()
+
+    stats: SupervisorStats = supervisor.stats()
+    logging.info("Done: %s", stats)
+    sys.exit(1 if stats.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
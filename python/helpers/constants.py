@@ -2,6 +2,16 @@ from collections import namedtuple
 
 # UTILITIES CONSTANTS
 INDEX_JSON_PATH = "/index.json"
+ENDPOINTS_CACHE_TTL = 300  # seconds
+ENDPOINTS_CACHE_DIR = (
+    ""  # Optional folder to share the cached endpoints between processes
+)
+METRICS_ENABLED = False  # Collect the metrics of 'helpers.metrics'
+METRICS_DUMP_PATH = ""  # Optional JSON file the metrics are periodically written to
+METRICS_DUMP_INTERVAL = 60  # seconds
+SEARCH_CACHE_TTL = 60  # seconds
+TOKEN_DURATION = 600  # seconds, of the agent auth tokens
+IDENTITY_CACHE_TTL = 86400  # seconds before a cached identity is registered again
 
 # PROPERTY KEYS
 PROPERTY_KEY_DEFINES = "https://data.iotics.com/app#defines"
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from helpers.constants import (
+    ENDPOINTS_CACHE_DIR,
+    ENDPOINTS_CACHE_TTL,
+    INDEX_JSON_PATH,
+)
+from helpers.rest_client import RestClient, RestClientError, get_default_client
+
+
+class EndpointRegistry:
+    """Caches the '/index.json' of each IOTICSpace ('resolver', 'grpc',
+    'stomp', ...) for 'ttl' seconds, in memory and, if 'cache_dir' is set,
+    on disk so that all the connectors started on a node share it.
+
+    Once an entry is stale it is revalidated with a conditional GET
+    (ETag / Last-Modified), so an unchanged index.json costs a 304 only.
+    If the space can't be reached a stale entry is still returned."""
+
+    def __init__(
+        self,
+        ttl: float = ENDPOINTS_CACHE_TTL,
+        cache_dir: Optional[str] = None,
+        client: Optional[RestClient] = None,
+    ):
+        self._ttl: float = ttl
+        self._cache_dir: Optional[str] = cache_dir
+        self._client: Optional[RestClient] = client
+        self._entries: Dict[str, dict] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}
+
+    def _cache_path(self, host_url: str) -> str:
+        file_name: str = hashlib.sha256(host_url.encode()).hexdigest()[:16]
+
+        return os.path.join(self._cache_dir, f"endpoints_{file_name}.json")
+
+    def _read_disk(self, host_url: str) -> Optional[dict]:
+        if not self._cache_dir:
+            return None
+
+        try:
+            with open(self._cache_path(host_url), encoding="utf-8") as cache_file:
+                entry: dict = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        return entry if entry.get("host_url") == host_url else None
+
+    def _write_disk(self, entry: dict):
+        if not self._cache_dir:
+            return
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        path: str = self._cache_path(entry["host_url"])
+        tmp_path: str = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(tmp_path, path)
+
+    def _is_fresh(self, entry: Optional[dict]) -> bool:
+        return entry is not None and time.time() - entry["fetched_at"] < self._ttl
+
+    def get(self, host_url: str) -> dict:
+        """The space's '/index.json', as a copy the caller is free to change"""
+
+        return dict(self._get_endpoints(host_url))
+
+    def _get_endpoints(self, host_url: str) -> dict:
+        entry: Optional[dict] = self._entries.get(host_url)
+        if self._is_fresh(entry):
+            return entry["endpoints"]
+
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host_url, threading.Lock())
+
+        # Only one thread per host fetches, the others wait and reuse its result
+        with host_lock:
+            entry = self._entries.get(host_url)
+            if self._is_fresh(entry):
+                return entry["endpoints"]
+
+            disk_entry: Optional[dict] = self._read_disk(host_url)
+            if disk_entry and (
+                entry is None or disk_entry["fetched_at"] > entry["fetched_at"]
+            ):
+                entry = disk_entry
+            if self._is_fresh(entry):
+                self._entries[host_url] = entry
+                return entry["endpoints"]
+
+            try:
+                entry = self._fetch(host_url, entry)
+            except RestClientError:
+                if entry is None:
+                    raise
+                logging.warning(
+                    "Can't refresh the endpoints of %s, using the cached ones", host_url
+                )
+                return entry["endpoints"]
+
+            self._entries[host_url] = entry
+            self._write_disk(entry)
+
+        return entry["endpoints"]
+
+    def _fetch(self, host_url: str, entry: Optional[dict]) -> dict:
+        headers: dict = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        client: RestClient = self._client or get_default_client()
+        resp: requests.Response = client.request(
+            method="GET", url=host_url + INDEX_JSON_PATH, headers=headers
+        )
+
+        if resp.status_code == 304 and entry:
+            return dict(entry, fetched_at=time.time())
+
+        return {
+            "host_url": host_url,
+            "endpoints": resp.json(),
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+
+    def resolve(self, host_url: str, name: str) -> str:
+        """URL of one of the space's services, e.g. resolve(HOST_URL, "stomp")"""
+
+        return self._get_endpoints(host_url)[name]
+
+    def invalidate(self, host_url: str):
+        """Mark the cached endpoints of 'host_url' as stale, in memory and on
+        disk: the next call revalidates them, and falls back to them if
+        the space can't be reached"""
+
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host_url, threading.Lock())
+
+        with host_lock:
+            entry: Optional[dict] = self._entries.get(host_url)
+            disk_entry: Optional[dict] = self._read_disk(host_url)
+            if disk_entry and (
+                entry is None or disk_entry["fetched_at"] > entry["fetched_at"]
+            ):
+                entry = disk_entry
+            if entry is None:
+                return
+
+            entry = dict(entry, fetched_at=0)
+            self._entries[host_url] = entry
+            self._write_disk(entry)
+
+
+_default_registry: Optional[EndpointRegistry] = None
+
+
+def get_endpoint_registry() -> EndpointRegistry:
+    """Return the EndpointRegistry shared by all the connectors of this process."""
+
+    global _default_registry
+
+    if _default_registry is None:
+        _default_registry = EndpointRegistry(cache_dir=ENDPOINTS_CACHE_DIR or None)
+
+    return _default_registry
@@ -0,0 +1,201 @@
+import asyncio
+from collections import namedtuple
+import json
+import logging
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import grpc
+from google.protobuf.wrappers_pb2 import BoolValue
+from helpers.metrics import Metrics, get_metrics
+from helpers.rest_client import jittered_backoff
+from iotics.api import interest_pb2, interest_pb2_grpc
+from iotics.api.common_pb2 import TwinID
+from iotics.api.feed_pb2 import FeedID
+from iotics.api.interest_pb2 import Interest
+from iotics.lib.grpc.helpers import create_headers
+
+FeedEvent = namedtuple(
+    "FeedEvent", ["twin_id", "feed_id", "host_id", "value", "mime", "occurred_at"]
+)
+FollowerStats = namedtuple(
+    "FollowerStats", ["streams", "events", "restarts", "queue_depth"]
+)
+
+_FeedKey = Tuple[str, str]
+
+
+class AsyncFeedFollower:
+    """Follows many feeds over a single grpc.aio channel. Each followed feed
+    is one FetchInterests stream, run as an asyncio task rather than a
+    thread, and all the streams are merged into one async iterator of
+    FeedEvents:
+
+        follower = AsyncFeedFollower(channel, follower_twin_id)
+        for twin_id in twin_ids:
+            follower.follow(twin_id, feed_id)
+        async for event in follower.events():
+            ...
+
+    A stream that fails or is closed by the host is restarted on its own
+    with jittered exponential backoff; the other streams carry on.
+    'channel' is a grpc.aio channel, e.g. from 'Identity.get_aio_channel'.
+    When more than 'queue_size' events are waiting to be consumed the
+    streams stop reading until there is room again."""
+
+    def __init__(
+        self,
+        channel: grpc.aio.Channel,
+        follower_twin_id: str,
+        fetch_last_stored: bool = True,
+        queue_size: int = 10000,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        self._stub = interest_pb2_grpc.InterestAPIStub(channel)
+        self._follower_twin_id: str = follower_twin_id
+        self._fetch_last_stored: bool = fetch_last_stored
+        self._queue_size: int = queue_size
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+        # Bound to the running event loop, so it is created lazily
+        self._queue: Optional[asyncio.Queue] = None
+        # (twin_id, feed_id) -> task running its stream
+        self._streams: Dict[_FeedKey, asyncio.Task] = {}
+        self._events: int = 0
+        self._restarts: int = 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._queue_size)
+
+        return self._queue
+
+    def _request(
+        self, twin_id: str, feed_id: str, host_id: Optional[str], last_stored: bool
+    ) -> interest_pb2.FetchInterestRequest:
+        return interest_pb2.FetchInterestRequest(
+            headers=create_headers(),
+            args=interest_pb2.FetchInterestRequest.Arguments(
+                interest=Interest(
+                    followerTwinId=TwinID(id=self._follower_twin_id),
+                    followedFeedId=FeedID(id=feed_id, twinId=twin_id, hostId=host_id),
+                )
+            ),
+            fetchLastStored=BoolValue(value=last_stored),
+        )
+
+    @staticmethod
+    def _event(response: interest_pb2.FetchInterestResponse) -> FeedEvent:
+        followed_feed: FeedID = response.payload.interest.followedFeedId
+        feed_data = response.payload.feedData
+        value = feed_data.data
+        if feed_data.mime == "application/json":
+            value = json.loads(value)
+
+        return FeedEvent(
+            twin_id=followed_feed.twinId,
+            feed_id=followed_feed.id,
+            host_id=followed_feed.hostId,
+            value=value,
+            mime=feed_data.mime,
+            occurred_at=feed_data.occurredAt.ToDatetime(),
+        )
+
+    async def _run_stream(self, twin_id: str, feed_id: str, host_id: Optional[str]):
+        queue: asyncio.Queue = self._get_queue()
+        last_stored: bool = self._fetch_last_stored
+        attempt: int = 0
+
+        while True:
+            call = self._stub.FetchInterests(
+                self._request(twin_id, feed_id, host_id, last_stored)
+            )
+            try:
+                async for response in call:
+                    attempt = 0
+                    try:
+                        event: FeedEvent = self._event(response)
+                    except Exception as ex:
+                        # e.g. invalid JSON: skip the value, not the whole stream
+                        logging.warning(
+                            "Skipping a bad value of %s/%s: %s", twin_id, feed_id, ex
+                        )
+                        metrics: Optional[Metrics] = get_metrics()
+                        if metrics:
+                            metrics.inc("grpc_follow_bad_events_total")
+                        continue
+                    self._events += 1
+                    await queue.put(event)
+                logging.info("Stream of %s/%s closed by the host", twin_id, feed_id)
+            except grpc.aio.AioRpcError as ex:
+                logging.warning(
+                    "Stream of %s/%s failed: %s %s",
+                    twin_id,
+                    feed_id,
+                    ex.code().name,
+                    ex.details(),
+                )
+            except asyncio.CancelledError:
+                call.cancel()
+                raise
+            except Exception as ex:
+                # Any other failure restarts the stream too, it must not end the task
+                call.cancel()
+                logging.exception("Stream of %s/%s failed: %s", twin_id, feed_id, ex)
+
+            self._restarts += 1
+            metrics = get_metrics()
+            if metrics:
+                metrics.inc("grpc_follow_restarts_total")
+            # Catch up with the value shared while the stream was down
+            last_stored = True
+            await asyncio.sleep(
+                jittered_backoff(attempt, self._backoff_factor, self._backoff_max)
+            )
+            attempt += 1
+
+    def follow(self, twin_id: str, feed_id: str, host_id: Optional[str] = None):
+        """Start following a feed. 'host_id' is needed for remote twins.
+        Must be called from within the event loop."""
+
+        key: _FeedKey = (twin_id, feed_id)
+        if key in self._streams:
+            raise ValueError(f"Feed {feed_id} of {twin_id} is already followed")
+
+        self._streams[key] = asyncio.get_running_loop().create_task(
+            self._run_stream(twin_id, feed_id, host_id),
+            name=f"follow_{twin_id}_{feed_id}",
+        )
+
+    def unfollow(self, twin_id: str, feed_id: str):
+        task: Optional[asyncio.Task] = self._streams.pop((twin_id, feed_id), None)
+        if task:
+            task.cancel()
+
+    async def events(self) -> AsyncIterator[FeedEvent]:
+        """The events of all the followed feeds, in arrival order"""
+
+        queue: asyncio.Queue = self._get_queue()
+        while True:
+            yield await queue.get()
+
+    def stats(self) -> FollowerStats:
+        return FollowerStats(
+            streams=len(self._streams),
+            events=self._events,
+            restarts=self._restarts,
+            queue_depth=self._queue.qsize() if self._queue else 0,
+        )
+
+    async def close(self):
+        tasks = list(self._streams.values())
+        self._streams.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
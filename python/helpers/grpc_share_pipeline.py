@@ -0,0 +1,260 @@
+from collections import deque, namedtuple
+import logging
+import threading
+import time
+from typing import Deque, Dict, Optional, Tuple
+
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+from helpers.codec import JSON_CODEC
+from helpers.metrics import Metrics, get_metrics
+from iotics.api import common_pb2, feed_pb2, feed_pb2_grpc
+from iotics.lib.grpc.helpers import create_headers
+
+SharePipelineStats = namedtuple(
+    "SharePipelineStats",
+    [
+        "in_flight",
+        "waiting",
+        "submitted",
+        "completed",
+        "failed",
+        "coalesced",
+        "latency_p50",
+        "latency_p99",
+        "latency_max",
+    ],
+)
+
+_FeedKey = Tuple[str, str]
+
+
+def share_feed_data_request(
+    twin_id: str, feed_id: str, value: dict, occurred_at: Timestamp, codec=JSON_CODEC
+) -> feed_pb2.ShareFeedDataRequest:
+    """ShareFeedData request of a value, as issued by GrpcSharePipeline"""
+
+    return feed_pb2.ShareFeedDataRequest(
+        headers=create_headers(),
+        args=feed_pb2.ShareFeedDataRequest.Arguments(
+            feedId=feed_pb2.FeedID(id=feed_id, twinId=twin_id)
+        ),
+        payload=feed_pb2.ShareFeedDataRequest.Payload(
+            sample=common_pb2.FeedData(
+                occurredAt=occurred_at,
+                mime=codec.mime,
+                data=codec.encode_bytes(value),
+            )
+        ),
+    )
+
+
+class GrpcSharePipeline:
+    """Non-blocking ShareFeedData for the gRPC publishers. 'share' returns
+    straight away: the call is issued as a future on the channel, so up to
+    'window' shares are in flight at once over one HTTP/2 connection and
+    throughput is no longer bounded by one round trip per thread.
+
+    While the window is full the values wait, one per feed: a newer value
+    of a feed that is already waiting replaces the older one (counted in
+    'coalesced'), so a slow space receives the latest value of each feed
+    rather than a growing backlog. Each completed share frees a slot for
+    the longest-waiting feed.
+
+    'stats' reports the completion latency, from 'share' to the response,
+    over the last 'latency_samples' shares. 'channel' is a grpc channel,
+    e.g. from 'Identity.get_channel', 'codec' the payload codec, see
+    'helpers.codec'."""
+
+    def __init__(
+        self,
+        channel: grpc.Channel,
+        window: int = 256,
+        timeout: float = 30.0,
+        latency_samples: int = 10000,
+        codec=JSON_CODEC,
+    ):
+        self._stub = feed_pb2_grpc.FeedAPIStub(channel)
+        self._window: int = window
+        self._timeout: float = timeout
+        self._codec = codec
+        # Shares the '_issue' running on a thread still has to issue
+        self._local: threading.local = threading.local()
+
+        self._condition: threading.Condition = threading.Condition()
+        self._in_flight: int = 0
+        # (twin_id, feed_id) -> (value, occurred_at, shared_at), oldest first
+        self._waiting: Dict[_FeedKey, Tuple[dict, Timestamp, float]] = {}
+
+        self._submitted: int = 0
+        self._completed: int = 0
+        self._failed: int = 0
+        self._coalesced: int = 0
+        self._latencies: Deque[float] = deque(maxlen=latency_samples)
+
+    def _issue(
+        self,
+        twin_id: str,
+        feed_id: str,
+        value: dict,
+        occurred_at: Timestamp,
+        shared_at: float,
+    ):
+        # Called with a slot of the window already taken. The callback of a
+        # future that is already done runs inline: the share it hands the
+        # slot to is queued for the loop below instead of recursing.
+        pending: Optional[Deque[tuple]] = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append((twin_id, feed_id, value, occurred_at, shared_at))
+            return
+
+        pending = self._local.pending = deque(
+            [(twin_id, feed_id, value, occurred_at, shared_at)]
+        )
+        try:
+            while pending:
+                self._issue_one(*pending.popleft())
+        finally:
+            self._local.pending = None
+
+    def _issue_one(
+        self,
+        twin_id: str,
+        feed_id: str,
+        value: dict,
+        occurred_at: Timestamp,
+        shared_at: float,
+    ):
+        try:
+            future: grpc.Future = self._stub.ShareFeedData.future(
+                share_feed_data_request(
+                    twin_id, feed_id, value, occurred_at, self._codec
+                ),
+                timeout=self._timeout,
+            )
+        except Exception as ex:
+            # e.g. a value the codec can't encode or a closed channel:
+            # the slot must still be freed, or 'flush' would wait forever
+            logging.error("Can't share data to %s/%s: %s", twin_id, feed_id, ex)
+            metrics: Optional[Metrics] = get_metrics()
+            if metrics:
+                metrics.inc("grpc_share_errors_total", code="NOT_ISSUED")
+
+            with self._condition:
+                self._failed += 1
+                next_share: Optional[tuple] = self._next_share()
+            if next_share is not None:
+                self._issue(*next_share)
+            return
+
+        future.add_done_callback(
+            lambda done: self._on_done(done, twin_id, feed_id, shared_at)
+        )
+
+    def _next_share(self) -> Optional[tuple]:
+        """With the condition held: hand the slot of a finished share over to
+        the feed that has been waiting the longest, or free it"""
+
+        if not self._waiting:
+            self._in_flight -= 1
+            self._condition.notify_all()
+            return None
+
+        next_key: _FeedKey = next(iter(self._waiting))
+        next_value, next_occurred_at, next_shared_at = self._waiting.pop(next_key)
+        self._submitted += 1
+
+        return (*next_key, next_value, next_occurred_at, next_shared_at)
+
+    def _on_done(
+        self, future: grpc.Future, twin_id: str, feed_id: str, shared_at: float
+    ):
+        latency: float = time.perf_counter() - shared_at
+        error: Optional[grpc.RpcError] = future.exception()
+        if error:
+            logging.error(
+                "Can't share data to %s/%s: %s", twin_id, feed_id, error.code().name
+            )
+
+        metrics: Optional[Metrics] = get_metrics()
+        if metrics:
+            metrics.observe("grpc_share_seconds", latency)
+            if error:
+                metrics.inc("grpc_share_errors_total", code=error.code().name)
+
+        with self._condition:
+            if error:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._latencies.append(latency)
+
+            next_share: Optional[tuple] = self._next_share()
+
+        if next_share is not None:
+            self._issue(*next_share)
+
+    def share(
+        self,
+        twin_id: str,
+        feed_id: str,
+        value: dict,
+        occurred_at: Optional[Timestamp] = None,
+    ):
+        """Share 'value' without waiting for the response. Can be called
+        from any thread."""
+
+        shared_at: float = time.perf_counter()
+        if occurred_at is None:
+            occurred_at = Timestamp()
+            occurred_at.GetCurrentTime()
+
+        with self._condition:
+            if self._in_flight >= self._window:
+                key: _FeedKey = (twin_id, feed_id)
+                if key in self._waiting:
+                    self._coalesced += 1
+                # A replaced value keeps its place in the line, so that
+                # a feed updated faster than the space responds still gets
+                # its turn
+                self._waiting[key] = (value, occurred_at, shared_at)
+                return
+
+            self._in_flight += 1
+            self._submitted += 1
+
+        self._issue(twin_id, feed_id, value, occurred_at, shared_at)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for all the shares to complete. Returns False on timeout."""
+
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._in_flight == 0 and not self._waiting, timeout=timeout
+            )
+
+    def stats(self) -> SharePipelineStats:
+        with self._condition:
+            counts: dict = dict(
+                in_flight=self._in_flight,
+                waiting=len(self._waiting),
+                submitted=self._submitted,
+                completed=self._completed,
+                failed=self._failed,
+                coalesced=self._coalesced,
+            )
+            latencies = list(self._latencies)
+
+        latencies.sort()
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return SharePipelineStats(
+            **counts,
+            latency_p50=percentile(0.5),
+            latency_p99=percentile(0.99),
+            latency_max=latencies[-1] if latencies else 0,
+        )
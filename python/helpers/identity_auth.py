@@ -1,4 +1,12 @@
+from typing import List, Optional
+
+import grpc
+from helpers import bulk_identity
+from helpers.bulk_identity import TwinIdentityResult, TwinIdentitySpec
+from helpers.identity_cache import TWIN, CachedIdentityApi, IdentityCache
+from helpers.token_manager import TokenManager
 from iotics.lib.grpc.auth import AuthInterface
+from iotics.lib.grpc.helpers import KEEP_ALIVE_CHANNEL_OPTIONS
 from iotics.lib.identity.api.high_level_api import (
     HighLevelIdentityApi,
     RegisteredIdentity,
@@ -6,20 +14,83 @@ from iotics.lib.identity.api.high_level_api import (
 )
 
 
+class TokenCallCredentials(grpc.AuthMetadataPlugin):
+    def __init__(self, auth: AuthInterface):
+        self._auth: AuthInterface = auth
+
+    def __call__(self, context, callback):
+        callback((("authorization", f"Bearer {self._auth.get_token()}"),), None)
+
+
 class Identity(AuthInterface):
-    def __init__(self, resolver_url: str, grpc_endpoint: str):
+    def __init__(
+        self,
+        resolver_url: str,
+        grpc_endpoint: str,
+        identity_cache: Optional[IdentityCache] = None,
+    ):
         self._identity_api: HighLevelIdentityApi = get_rest_high_level_identity_api(
             resolver_url=resolver_url
         )
+        if identity_cache:
+            # Identities and delegations already registered are not registered again
+            self._identity_api = CachedIdentityApi(self._identity_api, identity_cache)
+        self._identity_cache: Optional[IdentityCache] = identity_cache
+        self._resolver_url: str = resolver_url
         self._grpc_endpoint: str = grpc_endpoint
         self._token: str = None
+        self._token_manager: Optional[TokenManager] = None
 
     def get_host(self) -> str:
         return self._grpc_endpoint
 
     def get_token(self) -> str:
+        if self._token_manager:
+            return self._token_manager.get_token()
+
         return self._token
 
+    def start_token_refresh(
+        self, agent_identity: RegisteredIdentity, user_did: str, duration: int
+    ) -> TokenManager:
+        """Keep a valid token without calling 'refresh_token' by hand:
+        a TokenManager renews it in the background before it expires."""
+
+        self._token_manager = TokenManager(
+            identity_api=self._identity_api,
+            agent_identity=agent_identity,
+            user_did=user_did,
+            duration=duration,
+        )
+        self._token_manager.start()
+
+        return self._token_manager
+
+    def get_channel(self) -> grpc.Channel:
+        """gRPC channel that reads the current token on every call, unlike the
+        IoticsApi default one which keeps the token it was created with."""
+
+        return grpc.secure_channel(
+            self.get_host(),
+            grpc.composite_channel_credentials(
+                grpc.ssl_channel_credentials(),
+                grpc.metadata_call_credentials(TokenCallCredentials(auth=self)),
+            ),
+            options=KEEP_ALIVE_CHANNEL_OPTIONS,
+        )
+
+    def get_aio_channel(self) -> grpc.aio.Channel:
+        """asyncio counterpart of 'get_channel', see 'helpers.grpc_follower'"""
+
+        return grpc.aio.secure_channel(
+            self.get_host(),
+            grpc.composite_channel_credentials(
+                grpc.ssl_channel_credentials(),
+                grpc.metadata_call_credentials(TokenCallCredentials(auth=self)),
+            ),
+            options=KEEP_ALIVE_CHANNEL_OPTIONS,
+        )
+
     def refresh_token(
         self, agent_identity: RegisteredIdentity, user_did: str, duration: int
     ):
@@ -60,3 +131,55 @@ class Identity(AuthInterface):
         )
 
         return twin_identity
+
+    def create_twins_with_control_delegation(
+        self,
+        specs: List[TwinIdentitySpec],
+        agent_identity: RegisteredIdentity,
+        processes: Optional[int] = None,
+        io_concurrency: int = 8,
+    ) -> List[TwinIdentityResult]:
+        """Create many twin identities at once, see 'helpers.bulk_identity'.
+        With an identity cache, only the twins it doesn't have are created
+        and the new ones are added to it."""
+
+        cached: List[Optional[TwinIdentityResult]] = []
+        missing: List[TwinIdentitySpec] = []
+        for spec in specs:
+            twin_identity: Optional[RegisteredIdentity] = None
+            if self._identity_cache:
+                twin_identity, delegations = self._identity_cache.get(
+                    TWIN, spec.twin_seed, spec.twin_key_name
+                )
+                if delegations.get("control") != agent_identity.did:
+                    twin_identity = None
+            if twin_identity:
+                cached.append(TwinIdentityResult(spec, twin_identity, None))
+            else:
+                cached.append(None)
+                missing.append(spec)
+
+        created: List[TwinIdentityResult] = []
+        if missing:
+            created = bulk_identity.create_twins_with_control_delegation(
+                resolver_url=self._resolver_url,
+                specs=missing,
+                agent_identity=agent_identity,
+                processes=processes,
+                io_concurrency=io_concurrency,
+            )
+        if self._identity_cache:
+            for result in created:
+                if result.identity:
+                    self._identity_cache.put(
+                        TWIN,
+                        result.spec.twin_seed,
+                        result.spec.twin_key_name,
+                        result.identity,
+                        delegations={"control": agent_identity.did},
+                    )
+
+        # In the order of 'specs'
+        created_results = iter(created)
+
+        return [result or next(created_results) for result in cached]
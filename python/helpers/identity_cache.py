@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from helpers.constants import IDENTITY_CACHE_TTL
+from iotics.lib.identity.api.advanced_api import AdvancedIdentityLocalApi
+from iotics.lib.identity.api.high_level_api import (
+    HighLevelIdentityApi,
+    RegisteredIdentity,
+)
+from iotics.lib.identity.crypto.issuer import Issuer
+from iotics.lib.identity.crypto.key_pair_secrets import (
+    KeyPairSecretsHelper,
+    SeedMethod,
+    build_agent_secrets,
+    build_twin_secrets,
+    build_user_secrets,
+)
+
+USER = "user"
+AGENT = "agent"
+TWIN = "twin"
+
+_BUILD_SECRETS = {
+    USER: build_user_secrets,
+    AGENT: build_agent_secrets,
+    TWIN: build_twin_secrets,
+}
+
+
+def seed_fingerprint(seed: bytes) -> str:
+    """Identifies a seed in the cache without storing the seed itself."""
+
+    return hashlib.sha256(seed).hexdigest()[:32]
+
+
+class IdentityCache:
+    """On-disk cache of registered identities and of the delegations made
+    between them, keyed by (purpose, seed fingerprint, key name).
+
+    Only the DID, the issuer name and the delegations are written to disk,
+    never the seed: a RegisteredIdentity is rebuilt from the seed the caller
+    provides, and the DID derived from it must match the cached one.
+
+    The file is a journal of JSON lines, so adding an entry is a single
+    append; the last line for a key wins when the file is loaded.
+    Entries older than 'ttl' seconds are stale and ignored, so an identity
+    or delegation removed from the resolver is registered again eventually.
+    'ttl=None' trusts the cache forever."""
+
+    def __init__(
+        self, path: str, resolver_url: str, ttl: Optional[float] = IDENTITY_CACHE_TTL
+    ):
+        self._path: str = path
+        self._resolver_url: str = resolver_url
+        self._ttl: Optional[float] = ttl
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._load()
+
+    @staticmethod
+    def _key(purpose: str, seed: bytes, key_name: str) -> str:
+        return f"{purpose}:{seed_fingerprint(seed)}:{key_name}"
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return
+
+        lines_count: int = 0
+        with open(self._path, encoding="utf-8") as cache_file:
+            for line in cache_file:
+                try:
+                    entry: dict = json.loads(line)
+                except ValueError:
+                    # A partially written line from a crash, skip it
+                    continue
+                lines_count += 1
+                if entry.get("resolver_url") == self._resolver_url:
+                    self._entries[entry["key"]] = entry
+
+        # Compact the journal once it has grown well beyond the live entries
+        if lines_count > 2 * len(self._entries) + 100:
+            self._rewrite()
+
+    def _rewrite(self):
+        tmp_path: str = f"{self._path}.tmp"
+        with open(
+            os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+            "w",
+            encoding="utf-8",
+        ) as cache_file:
+            for entry in self._entries.values():
+                cache_file.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self._path)
+
+    def _append(self, entry: dict):
+        with open(
+            os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600),
+            "a",
+            encoding="utf-8",
+        ) as cache_file:
+            cache_file.write(json.dumps(entry) + "\n")
+
+    def get(
+        self, purpose: str, seed: bytes, key_name: str
+    ) -> Tuple[Optional[RegisteredIdentity], dict]:
+        """Return the cached identity, or None if missing, stale or not
+        matching the seed, together with its delegations."""
+
+        with self._lock:
+            entry: Optional[dict] = self._entries.get(
+                self._key(purpose, seed, key_name)
+            )
+
+        if not entry:
+            return None, {}
+
+        if self._ttl is not None and time.time() - entry["updated_at"] > self._ttl:
+            return None, {}
+
+        key_pair_secrets = _BUILD_SECRETS[purpose](
+            seed, key_name, SeedMethod.SEED_METHOD_BIP39, ""
+        )
+        # Cheap check that doesn't need the resolver: the cached DID must be
+        # the one derived from the seed and key name
+        key_pair = KeyPairSecretsHelper.get_key_pair(key_pair_secrets)
+        if (
+            AdvancedIdentityLocalApi.create_identifier(key_pair.public_bytes)
+            != entry["did"]
+        ):
+            return None, {}
+
+        identity = RegisteredIdentity(
+            key_pair_secrets=key_pair_secrets,
+            issuer=Issuer.build(entry["did"], entry["name"]),
+        )
+
+        return identity, entry["delegations"]
+
+    def put(
+        self,
+        purpose: str,
+        seed: bytes,
+        key_name: str,
+        identity: RegisteredIdentity,
+        delegations: Optional[dict] = None,
+    ):
+        entry: dict = {
+            "key": self._key(purpose, seed, key_name),
+            "resolver_url": self._resolver_url,
+            "did": identity.did,
+            "name": identity.name,
+            "delegations": delegations or {},
+            "updated_at": time.time(),
+        }
+
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            self._append(entry)
+
+
+class CachedIdentityApi:
+    """Wraps a HighLevelIdentityApi so that the identities and delegations
+    found in the IdentityCache are not registered against the resolver again.
+    Any other call goes straight to the wrapped API."""
+
+    def __init__(self, identity_api: HighLevelIdentityApi, cache: IdentityCache):
+        self._identity_api: HighLevelIdentityApi = identity_api
+        self._cache: IdentityCache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._identity_api, name)
+
+    def create_user_and_agent_with_auth_delegation(
+        self,
+        user_seed: bytes,
+        user_key_name: str,
+        agent_seed: bytes,
+        agent_key_name: str,
+    ) -> Tuple[RegisteredIdentity, RegisteredIdentity]:
+        user_identity, user_delegations = self._cache.get(
+            USER, user_seed, user_key_name
+        )
+        agent_identity, _ = self._cache.get(AGENT, agent_seed, agent_key_name)
+
+        if (
+            user_identity
+            and agent_identity
+            and user_delegations.get("auth") == agent_identity.did
+        ):
+            return user_identity, agent_identity
+
+        (
+            user_identity,
+            agent_identity,
+        ) = self._identity_api.create_user_and_agent_with_auth_delegation(
+            user_seed=user_seed,
+            user_key_name=user_key_name,
+            agent_seed=agent_seed,
+            agent_key_name=agent_key_name,
+        )
+        self._cache.put(AGENT, agent_seed, agent_key_name, agent_identity)
+        self._cache.put(
+            USER,
+            user_seed,
+            user_key_name,
+            user_identity,
+            delegations={"auth": agent_identity.did},
+        )
+
+        return user_identity, agent_identity
+
+    def create_twin_with_control_delegation(
+        self,
+        twin_seed: bytes,
+        twin_key_name: str,
+        agent_registered_identity: RegisteredIdentity,
+    ) -> RegisteredIdentity:
+        twin_identity, twin_delegations = self._cache.get(
+            TWIN, twin_seed, twin_key_name
+        )
+
+        if twin_identity and twin_delegations.get("control") == (
+            agent_registered_identity.did
+        ):
+            return twin_identity
+
+        twin_identity = self._identity_api.create_twin_with_control_delegation(
+            twin_seed=twin_seed,
+            twin_key_name=twin_key_name,
+            agent_registered_identity=agent_registered_identity,
+        )
+        self._cache.put(
+            TWIN,
+            twin_seed,
+            twin_key_name,
+            twin_identity,
+            delegations={"control": agent_registered_identity.did},
+        )
+
+        return twin_identity
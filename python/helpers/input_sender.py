@@ -0,0 +1,210 @@
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from helpers.codec import JSON_CODEC
+from helpers.constants import SEND_INPUT_MESSAGE
+from helpers.rest_client import RestClient, RestClientError
+
+InputSenderStats = namedtuple(
+    "InputSenderStats",
+    ["pending", "in_flight", "requested", "sent", "coalesced", "failed"],
+)
+
+# (receiver host ID, receiver twin ID, input ID)
+_InputKey = Tuple[str, str, str]
+
+
+class InputSender:
+    """Background sender of SEND_INPUT_MESSAGE for control-loop inputs, such
+    as a radiator's setpoint, where only the latest value matters. 'send'
+    can be called from any thread, including an event loop, and only
+    records the value: a newer value for the same receiver twin and input
+    replaces the one not sent yet (counted in 'coalesced') instead of
+    queueing behind it.
+
+    Knobs:
+    - min_interval: seconds between two messages to the same input, the
+      values sent meanwhile are coalesced into the latest one;
+    - max_workers: number of messages sent concurrently, to different
+      inputs; messages to the same input are never concurrent;
+    - codec: payload codec, see 'helpers.codec'.
+    """
+
+    def __init__(
+        self,
+        host_url: str,
+        headers: dict,
+        sender_twin_id: str,
+        client: Optional[RestClient] = None,
+        min_interval: float = 0,
+        max_workers: int = 8,
+        codec=JSON_CODEC,
+    ):
+        self._host_url: str = host_url
+        self._headers: dict = headers
+        self._sender_twin_id: str = sender_twin_id
+        self._client: RestClient = client or RestClient(pool_maxsize=max_workers)
+        self._min_interval: float = min_interval
+        self._codec = codec
+
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="input_sender"
+        )
+        self._condition: threading.Condition = threading.Condition()
+        # Latest value not sent yet of each input, in the order they were first set
+        self._pending: Dict[_InputKey, dict] = {}
+        self._in_flight: Set[_InputKey] = set()
+        self._last_sent_at: Dict[_InputKey, float] = {}
+        # Inputs with a pending value and not in flight are in exactly one of:
+        # '_ready', that can be sent now, or '_delayed', (send at, input)
+        # waiting for 'min_interval' to pass
+        self._ready: Deque[_InputKey] = deque()
+        self._delayed: List[Tuple[float, _InputKey]] = []
+        self._scheduled: Set[_InputKey] = set()
+        self._running: bool = False
+        self._scheduler: Optional[threading.Thread] = None
+
+        self._requested: int = 0
+        self._sent: int = 0
+        self._coalesced: int = 0
+        self._failed: int = 0
+
+    def start(self):
+        self._running = True
+        self._scheduler = threading.Thread(
+            target=self._run, name="input_sender_scheduler", daemon=True
+        )
+        self._scheduler.start()
+
+    def stop(self):
+        """Send the values not sent yet, regardless of 'min_interval', and stop."""
+
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        if self._scheduler:
+            self._scheduler.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def send(
+        self,
+        receiver_host_id: str,
+        receiver_twin_id: str,
+        input_id: str,
+        value: dict,
+    ):
+        key: _InputKey = (receiver_host_id, receiver_twin_id, input_id)
+
+        with self._condition:
+            self._requested += 1
+            if key in self._pending:
+                self._coalesced += 1
+            # Replaced in place: the input keeps its turn
+            self._pending[key] = value
+            if key not in self._in_flight and key not in self._scheduled:
+                self._schedule(key, time.monotonic())
+                self._condition.notify()
+
+    def stats(self) -> InputSenderStats:
+        with self._condition:
+            return InputSenderStats(
+                pending=len(self._pending),
+                in_flight=len(self._in_flight),
+                requested=self._requested,
+                sent=self._sent,
+                coalesced=self._coalesced,
+                failed=self._failed,
+            )
+
+    def _schedule(self, key: _InputKey, now: float):
+        """With the condition held: queue an input that has a pending value"""
+
+        self._scheduled.add(key)
+        last_sent_at: Optional[float] = self._last_sent_at.get(key)
+        if last_sent_at is None or last_sent_at + self._min_interval <= now:
+            self._ready.append(key)
+        else:
+            heapq.heappush(self._delayed, (last_sent_at + self._min_interval, key))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now: float = time.monotonic()
+                    # Once stopping, 'min_interval' is no longer waited for
+                    while self._delayed and (
+                        self._delayed[0][0] <= now or not self._running
+                    ):
+                        self._ready.append(heapq.heappop(self._delayed)[1])
+                    if self._ready or (not self._running and not self._pending):
+                        break
+                    self._condition.wait(
+                        timeout=self._delayed[0][0] - now if self._delayed else None
+                    )
+
+                batch: List[Tuple[_InputKey, dict]] = []
+                while self._ready:
+                    key: _InputKey = self._ready.popleft()
+                    self._scheduled.discard(key)
+                    batch.append((key, self._pending.pop(key)))
+                    self._in_flight.add(key)
+                    self._last_sent_at[key] = now
+
+            if not batch:
+                return
+
+            for key, value in batch:
+                self._executor.submit(self._send_input, key, value)
+
+    def _send_input(self, key: _InputKey, value: dict):
+        receiver_host_id, receiver_twin_id, input_id = key
+        sent: bool = False
+        try:
+            self._client.call(
+                SEND_INPUT_MESSAGE,
+                headers=self._headers,
+                payload={
+                    "message": {
+                        "data": self._codec.encode(value),
+                        "mime": self._codec.mime,
+                    }
+                },
+                host=self._host_url,
+                twin_sender_id=self._sender_twin_id,
+                twin_receiver_host_id=receiver_host_id,
+                twin_receiver_id=receiver_twin_id,
+                input_id=input_id,
+            )
+            sent = True
+        except RestClientError as ex:
+            logging.error(
+                "Can't send the input message to %s/%s: %s",
+                receiver_twin_id,
+                input_id,
+                ex,
+            )
+        finally:
+            # Also on any other error, or the input would stay in flight for good
+            with self._condition:
+                self._in_flight.discard(key)
+                if sent:
+                    self._sent += 1
+                else:
+                    self._failed += 1
+                # A newer value may be waiting for this input
+                if key in self._pending:
+                    self._schedule(key, time.monotonic())
+                self._condition.notify()
@@ -0,0 +1,152 @@
+from collections import deque, namedtuple
+import logging
+import threading
+import time
+from typing import Callable, Deque, List
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+DispatcherStats = namedtuple(
+    "DispatcherStats",
+    [
+        "queue_depth",
+        "received",
+        "handled",
+        "dropped",
+        "errors",
+        "handler_latency_avg",
+        "handler_latency_max",
+    ],
+)
+
+
+class _Worker:
+    def __init__(self, max_size: int):
+        self.queue: Deque[tuple] = deque()
+        self.max_size: int = max_size
+        self.condition: threading.Condition = threading.Condition()
+        self.thread: threading.Thread = None
+
+
+class MessageDispatcher:
+    """Runs 'handler(headers, body)' on a pool of worker threads instead of
+    the thread that receives the frames.
+
+    Frames with the same ordering key (e.g. the STOMP subscription id) always
+    go to the same worker, so they are handled in the order they arrived.
+    Each worker has a bounded queue; when it is full the 'overflow_policy'
+    decides what happens:
+    - BLOCK: the receiving thread waits for room (backpressure);
+    - DROP_OLDEST: the oldest queued frame is discarded;
+    - DROP_NEWEST: the new frame is discarded."""
+
+    def __init__(
+        self,
+        handler: Callable,
+        workers: int = 4,
+        queue_size: int = 10000,
+        overflow_policy: str = BLOCK,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+
+        self._handler: Callable = handler
+        self._overflow_policy: str = overflow_policy
+        self._workers: List[_Worker] = [
+            _Worker(max_size=max(1, queue_size // workers)) for _ in range(workers)
+        ]
+        self._running: bool = False
+
+        self._stats_lock: threading.Lock = threading.Lock()
+        self._received: int = 0
+        self._handled: int = 0
+        self._dropped: int = 0
+        self._errors: int = 0
+        self._handler_time: float = 0
+        self._handler_time_max: float = 0
+
+    def start(self):
+        self._running = True
+        for n, worker in enumerate(self._workers):
+            worker.thread = threading.Thread(
+                target=self._run, args=(worker,), name=f"dispatcher_{n}", daemon=True
+            )
+            worker.thread.start()
+
+    def stop(self):
+        """Handle the frames still queued, then stop the workers."""
+
+        self._running = False
+        for worker in self._workers:
+            with worker.condition:
+                worker.condition.notify_all()
+        for worker in self._workers:
+            if worker.thread:
+                worker.thread.join()
+
+    def submit(self, ordering_key: str, headers: dict, body):
+        worker: _Worker = self._workers[hash(ordering_key) % len(self._workers)]
+
+        with worker.condition:
+            with self._stats_lock:
+                self._received += 1
+
+            if len(worker.queue) >= worker.max_size:
+                if self._overflow_policy == DROP_NEWEST:
+                    with self._stats_lock:
+                        self._dropped += 1
+                    return
+                if self._overflow_policy == DROP_OLDEST:
+                    worker.queue.popleft()
+                    with self._stats_lock:
+                        self._dropped += 1
+                else:
+                    while len(worker.queue) >= worker.max_size and self._running:
+                        worker.condition.wait()
+
+            worker.queue.append((headers, body))
+            worker.condition.notify_all()
+
+    def stats(self) -> DispatcherStats:
+        queue_depth: int = sum(len(worker.queue) for worker in self._workers)
+
+        with self._stats_lock:
+            return DispatcherStats(
+                queue_depth=queue_depth,
+                received=self._received,
+                handled=self._handled,
+                dropped=self._dropped,
+                errors=self._errors,
+                handler_latency_avg=(
+                    self._handler_time / self._handled if self._handled else 0
+                ),
+                handler_latency_max=self._handler_time_max,
+            )
+
+    def _run(self, worker: _Worker):
+        while True:
+            with worker.condition:
+                while not worker.queue and self._running:
+                    worker.condition.wait()
+                if not worker.queue:
+                    return
+                headers, body = worker.queue.popleft()
+                # Wake up the receiving thread if it is blocked on a full queue
+                worker.condition.notify_all()
+
+            start: float = time.perf_counter()
+            try:
+                self._handler(headers, body)
+            except Exception:
+                logging.exception("Error handling a message")
+                with self._stats_lock:
+                    self._errors += 1
+            elapsed: float = time.perf_counter() - start
+
+            with self._stats_lock:
+                self._handled += 1
+                self._handler_time += elapsed
+                self._handler_time_max = max(self._handler_time_max, elapsed)
@@ -0,0 +1,348 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from helpers import constants
+from helpers.constants import METRICS_DUMP_INTERVAL, METRICS_DUMP_PATH, METRICS_ENABLED
+
+# Seconds, from sub-millisecond STOMP callbacks to slow searches
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets: Tuple[float, ...] = buckets
+        # One count per bucket (not cumulative) plus the +Inf one
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and latency histograms of the connectors' hot paths.
+
+    Instrumented code gets the registry with 'get_metrics()', which returns
+    None while metrics are disabled, so the cost is a function call and a
+    None check. Names follow the Prometheus conventions, labels are given
+    as keyword arguments, e.g.
+    metrics.observe("rest_request_seconds", 0.02, endpoint="PUT /qapi/twins")"""
+
+    def __init__(self, prefix: str = "iotics_"):
+        self._prefix: str = prefix
+        self._lock: threading.Lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+        self._started_at: float = time.time()
+        self._dump_stop: threading.Event = threading.Event()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key: _Key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        **labels,
+    ):
+        key: _Key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram: Optional[_Histogram] = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def rest_call(
+        self,
+        endpoint: str,
+        seconds: float,
+        status: str,
+        request_bytes: int = 0,
+        response_bytes: int = 0,
+    ):
+        """Record one REST call, 'endpoint' as named by 'endpoint_label' and
+        'status' the HTTP status code or "error" if there was no response"""
+
+        self.observe("rest_request_seconds", seconds, endpoint=endpoint)
+        self.inc("rest_requests_total", endpoint=endpoint, status=status)
+        if not status.startswith(("2", "3")):
+            self.inc("rest_errors_total", endpoint=endpoint, status=status)
+        if request_bytes:
+            self.inc("rest_request_bytes_total", request_bytes, endpoint=endpoint)
+        if response_bytes:
+            self.inc("rest_response_bytes_total", response_bytes, endpoint=endpoint)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started_at = time.time()
+
+    def load(self, snapshots: Iterable[dict]):
+        """Replace the metrics with the sum of 'snapshots' made by 'to_dict',
+        e.g. those of the worker processes of a ConnectorSupervisor"""
+
+        counters: Dict[_Key, float] = {}
+        histograms: Dict[_Key, _Histogram] = {}
+        for snapshot in snapshots:
+            for counter in snapshot["counters"]:
+                key: _Key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                counters[key] = counters.get(key, 0) + counter["value"]
+
+            for entry in snapshot["histograms"]:
+                key = (entry["name"], tuple(sorted(entry["labels"].items())))
+                histogram: Optional[_Histogram] = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = _Histogram(
+                        tuple(
+                            float(bound)
+                            for bound in entry["buckets"]
+                            if bound != "+Inf"
+                        )
+                    )
+                for index, count in enumerate(entry["buckets"].values()):
+                    histogram.counts[index] += count
+                histogram.sum += entry["sum"]
+                histogram.count += entry["count"]
+
+        with self._lock:
+            self._counters = counters
+            self._histograms = histograms
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [
+                (
+                    key,
+                    histogram.buckets,
+                    list(histogram.counts),
+                    histogram.sum,
+                    histogram.count,
+                )
+                for key, histogram in self._histograms.items()
+            ]
+
+        return {
+            "timestamp": time.time(),
+            # Divide the counters by the uptime to get rates, e.g. STOMP frames/s
+            "uptime_seconds": time.time() - self._started_at,
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": dict(zip([*map(str, buckets), "+Inf"], counts)),
+                    "sum": total,
+                    "count": count,
+                }
+                for (name, labels), buckets, counts, total, count in histograms
+            ],
+        }
+
+    def prometheus_text(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+
+        metrics: dict = self.to_dict()
+        lines: List[str] = []
+        typed: set = set()
+
+        def type_line(name: str, metric_type: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for counter in sorted(metrics["counters"], key=lambda c: c["name"]):
+            name: str = self._prefix + counter["name"]
+            type_line(name, "counter")
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+
+        for histogram in sorted(metrics["histograms"], key=lambda h: h["name"]):
+            name = self._prefix + histogram["name"]
+            type_line(name, "histogram")
+            cumulative: int = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                labels: str = _labels(dict(histogram["labels"], le=bound))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _labels(histogram["labels"])
+            lines.append(f"{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path: str):
+        tmp_path: str = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as dump_file:
+            json.dump(self.to_dict(), dump_file)
+        os.replace(tmp_path, path)
+
+    def start_dump(self, path: str, interval: float = METRICS_DUMP_INTERVAL):
+        """Write the metrics to 'path' every 'interval' seconds"""
+
+        def run():
+            while not self._dump_stop.wait(timeout=interval):
+                try:
+                    self.dump_json(path)
+                except OSError as ex:
+                    logging.error("Can't write the metrics to %s: %s", path, ex)
+
+        self._dump_stop.clear()
+        threading.Thread(target=run, name="metrics_dump", daemon=True).start()
+
+    def stop_dump(self):
+        self._dump_stop.set()
+
+    def serve_prometheus(self, port: int = 9100, host: str = "") -> ThreadingHTTPServer:
+        """Expose the metrics to Prometheus on http://host:port/metrics"""
+
+        metrics: Metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                data: bytes = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics_server", daemon=True
+        ).start()
+
+        return server
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+
+    escaped: str = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+
+    return "{" + escaped + "}"
+
+
+_endpoint_patterns: Optional[List[Tuple[str, re.Pattern, str]]] = None
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """Name a REST call after the RestEndpoint it matches, e.g.
+    "POST /qapi/twins/{twin_id}/feeds/{feed_id}/shares", so that the
+    metrics of all the twins and feeds add up together."""
+
+    global _endpoint_patterns
+
+    if _endpoint_patterns is None:
+        _endpoint_patterns = [
+            (
+                endpoint.method,
+                re.compile(
+                    ".*"
+                    + re.sub(
+                        r"\\\{(\w+)\\\}",
+                        "[^/]+",
+                        re.escape(endpoint.url.replace("{host}", "")),
+                    )
+                ),
+                f"{endpoint.method} {endpoint.url.replace('{host}', '')}",
+            )
+            for endpoint in vars(constants).values()
+            if isinstance(endpoint, constants.RestEndpoint) and endpoint.method
+        ]
+        _endpoint_patterns.append(
+            (
+                "GET",
+                re.compile(".*" + re.escape(constants.INDEX_JSON_PATH)),
+                "GET /index.json",
+            )
+        )
+
+    path: str = url.split("?", 1)[0]
+    for endpoint_method, pattern, label in _endpoint_patterns:
+        if endpoint_method == method and pattern.fullmatch(path):
+            return label
+
+    return f"{method} other"
+
+
+_metrics: Optional[Metrics] = None
+
+
+def enable_metrics() -> Metrics:
+    """Start collecting the metrics, and writing them to METRICS_DUMP_PATH if set."""
+
+    global _metrics
+
+    if _metrics is None:
+        _metrics = Metrics()
+        if METRICS_DUMP_PATH:
+            _metrics.start_dump(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL)
+
+    return _metrics
+
+
+def disable_metrics():
+    global _metrics
+
+    if _metrics is not None:
+        _metrics.stop_dump()
+    _metrics = None
+
+
+def get_metrics() -> Optional[Metrics]:
+    """The metrics registry of this process, None while metrics are disabled."""
+
+    return _metrics
+
+
+if METRICS_ENABLED:
+    enable_metrics()
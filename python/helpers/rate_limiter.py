@@ -0,0 +1,29 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket allowing 'rate' calls per second on average, in bursts
+    of up to 'burst' calls. 'acquire' blocks until a call is allowed."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self._rate: float = rate
+        self._burst: float = burst or max(1, int(rate))
+        self._tokens: float = self._burst
+        self._updated_at: float = time.monotonic()
+        self._lock: threading.Lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated_at) * self._rate
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            # Negative tokens are calls booked ahead: wait for their turn
+            wait: float = -self._tokens / self._rate
+
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,212 @@
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+ReorderStats = namedtuple(
+    "ReorderStats",
+    ["feeds", "buffered", "emitted", "duplicates", "late", "reordered", "forced"],
+)
+
+# (feed key, share timestamp, value)
+Emitted = Tuple[Hashable, float, object]
+
+
+def timestamp_seconds(timestamp: Union[float, str, datetime]) -> float:
+    """Seconds since the epoch of a share timestamp: the ISO string of a
+    STOMP frame's 'occurredAt', the datetime of a gRPC FeedEvent, or a number"""
+
+    if isinstance(timestamp, str):
+        # Before Python 3.11 'fromisoformat' doesn't accept the "Z" of UTC
+        if timestamp.endswith("Z"):
+            timestamp = timestamp[:-1] + "+00:00"
+        timestamp = datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+
+    return float(timestamp)
+
+
+class ReorderBuffer:
+    """Drops the duplicate values of followed feeds and emits the values of
+    each feed in the order of their share timestamps, e.g. after a STOMP
+    reconnect or when following the same feed through several hosts:
+
+        buffer = ReorderBuffer(lateness=0.5)
+        def on_frame(headers, body):
+            for feed, timestamp, value in buffer.add(feed, timestamp, value):
+                process(...)
+
+    A value is held for 'lateness' seconds after it arrives, so that values
+    shared before it but arriving after it can go first; 'poll' emits the
+    values whose time is up when no new value arrives (see 'next_due').
+    Values whose timestamp isn't after the last one emitted for their feed
+    are dropped, as duplicates if equal and as late otherwise. With a zero
+    'lateness' values are emitted straight away and only dropped.
+
+    Memory is bounded: a feed holds at most 'max_buffered' values, the
+    oldest one being emitted early when a new one comes in, and a feed with
+    nothing buffered costs one dict entry and 8 bytes for its last
+    timestamp."""
+
+    def __init__(self, lateness: float = 1.0, max_buffered: int = 64):
+        self._lateness: float = lateness
+        self._max_buffered: int = max_buffered
+        self._lock: threading.Lock = threading.Lock()
+        # feed key -> index in '_last_emitted'
+        self._feeds: Dict[Hashable, int] = {}
+        self._last_emitted: array = array("d")
+        # Feeds with values held: feed key -> [(timestamp, due at, value), ...]
+        # sorted by timestamp
+        self._buffers: Dict[Hashable, List[Tuple[float, float, object]]] = {}
+        # The timestamps of '_buffers' alone, for 'bisect' (its 'key' needs 3.10)
+        self._buffer_timestamps: Dict[Hashable, List[float]] = {}
+        # (due at, sequence, feed key) of the values held, stale entries are skipped
+        self._due: List[Tuple[float, int, Hashable]] = []
+        self._sequence = itertools.count()
+        self._buffered: int = 0
+
+        self._emitted: int = 0
+        self._duplicates: int = 0
+        self._late: int = 0
+        self._reordered: int = 0
+        self._forced: int = 0
+
+    def _feed_index(self, feed: Hashable) -> int:
+        index: Optional[int] = self._feeds.get(feed)
+        if index is None:
+            index = self._feeds[feed] = len(self._last_emitted)
+            self._last_emitted.append(float("-inf"))
+
+        return index
+
+    def add(
+        self,
+        feed: Hashable,
+        timestamp: Union[float, str, datetime],
+        value,
+        now: Optional[float] = None,
+    ) -> List[Emitted]:
+        """Add a value and return the values due, this one or others"""
+
+        timestamp = timestamp_seconds(timestamp)
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            index: int = self._feed_index(feed)
+            last_emitted: float = self._last_emitted[index]
+            if timestamp <= last_emitted:
+                if timestamp == last_emitted:
+                    self._duplicates += 1
+                else:
+                    self._late += 1
+                return self._pop_due(now)
+
+            if self._lateness <= 0:
+                self._last_emitted[index] = timestamp
+                self._emitted += 1
+                return [(feed, timestamp, value)] + self._pop_due(now)
+
+            values = self._buffers.get(feed)
+            if values is None:
+                values = self._buffers[feed] = []
+                self._buffer_timestamps[feed] = []
+            timestamps: List[float] = self._buffer_timestamps[feed]
+            position: int = bisect_right(timestamps, timestamp)
+            if position and timestamps[position - 1] == timestamp:
+                self._duplicates += 1
+                return self._pop_due(now)
+            if position < len(values):
+                self._reordered += 1
+
+            due_at: float = now + self._lateness
+            timestamps.insert(position, timestamp)
+            values.insert(position, (timestamp, due_at, value))
+            heapq.heappush(self._due, (due_at, next(self._sequence), feed))
+            self._buffered += 1
+
+            emitted: List[Emitted] = []
+            if len(values) > self._max_buffered:
+                self._forced += 1
+                self._emit(feed, values, 1, emitted)
+
+            return emitted + self._pop_due(now)
+
+    def _emit(
+        self,
+        feed: Hashable,
+        values: List[Tuple[float, float, object]],
+        count: int,
+        emitted: List[Emitted],
+    ):
+        for timestamp, _, value in values[:count]:
+            emitted.append((feed, timestamp, value))
+        self._last_emitted[self._feeds[feed]] = values[count - 1][0]
+        del values[:count]
+        del self._buffer_timestamps[feed][:count]
+        self._buffered -= count
+        self._emitted += count
+        if not values:
+            del self._buffers[feed]
+            del self._buffer_timestamps[feed]
+
+    def _pop_due(self, now: float) -> List[Emitted]:
+        emitted: List[Emitted] = []
+        while self._due and self._due[0][0] <= now:
+            _, _, feed = heapq.heappop(self._due)
+            values = self._buffers.get(feed)
+            if not values:
+                continue
+
+            # Up to the last value due: the ones before it were shared earlier
+            count: int = 0
+            for position, (_, due_at, _) in enumerate(values, start=1):
+                if due_at <= now:
+                    count = position
+            if count:
+                self._emit(feed, values, count, emitted)
+
+        return emitted
+
+    def poll(self, now: Optional[float] = None) -> List[Emitted]:
+        """The values whose 'lateness' is over"""
+
+        with self._lock:
+            return self._pop_due(time.monotonic() if now is None else now)
+
+    def next_due(self) -> Optional[float]:
+        """time.monotonic() at which 'poll' has values to emit, if any"""
+
+        with self._lock:
+            while self._due and not self._buffers.get(self._due[0][2]):
+                heapq.heappop(self._due)
+
+            return self._due[0][0] if self._due else None
+
+    def flush(self) -> List[Emitted]:
+        """All the values held, e.g. before stopping"""
+
+        with self._lock:
+            emitted: List[Emitted] = []
+            for feed, values in list(self._buffers.items()):
+                self._emit(feed, values, len(values), emitted)
+            self._due.clear()
+
+            return emitted
+
+    def stats(self) -> ReorderStats:
+        with self._lock:
+            return ReorderStats(
+                feeds=len(self._feeds),
+                buffered=self._buffered,
+                emitted=self._emitted,
+                duplicates=self._duplicates,
+                late=self._late,
+                reordered=self._reordered,
+                forced=self._forced,
+            )
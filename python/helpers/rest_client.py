@@ -0,0 +1,286 @@
+import logging
+import random
+import time
+from typing import Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from helpers.constants import RestEndpoint
+from helpers.metrics import Metrics, endpoint_label, get_metrics
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Methods a failed call can be retried for whatever happened: the others,
+# e.g. the POST of a share, may have been processed before failing
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def jittered_backoff(attempt: int, backoff_factor: float, backoff_max: float) -> float:
+    # "Full jitter": sleep a random time up to the exponential backoff
+    # so that many clients retrying at once don't hit the host together
+    return random.uniform(0, min(backoff_max, backoff_factor * 2**attempt))
+
+
+def _not_connected(ex: BaseException) -> bool:
+    """Whether 'ex' means that no connection could be made, so that the
+    request can't have reached the host: a connect timeout, or a refused
+    connection or a failed DNS lookup, which requests raises as a plain
+    ConnectionError wrapping a urllib3 NewConnectionError"""
+
+    seen: set = set()
+    pending: list = [ex]
+    while pending:
+        error = pending.pop()
+        if not isinstance(error, BaseException) or id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(
+            error, (requests.ConnectTimeout, NewConnectionError, ConnectTimeoutError)
+        ):
+            return True
+        # requests wraps urllib3's MaxRetryError, whose 'reason' is the cause
+        pending.extend(error.args)
+        pending.extend(
+            (getattr(error, "reason", None), error.__cause__, error.__context__)
+        )
+
+    return False
+
+
+class RestClientError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code: Optional[int] = status_code
+
+
+class RestClient:
+    """Session-backed REST client. Connections to each host are kept alive
+    and reused across calls, so only the first call to a host pays for the
+    TCP+TLS handshake. Failed calls are retried with jittered exponential
+    backoff and a RestClientError is raised once the retries run out.
+
+    Only the calls of 'retry_methods' are retried on any connection error
+    or 'retry_status_codes'. The others, e.g. a POST that would share the
+    same value twice, are only retried when the host can't have processed
+    them: a connection that couldn't be made, or a 429. 'retry' overrides
+    this per call, e.g. for a search, which is a POST but reads only."""
+
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.2,
+        backoff_max: float = 10.0,
+        timeout: float = 30.0,
+        retry_status_codes: Iterable[int] = RETRY_STATUS_CODES,
+        retry_methods: Iterable[str] = IDEMPOTENT_METHODS,
+    ):
+        self._session: requests.Session = requests.Session()
+        # One pool per host, 'pool_maxsize' keep-alive connections per pool
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        if headers:
+            self._session.headers.update(headers)
+
+        self._max_retries: int = max_retries
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+        self._timeout: float = timeout
+        self._retry_status_codes: frozenset = frozenset(retry_status_codes)
+        self._retry_methods: frozenset = frozenset(retry_methods)
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[dict] = None,
+        payload: Optional[dict] = None,
+        params: Optional[dict] = None,
+        stream: bool = False,
+        data: Optional[bytes] = None,
+        retry: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> requests.Response:
+        """'data' is an already serialised JSON body, sent instead of 'payload'.
+        'retry' True or False overrides 'retry_methods' for this call, and
+        'timeout' and 'max_retries' the client's settings."""
+
+        if retry is None:
+            retry = method in self._retry_methods
+
+        if data is not None:
+            headers = {"Content-Type": "application/json", **(headers or {})}
+
+        metrics: Optional[Metrics] = get_metrics()
+        if metrics is None:
+            return self._send(
+                method,
+                url,
+                headers,
+                payload,
+                params,
+                stream,
+                data,
+                retry,
+                timeout,
+                max_retries,
+            )
+
+        endpoint: str = endpoint_label(method, url)
+        start: float = time.perf_counter()
+        try:
+            resp: requests.Response = self._send(
+                method,
+                url,
+                headers,
+                payload,
+                params,
+                stream,
+                data,
+                retry,
+                timeout,
+                max_retries,
+            )
+        except RestClientError as ex:
+            metrics.rest_call(
+                endpoint,
+                time.perf_counter() - start,
+                status=str(ex.status_code or "error"),
+            )
+            raise
+
+        metrics.rest_call(
+            endpoint,
+            time.perf_counter() - start,
+            status=str(resp.status_code),
+            request_bytes=len(resp.request.body or b""),
+            # A streamed body is counted by its reader
+            response_bytes=0 if stream else len(resp.content),
+        )
+
+        return resp
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[dict],
+        payload: Optional[dict],
+        params: Optional[dict],
+        stream: bool,
+        data: Optional[bytes] = None,
+        retry: bool = True,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> requests.Response:
+        if timeout is None:
+            timeout = self._timeout
+        if max_retries is None:
+            max_retries = self._max_retries
+        attempt: int = 0
+
+        while True:
+            try:
+                resp: requests.Response = self._session.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    json=payload,
+                    data=data,
+                    params=params,
+                    stream=stream,
+                    timeout=timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                # A read timeout or a reset may come after the host processed it
+                if attempt >= max_retries or not (retry or _not_connected(ex)):
+                    raise RestClientError(f"{method} {url} failed: {ex}") from ex
+                logging.warning("%s %s failed (%s), retrying", method, url, ex)
+            else:
+                if resp.ok:
+                    return resp
+
+                if (
+                    resp.status_code not in self._retry_status_codes
+                    or (not retry and resp.status_code != 429)
+                    or attempt >= max_retries
+                ):
+                    message: str = (
+                        f"{method} {url} failed: {resp.status_code} {resp.reason}"
+                    )
+                    resp.close()
+                    raise RestClientError(message, status_code=resp.status_code)
+
+                logging.warning(
+                    "%s %s returned %s, retrying", method, url, resp.status_code
+                )
+                resp.close()
+
+            metrics: Optional[Metrics] = get_metrics()
+            if metrics:
+                metrics.inc("rest_retries_total", endpoint=endpoint_label(method, url))
+            time.sleep(
+                jittered_backoff(attempt, self._backoff_factor, self._backoff_max)
+            )
+            attempt += 1
+
+    def call(
+        self,
+        endpoint: RestEndpoint,
+        headers: Optional[dict] = None,
+        payload: Optional[dict] = None,
+        params: Optional[dict] = None,
+        retry: Optional[bool] = None,
+        **url_params,
+    ) -> dict:
+        """Dispatch one of the RestEndpoint constants, e.g.
+        client.call(SHARE_FEED_DATA, headers, payload, host=..., twin_id=..., feed_id=...)
+        """
+
+        if not endpoint.method:
+            raise ValueError(f"{endpoint.url} is a STOMP topic, not a REST endpoint")
+
+        resp: requests.Response = self.request(
+            method=endpoint.method,
+            url=endpoint.url.format(**url_params),
+            headers=headers,
+            payload=payload,
+            params=params,
+            retry=retry,
+        )
+
+        return resp.json() if resp.content else {}
+
+    def close(self):
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_client: Optional[RestClient] = None
+
+
+def get_default_client() -> RestClient:
+    """Return the RestClient shared by the helpers in 'helpers.utilities'."""
+
+    global _default_client
+
+    if _default_client is None:
+        _default_client = RestClient()
+
+    return _default_client
@@ -0,0 +1,176 @@
+from collections import namedtuple
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from helpers.constants import SEARCH_CACHE_TTL
+from helpers.utilities import iter_search_twins
+
+SearchDiff = namedtuple(
+    "SearchDiff", ["twins", "added", "removed", "changed", "from_cache"]
+)
+
+# (host_id, twin_id)
+TwinKey = Tuple[str, str]
+
+
+def twin_key(twin: dict, host_id: Optional[str] = None) -> TwinKey:
+    return (twin["twinId"].get("hostId") or host_id, twin["twinId"]["id"])
+
+
+def search_key(method: str, endpoint: str, payload: dict, scope: str) -> str:
+    """Same key for the same search, whatever the order of its properties"""
+
+    payload = json.loads(json.dumps(payload))
+    search_filter: dict = payload.get("filter", {})
+    if "properties" in search_filter:
+        search_filter["properties"].sort(key=lambda p: json.dumps(p, sort_keys=True))
+
+    normalised: str = json.dumps(
+        [method.upper(), endpoint, scope.upper(), payload],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+
+    return hashlib.sha256(normalised.encode()).hexdigest()
+
+
+class _Entry:
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.searched_at: float = 0
+        # twin key -> twin as returned by the search
+        self.twins: Dict[TwinKey, dict] = {}
+        # twin key -> hash of the twin, to tell the changed ones
+        self.hashes: Dict[TwinKey, str] = {}
+        # twin key -> consecutive searches the twin was missing from
+        self.missing: Dict[TwinKey, int] = {}
+
+
+class SearchCache:
+    """Runs a search at most once every 'ttl' seconds and tells what changed
+    since the previous run, so that a connector re-running the same search
+    to discover twins only subscribes to the new ones and unsubscribes from
+    the vanished ones:
+
+        diff = cache.search(SEARCH_TWINS.method, url, headers, payload, "LOCAL")
+        for twin in diff.added: ...subscribe
+        for twin in diff.removed: ...unsubscribe
+
+    Searches are keyed by method, endpoint, scope and payload, regardless
+    of the order of the keys and of the filter's properties. Within the TTL
+    the cached twins are returned with an empty diff and 'from_cache' set.
+
+    A twin is only reported 'removed' once it has been missing from
+    'removed_after' consecutive searches, so that a host that didn't answer
+    a GLOBAL search in time doesn't make all its twins vanish. Until then
+    it is still in 'twins'."""
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, removed_after: int = 1):
+        self._ttl: float = ttl
+        self._removed_after: int = removed_after
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+
+    def search(
+        self,
+        method: str,
+        endpoint: str,
+        headers: dict,
+        payload: dict,
+        scope: str,
+        force: bool = False,
+    ) -> SearchDiff:
+        """Twins found by the search, as a SearchDiff of lists of twins.
+        'force' runs the search even if the cached result is fresh."""
+
+        key: str = search_key(method, endpoint, payload, scope)
+        with self._lock:
+            entry: _Entry = self._entries.setdefault(key, _Entry())
+
+        # Only one thread runs a given search, the others wait and reuse its result
+        with entry.lock:
+            if not force and time.time() - entry.searched_at < self._ttl:
+                return SearchDiff(
+                    twins=list(entry.twins.values()),
+                    added=[],
+                    removed=[],
+                    changed=[],
+                    from_cache=True,
+                )
+
+            found: Dict[TwinKey, dict] = {}
+            for batch in iter_search_twins(
+                method=method,
+                endpoint=endpoint,
+                headers=headers,
+                payload=payload,
+                scope=scope,
+            ):
+                for twin in batch.twins:
+                    found[twin_key(twin, batch.host_id)] = twin
+
+            return self._update(entry, found)
+
+    def _update(self, entry: _Entry, found: Dict[TwinKey, dict]) -> SearchDiff:
+        added: List[dict] = []
+        changed: List[dict] = []
+        removed: List[dict] = []
+
+        for key, twin in found.items():
+            twin_hash: str = hashlib.sha256(
+                json.dumps(twin, sort_keys=True).encode()
+            ).hexdigest()
+            previous_hash: Optional[str] = entry.hashes.get(key)
+            if previous_hash is None:
+                added.append(twin)
+            elif previous_hash != twin_hash:
+                changed.append(twin)
+            entry.twins[key] = twin
+            entry.hashes[key] = twin_hash
+            entry.missing.pop(key, None)
+
+        for key in [key for key in entry.twins if key not in found]:
+            entry.missing[key] = entry.missing.get(key, 0) + 1
+            if entry.missing[key] >= self._removed_after:
+                removed.append(entry.twins.pop(key))
+                del entry.hashes[key]
+                del entry.missing[key]
+
+        entry.searched_at = time.time()
+
+        return SearchDiff(
+            twins=list(entry.twins.values()),
+            added=added,
+            removed=removed,
+            changed=changed,
+            from_cache=False,
+        )
+
+    def invalidate(
+        self,
+        method: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        payload: Optional[dict] = None,
+        scope: Optional[str] = None,
+    ):
+        """Make the next run of a search, or of all of them if no search is
+        given, go to the space. The previous results are kept to diff against."""
+
+        with self._lock:
+            if method is None:
+                entries = list(self._entries.values())
+            else:
+                entry = self._entries.get(search_key(method, endpoint, payload, scope))
+                entries = [entry] if entry else []
+
+        for entry in entries:
+            entry.searched_at = 0
+
+    def forget(self):
+        """Drop the cached results: the next searches report all twins as added"""
+
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,260 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from helpers.codec import JSON_CODEC
+from helpers.constants import SHARE_FEED_DATA
+from helpers.rest_client import RestClient, RestClientError
+from helpers.share_spool import ShareSpool, spool_share
+
+ShareEngineStats = namedtuple(
+    "ShareEngineStats",
+    [
+        "queue_depth",
+        "queued",
+        "shared",
+        "dropped",
+        "coalesced",
+        "failed",
+        "spooled",
+        "flushes",
+        "last_flush_size",
+        "max_flush_size",
+    ],
+)
+
+
+class ShareEngine:
+    """Background engine for SHARE_FEED_DATA. 'share' can be called from any
+    thread and only queues the value. A flusher thread groups the queued values
+    per feed and flushes them when 'max_batch_size' values are queued or
+    'flush_interval' seconds have passed, whichever comes first. Each flush
+    shares the feeds concurrently over the pooled connections of a RestClient,
+    keeping the order of the values within each feed.
+
+    Knobs:
+    - flush_interval: lower values mean lower latency, higher values bigger flushes;
+    - max_batch_size: number of queued values that triggers an early flush;
+    - max_workers: number of feeds shared concurrently;
+    - max_pending: queued values above which new values are dropped;
+    - coalesce: only share the latest value of each feed per flush;
+    - codec: payload codec, see 'helpers.codec';
+    - spool: ShareSpool the values that can't be shared are written to,
+      instead of being counted as failed, see 'helpers.share_spool'.
+    """
+
+    def __init__(
+        self,
+        host_url: str,
+        headers: dict,
+        client: Optional[RestClient] = None,
+        flush_interval: float = 0.1,
+        max_batch_size: int = 1000,
+        max_workers: int = 16,
+        max_pending: int = 100000,
+        coalesce: bool = False,
+        codec=JSON_CODEC,
+        spool: Optional[ShareSpool] = None,
+    ):
+        self._host_url: str = host_url
+        self._headers: dict = headers
+        self._client: RestClient = client or RestClient(pool_maxsize=max_workers)
+        self._flush_interval: float = flush_interval
+        self._max_batch_size: int = max_batch_size
+        self._max_pending: int = max_pending
+        self._coalesce: bool = coalesce
+        self._codec = codec
+        self._spool: Optional[ShareSpool] = spool
+
+        self._max_workers: int = max_workers
+        # Made by 'start' and shut down by 'stop', so the engine can be restarted
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._condition: threading.Condition = threading.Condition()
+        # (twin_id, feed_id) -> [(value, timestamp), ...] in arrival order
+        self._pending: Dict[Tuple[str, str], List[Tuple[dict, str]]] = {}
+        self._pending_count: int = 0
+        self._running: bool = False
+        self._stopped: bool = False
+        self._flusher: Optional[threading.Thread] = None
+
+        self._stats_lock: threading.Lock = threading.Lock()
+        self._queued: int = 0
+        self._shared: int = 0
+        self._dropped: int = 0
+        self._coalesced: int = 0
+        self._failed: int = 0
+        self._spooled: int = 0
+        self._flushes: int = 0
+        self._last_flush_size: int = 0
+        self._max_flush_size: int = 0
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="share_engine"
+        )
+        self._running = True
+        self._stopped = False
+        self._flusher = threading.Thread(
+            target=self._run, name="share_engine_flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def stop(self):
+        """Flush whatever is still queued and stop the engine."""
+
+        with self._condition:
+            self._running = False
+            # Nothing would flush the values shared from now on
+            self._stopped = True
+            self._condition.notify()
+
+        if self._flusher:
+            self._flusher.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def share(
+        self, twin_id: str, feed_id: str, value: dict, timestamp: Optional[str] = None
+    ) -> bool:
+        """Queue a value to be shared. Returns False if it was dropped
+        because the engine already has 'max_pending' values queued or
+        because it is stopped."""
+
+        if timestamp is None:
+            timestamp = datetime.now(tz=timezone.utc).isoformat()
+
+        with self._condition:
+            if self._stopped:
+                self._dropped += 1
+                return False
+
+            feed_values = self._pending.get((twin_id, feed_id))
+
+            if self._coalesce and feed_values:
+                # The new value replaces the queued one, the queue doesn't grow
+                feed_values[0] = (value, timestamp)
+                self._queued += 1
+                self._coalesced += 1
+                return True
+
+            if self._pending_count >= self._max_pending:
+                self._dropped += 1
+                return False
+
+            if feed_values is None:
+                self._pending[(twin_id, feed_id)] = [(value, timestamp)]
+            else:
+                feed_values.append((value, timestamp))
+            self._pending_count += 1
+            self._queued += 1
+
+            if self._pending_count >= self._max_batch_size:
+                self._condition.notify()
+
+        return True
+
+    def stats(self) -> ShareEngineStats:
+        with self._condition, self._stats_lock:
+            return ShareEngineStats(
+                queue_depth=self._pending_count,
+                queued=self._queued,
+                shared=self._shared,
+                dropped=self._dropped,
+                coalesced=self._coalesced,
+                failed=self._failed,
+                spooled=self._spooled,
+                flushes=self._flushes,
+                last_flush_size=self._last_flush_size,
+                max_flush_size=self._max_flush_size,
+            )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._running and self._pending_count < self._max_batch_size:
+                    self._condition.wait(timeout=self._flush_interval)
+
+                pending, self._pending = self._pending, {}
+                flush_size, self._pending_count = self._pending_count, 0
+                running: bool = self._running
+
+            if pending:
+                self._flush(pending, flush_size)
+
+            if not running:
+                return
+
+    def _flush(self, pending: dict, flush_size: int):
+        with self._stats_lock:
+            self._flushes += 1
+            self._last_flush_size = flush_size
+            self._max_flush_size = max(self._max_flush_size, flush_size)
+
+        # Waiting for the whole flush before starting the next one gives
+        # backpressure: while the space is slow the values pile up in
+        # '_pending' and get dropped once 'max_pending' is reached.
+        wait(
+            [
+                self._executor.submit(self._share_feed, twin_id, feed_id, feed_values)
+                for (twin_id, feed_id), feed_values in pending.items()
+            ]
+        )
+
+    def _share_feed(self, twin_id: str, feed_id: str, feed_values: list):
+        url: str = SHARE_FEED_DATA.url.format(
+            host=self._host_url, twin_id=twin_id, feed_id=feed_id
+        )
+
+        for (_, timestamp), data in zip(
+            feed_values, self._codec.encode_many(value for value, _ in feed_values)
+        ):
+            payload: dict = {
+                "sample": {
+                    "data": data,
+                    "mime": self._codec.mime,
+                    "timestamp": timestamp,
+                }
+            }
+
+            if self._spool is not None:
+                try:
+                    shared: bool = spool_share(
+                        self._spool, self._client, url, self._headers, payload
+                    )
+                except RestClientError:
+                    # Refused by the space, not worth spooling
+                    with self._stats_lock:
+                        self._failed += 1
+                    continue
+                with self._stats_lock:
+                    if shared:
+                        self._shared += 1
+                    else:
+                        self._spooled += 1
+                continue
+
+            try:
+                self._client.request(
+                    method=SHARE_FEED_DATA.method,
+                    url=url,
+                    headers=self._headers,
+                    payload=payload,
+                )
+            except RestClientError as ex:
+                logging.error("Can't share data to %s: %s", url, ex)
+                with self._stats_lock:
+                    self._failed += 1
+            else:
+                with self._stats_lock:
+                    self._shared += 1
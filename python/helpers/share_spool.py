@@ -0,0 +1,447 @@
+from collections import namedtuple
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import zlib
+
+from helpers.constants import SHARE_FEED_DATA
+from helpers.rate_limiter import RateLimiter
+from helpers.rest_client import (
+    RETRY_STATUS_CODES,
+    RestClient,
+    RestClientError,
+    get_default_client,
+    jittered_backoff,
+)
+
+SpoolStats = namedtuple(
+    "SpoolStats", ["pending", "segments", "written", "replayed", "dropped"]
+)
+
+# Length and CRC32 of the record; a zero length marks the end of a segment
+_RECORD_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".spool"
+_CURSOR_FILE = "cursor.json"
+
+# (segment number, offset in the segment) of a record
+Position = Tuple[int, int]
+
+
+class _Segment:
+    def __init__(self, path: str, number: int, size: int, create: bool):
+        self.path: str = path
+        self.number: int = number
+        with open(path, "w+b" if create else "r+b") as segment_file:
+            if create:
+                segment_file.truncate(size)
+            self.map: mmap.mmap = mmap.mmap(segment_file.fileno(), 0)
+        # Offset the next record is written at
+        self.end: int = 0
+
+    def records(self, offset: int = 0):
+        """(offset, next offset, body) of the records from 'offset'"""
+
+        while offset + _RECORD_HEADER.size <= len(self.map):
+            length, crc = _RECORD_HEADER.unpack_from(self.map, offset)
+            body_start: int = offset + _RECORD_HEADER.size
+            if length == 0 or body_start + length > len(self.map):
+                return
+            body: bytes = self.map[body_start : body_start + length]
+            if zlib.crc32(body) != crc:
+                # Torn write of a crash: the segment ends here
+                return
+            yield offset, body_start + length, body
+            offset = body_start + length
+
+    def close(self):
+        self.map.close()
+
+
+class ShareSpool:
+    """Append-only write-ahead spool of the feed shares that couldn't be
+    made, so that they are replayed instead of lost when the space is
+    unreachable. Records are written to memory-mapped segment files of
+    'segment_size' bytes in 'directory'; at most 'max_segments' of them are
+    kept, the oldest one being dropped (and its records counted in
+    'dropped') when a new one is needed. The replay position is saved in
+    the directory too, so that a restarted publisher replays what is left.
+    Replay is at-least-once: after a crash the last records replayed may
+    be replayed again.
+
+    A record is the URL of a SHARE_FEED_DATA call and its payload. Once a
+    feed has records in the spool, 'has_pending' is True for its URL and
+    its new values must be spooled too, so that they are shared in order;
+    the feeds that have nothing in the spool are shared directly and the
+    spool isn't touched. See 'SpoolReplayer' to drain it.
+
+    The spool is also a circuit breaker: after 'mark_down', 'is_down' is
+    True for 'down_interval' seconds, or until a replay succeeds, and all
+    the shares are spooled without trying the space first."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 64 * 1024 * 1024,
+        max_segments: int = 16,
+        down_interval: float = 5.0,
+    ):
+        self._directory: str = directory
+        self._segment_size: int = segment_size
+        self._max_segments: int = max_segments
+        self._down_interval: float = down_interval
+        # time.monotonic() until which the space is considered down
+        self._down_until: float = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        # URL -> number of its records not replayed yet
+        self._pending: Dict[str, int] = {}
+        self._pending_count: int = 0
+        self._read_position: Position = (0, 0)
+        self._cursor_saved_at: float = 0
+
+        self._written: int = 0
+        self._replayed: int = 0
+        self._dropped: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self._directory, f"{number:010d}{_SEGMENT_SUFFIX}")
+
+    def _load(self):
+        try:
+            with open(
+                os.path.join(self._directory, _CURSOR_FILE), encoding="utf-8"
+            ) as cursor_file:
+                cursor: dict = json.load(cursor_file)
+            self._read_position = (cursor["segment"], cursor["offset"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        numbers: List[int] = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self._directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        for number in numbers:
+            if number < self._read_position[0]:
+                # Fully replayed before a crash
+                os.remove(self._segment_path(number))
+                continue
+
+            segment = _Segment(
+                self._segment_path(number), number, self._segment_size, create=False
+            )
+            start: int = (
+                self._read_position[1] if number == self._read_position[0] else 0
+            )
+            for offset, end, body in segment.records():
+                segment.end = end
+                if offset >= start:
+                    self._count(json.loads(body)["url"], 1)
+            self._segments.append(segment)
+
+        if self._segments and self._read_position[0] < self._segments[0].number:
+            self._read_position = (self._segments[0].number, 0)
+
+    def _count(self, url: str, delta: int):
+        count: int = self._pending.get(url, 0) + delta
+        if count > 0:
+            self._pending[url] = count
+        else:
+            self._pending.pop(url, None)
+        self._pending_count += delta
+
+    def _new_segment(self) -> _Segment:
+        number: int = self._segments[-1].number + 1 if self._segments else 1
+        segment = _Segment(
+            self._segment_path(number), number, self._segment_size, create=True
+        )
+        self._segments.append(segment)
+        if len(self._segments) == 1:
+            self._read_position = (number, 0)
+
+        while len(self._segments) > self._max_segments:
+            self._drop_oldest()
+
+        return segment
+
+    def _drop_oldest(self):
+        segment: _Segment = self._segments.pop(0)
+        start: int = (
+            self._read_position[1] if segment.number == self._read_position[0] else 0
+        )
+        dropped: int = 0
+        if segment.number >= self._read_position[0]:
+            for offset, _, body in segment.records():
+                if offset >= start:
+                    self._count(json.loads(body)["url"], -1)
+                    dropped += 1
+        self._dropped += dropped
+        logging.warning(
+            "Share spool full: dropped %s shares of segment %s", dropped, segment.number
+        )
+
+        segment.close()
+        os.remove(segment.path)
+        if self._read_position[0] <= segment.number:
+            self._read_position = (self._segments[0].number, 0)
+            self._save_cursor()
+
+    def _save_cursor(self):
+        path: str = os.path.join(self._directory, _CURSOR_FILE)
+        tmp_path: str = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cursor_file:
+            json.dump(
+                {"segment": self._read_position[0], "offset": self._read_position[1]},
+                cursor_file,
+            )
+        os.replace(tmp_path, path)
+        self._cursor_saved_at = time.monotonic()
+
+    def append(self, url: str, payload: dict):
+        body: bytes = json.dumps(
+            {"url": url, "payload": payload}, separators=(",", ":")
+        ).encode()
+        size: int = _RECORD_HEADER.size + len(body)
+        if size + _RECORD_HEADER.size > self._segment_size:
+            raise ValueError(f"A {len(body)} bytes share doesn't fit in a segment")
+
+        with self._lock:
+            segment: Optional[_Segment] = self._segments[-1] if self._segments else None
+            # Room is left for the zero length that ends the segment
+            if segment is None or segment.end + size + _RECORD_HEADER.size > len(
+                segment.map
+            ):
+                if segment:
+                    segment.map.flush()
+                segment = self._new_segment()
+
+            # The body first: a crash can't leave a valid header without its body
+            segment.map[segment.end + _RECORD_HEADER.size : segment.end + size] = body
+            _RECORD_HEADER.pack_into(
+                segment.map, segment.end, len(body), zlib.crc32(body)
+            )
+            segment.end += size
+            self._count(url, 1)
+            self._written += 1
+
+    def has_pending(self, url: str) -> bool:
+        # Lock-free: a dict lookup, the only cost for the feeds not spooled
+        return url in self._pending
+
+    def __len__(self) -> int:
+        return self._pending_count
+
+    def mark_down(self):
+        """The space can't be reached: spool everything for a while"""
+
+        self._down_until = time.monotonic() + self._down_interval
+
+    def mark_up(self):
+        self._down_until = 0
+
+    def is_down(self) -> bool:
+        # Lock-free, like 'has_pending'
+        return time.monotonic() < self._down_until
+
+    def peek(self) -> Optional[Tuple[Position, str, dict]]:
+        """The oldest record not replayed yet, None if there is none"""
+
+        with self._lock:
+            while self._segments:
+                number, offset = self._read_position
+                segment: _Segment = self._segments[0]
+                if number == segment.number:
+                    for _, end, body in segment.records(offset):
+                        record: dict = json.loads(body)
+                        return (number, end), record["url"], record["payload"]
+
+                if len(self._segments) == 1:
+                    return None
+
+                # Replayed to the end of the segment, on to the next one
+                self._segments.pop(0)
+                segment.close()
+                os.remove(segment.path)
+                self._read_position = (self._segments[0].number, 0)
+                self._save_cursor()
+
+        return None
+
+    def commit(self, position: Position, url: str, replayed: bool = True):
+        """Mark the record returned by 'peek' as done. A no-op if its segment
+        was dropped in the meantime to make room: the record was already
+        counted in 'dropped' and the read position has moved past it."""
+
+        with self._lock:
+            # Segment numbers only grow, so a dropped segment compares lower
+            if position <= self._read_position:
+                return
+            self._read_position = position
+            self._count(url, -1)
+            if replayed:
+                self._replayed += 1
+            # Saved at most once a second: a crash replays the last ones again
+            if time.monotonic() - self._cursor_saved_at > 1:
+                self._save_cursor()
+
+    def stats(self) -> SpoolStats:
+        with self._lock:
+            return SpoolStats(
+                pending=self._pending_count,
+                segments=len(self._segments),
+                written=self._written,
+                replayed=self._replayed,
+                dropped=self._dropped,
+            )
+
+    def close(self):
+        with self._lock:
+            self._save_cursor()
+            for segment in self._segments:
+                segment.map.flush()
+                segment.close()
+            self._segments = []
+
+
+class SpoolReplayer:
+    """Drains a ShareSpool in the background at up to 'rate' shares per
+    second, in the order they were spooled, so the order of each feed is
+    kept. While the space can't be reached the replay waits with jittered
+    backoff and retries the same share; a share the space refuses for good
+    (e.g. 404 for a deleted twin) is logged and skipped.
+
+    'headers' is read on every call: pass the dict tracked by a
+    TokenManager (see 'generate_headers') to replay with a fresh token."""
+
+    def __init__(
+        self,
+        spool: ShareSpool,
+        headers: dict,
+        rate: float = 100,
+        client: Optional[RestClient] = None,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30.0,
+        idle_interval: float = 1.0,
+    ):
+        self._spool: ShareSpool = spool
+        self._headers: dict = headers
+        self._rate_limiter: RateLimiter = RateLimiter(rate)
+        self._client: Optional[RestClient] = client
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+        self._idle_interval: float = idle_interval
+        self._stop: threading.Event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="spool_replayer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        client: RestClient = self._client or get_default_client()
+        attempt: int = 0
+
+        while not self._stop.is_set():
+            record = self._spool.peek()
+            if record is None:
+                self._stop.wait(timeout=self._idle_interval)
+                continue
+
+            position, url, payload = record
+            self._rate_limiter.acquire()
+            try:
+                client.request(
+                    method=SHARE_FEED_DATA.method,
+                    url=url,
+                    headers=self._headers,
+                    payload=payload,
+                )
+            except RestClientError as ex:
+                if ex.status_code is not None and ex.status_code not in (
+                    RETRY_STATUS_CODES
+                ):
+                    logging.error("Dropping spooled share to %s: %s", url, ex)
+                    self._spool.commit(position, url, replayed=False)
+                    continue
+
+                self._spool.mark_down()
+                attempt += 1
+                logging.warning("Can't replay the spooled shares yet: %s", ex)
+                self._stop.wait(
+                    timeout=jittered_backoff(
+                        attempt, self._backoff_factor, self._backoff_max
+                    )
+                )
+                continue
+
+            attempt = 0
+            self._spool.mark_up()
+            self._spool.commit(position, url)
+
+
+def spool_share(
+    spool: ShareSpool,
+    client: RestClient,
+    url: str,
+    headers: dict,
+    payload: dict,
+    timeout: float = 2.0,
+) -> bool:
+    """Share 'payload' to the SHARE_FEED_DATA 'url', or spool it. Returns
+    True if the value was shared directly.
+
+    It is spooled without a call if the feed already has spooled values or
+    the space is down. Otherwise one attempt is made, with a short
+    'timeout' and no retries, so a publisher isn't held up by an outage:
+    if it fails because the space can't be reached (a connection error,
+    429 or 5xx) the space is marked down and the value spooled. A share
+    the space refuses (e.g. 400, 401 or 404) would be refused again on
+    replay, so it isn't spooled: the RestClientError is raised."""
+
+    if spool.has_pending(url) or spool.is_down():
+        spool.append(url, payload)
+        return False
+
+    try:
+        client.request(
+            method=SHARE_FEED_DATA.method,
+            url=url,
+            headers=headers,
+            payload=payload,
+            retry=False,
+            timeout=timeout,
+            max_retries=0,
+        )
+    except RestClientError as ex:
+        if ex.status_code is not None and ex.status_code not in RETRY_STATUS_CODES:
+            logging.error("Can't share data to %s: %s", url, ex)
+            raise
+        logging.warning("Spooling the share to %s: %s", url, ex)
+        spool.mark_down()
+        spool.append(url, payload)
+        return False
+
+    return True
@@ -1,40 +1,436 @@
+from collections import namedtuple
 import json
-from typing import Callable
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
 import uuid
 
 import stomp
+from helpers.endpoint_registry import get_endpoint_registry
+from helpers.message_dispatcher import BLOCK, DispatcherStats, MessageDispatcher
+from helpers.metrics import Metrics, get_metrics
+from helpers.rest_client import jittered_backoff
 from iotic.web.stomp.client import StompWSConnection12
 
+ReconnectStats = namedtuple(
+    "ReconnectStats",
+    ["connections", "connected", "reconnects", "last_gap", "total_gap"],
+)
+
+
+def _topic_kind(destination: Optional[str]) -> str:
+    """Metrics label of a subscription: one series per kind of topic, not
+    per subscription, which would be thousands of series at scale"""
+
+    if not destination:
+        return "unknown"
+    if "/inputs/" in destination:
+        return "input"
+    if "/feeds/" in destination:
+        return "feed"
+
+    return "other"
+
+
+class _Connection:
+    def __init__(self, index: int):
+        self.index: int = index
+        self.stomp_connection: Optional[StompWSConnection12] = None
+        # subscription_id -> topic, replayed after a reconnect
+        self.subscriptions: Dict[str, str] = {}
+        self.connected: bool = False
+        self.reconnecting: bool = False
+
 
 class StompClient:
-    def __init__(self, stomp_endpoint: str, callback: Callable, token: str):
-        client_app_id: str = uuid.uuid4().hex
-        self._headers: dict = {"Iotics-ClientAppId": client_app_id}
-        self._stomp_connection: StompWSConnection12 = StompWSConnection12(
-            endpoint=stomp_endpoint, heartbeats=(10000, 10000), use_ssl=True
+    """Each 'subscribe' call can register its own callback: incoming frames
+    are routed to it by subscription id with a dict lookup. 'callback', if
+    given, is used for the subscriptions that don't have their own.
+
+    The callbacks run on a pool of 'workers' threads, never on the thread
+    reading the websocket, so slow processing doesn't delay the heartbeats.
+    Messages of the same subscription are handled in order. See
+    'helpers.message_dispatcher' for 'queue_size' and 'overflow_policy'.
+
+    All the subscriptions share one websocket connection until it has
+    'max_subscriptions_per_connection' of them; then a new connection is
+    opened, up to 'max_connections'.
+
+    'token' is either a token string or an object with a 'get_token' method
+    (e.g. a TokenManager or an Identity with 'start_token_refresh'). When a
+    connection drops it is reopened with exponential backoff and a token
+    from 'get_token', and its subscriptions are made again.
+    'on_reconnect(gap)', if given, is called with the seconds the
+    connection was down; frames shared in the meantime are lost.
+
+    If 'host_url' is given, the STOMP endpoint is looked up again in the
+    EndpointRegistry before each reconnect, so that a space whose endpoint
+    has moved is followed; 'stomp_endpoint' is then only used for the first
+    connection."""
+
+    def __init__(
+        self,
+        stomp_endpoint: str,
+        callback: Optional[Callable],
+        token,
+        workers: int = 4,
+        queue_size: int = 10000,
+        overflow_policy: str = BLOCK,
+        max_subscriptions_per_connection: Optional[int] = None,
+        max_connections: int = 4,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 30.0,
+        on_reconnect: Optional[Callable] = None,
+        host_url: Optional[str] = None,
+    ):
+        self._stomp_endpoint: str = stomp_endpoint
+        self._host_url: Optional[str] = host_url
+        self._callback: Optional[Callable] = callback
+        self._token = token
+        self._client_app_id: str = uuid.uuid4().hex
+        self._headers: dict = {"Iotics-ClientAppId": self._client_app_id}
+        self._max_subscriptions_per_connection: Optional[int] = (
+            max_subscriptions_per_connection
         )
-        self._stomp_connection.set_listener(
-            name=f"{client_app_id}_stomp_listener",
-            lstnr=StompListener(callback=callback),
+        self._max_connections: int = max_connections
+        self._backoff_factor: float = backoff_factor
+        self._backoff_max: float = backoff_max
+        self._on_reconnect: Optional[Callable] = on_reconnect
+
+        self._lock: threading.Lock = threading.Lock()
+        self._closing: threading.Event = threading.Event()
+        # subscription_id -> callback
+        self._routes: Dict[str, Callable] = {}
+        # subscription_id -> connection it was made on
+        self._subscription_connections: Dict[str, _Connection] = {}
+        self._connections: List[_Connection] = []
+        # Connections being opened by 'subscribe', outside the lock
+        self._opening: int = 0
+        self._connection_opened: threading.Condition = threading.Condition(self._lock)
+
+        self._reconnects: int = 0
+        self._last_gap: float = 0
+        self._total_gap: float = 0
+
+        self._dispatcher: MessageDispatcher = MessageDispatcher(
+            handler=self._route,
+            workers=workers,
+            queue_size=queue_size,
+            overflow_policy=overflow_policy,
         )
-        self._stomp_connection.connect(wait=True, passcode=token)
+        self._dispatcher.start()
+        self._add_connection()
+
+    def _get_token(self) -> str:
+        if isinstance(self._token, str):
+            return self._token
 
-    def subscribe(self, topic: str, subscription_id: str):
-        self._stomp_connection.subscribe(
-            destination=topic, id=subscription_id, headers=self._headers
+        return self._token.get_token()
+
+    def _open(self, connection: _Connection) -> StompWSConnection12:
+        stomp_connection = StompWSConnection12(
+            endpoint=self._stomp_endpoint,
+            heartbeats=(10000, 10000),
+            # IOTICSpaces are 'wss://', plain 'ws://' is for local mock hosts
+            use_ssl=not self._stomp_endpoint.startswith("ws://"),
+        )
+        stomp_connection.set_listener(
+            name=f"{self._client_app_id}_stomp_listener_{connection.index}",
+            lstnr=StompListener(
+                dispatcher=self._dispatcher,
+                on_disconnected=lambda: self._on_disconnected(
+                    connection, stomp_connection
+                ),
+            ),
         )
+        try:
+            stomp_connection.connect(wait=True, passcode=self._get_token())
+        except Exception:
+            self._close(stomp_connection)
+            raise
+
+        return stomp_connection
+
+    @staticmethod
+    def _close(stomp_connection: Optional[StompWSConnection12]):
+        """Disconnect a connection that is no longer used, which may be
+        half-open or already dropped"""
+
+        if stomp_connection is None:
+            return
+        try:
+            stomp_connection.disconnect()
+        except Exception as ex:
+            logging.debug("Can't disconnect a STOMP connection: %s", ex)
+
+    def _new_connection(self, index: int) -> _Connection:
+        connection = _Connection(index=index)
+        connection.stomp_connection = self._open(connection)
+        connection.connected = True
+
+        return connection
+
+    def _add_connection(self) -> _Connection:
+        connection: _Connection = self._new_connection(len(self._connections))
+        self._connections.append(connection)
+
+        return connection
+
+    def _get_connection(self) -> Optional[_Connection]:
+        """With the lock held: a connection with room for one more
+        subscription, or None if a new one must be opened"""
+
+        if self._max_subscriptions_per_connection is None:
+            return self._connections[0]
+
+        for connection in self._connections:
+            if len(connection.subscriptions) < self._max_subscriptions_per_connection:
+                return connection
+
+        if len(self._connections) >= self._max_connections:
+            raise RuntimeError(
+                f"All {self._max_connections} STOMP connections have "
+                f"{self._max_subscriptions_per_connection} subscriptions"
+            )
+
+        return None
+
+    def _route(self, headers: dict, body):
+        subscription_id: Optional[str] = headers.get("subscription")
+        callback: Optional[Callable] = self._routes.get(subscription_id)
+        if callback is None:
+            # A frame that was already in flight when its subscription was removed
+            logging.debug("No route for subscription %s", subscription_id)
+            return
+
+        metrics: Optional[Metrics] = get_metrics()
+        if metrics is None:
+            callback(headers, body)
+            return
+
+        start: float = time.perf_counter()
+        try:
+            callback(headers, body)
+        finally:
+            topic: str = _topic_kind(headers.get("destination"))
+            metrics.observe(
+                "stomp_callback_seconds", time.perf_counter() - start, topic=topic
+            )
+            metrics.inc("stomp_frames_total", topic=topic)
+            metrics.inc("stomp_frame_bytes_total", len(body or ""), topic=topic)
+
+    def _on_disconnected(
+        self, connection: _Connection, stomp_connection: StompWSConnection12
+    ):
+        with self._lock:
+            if stomp_connection is not connection.stomp_connection:
+                # A replaced connection, or one '_reconnect' is still opening
+                return
+            connection.connected = False
+            if self._closing.is_set() or connection.reconnecting:
+                return
+            connection.reconnecting = True
+
+        # Not on the listener's thread: it belongs to the connection being replaced
+        threading.Thread(
+            target=self._reconnect,
+            args=(connection,),
+            name=f"stomp_reconnect_{connection.index}",
+            daemon=True,
+        ).start()
+
+    def _reconnect(self, connection: _Connection):
+        disconnected_at: float = time.time()
+        attempt: int = 0
+
+        with self._lock:
+            dropped: Optional[StompWSConnection12] = connection.stomp_connection
+            connection.stomp_connection = None
+        self._close(dropped)
+
+        while not self._closing.wait(
+            timeout=jittered_backoff(attempt, self._backoff_factor, self._backoff_max)
+        ):
+            try:
+                if self._host_url:
+                    self._stomp_endpoint = get_endpoint_registry().resolve(
+                        self._host_url, "stomp"
+                    )
+                stomp_connection: StompWSConnection12 = self._open(connection)
+                try:
+                    with self._lock:
+                        for subscription_id, topic in connection.subscriptions.items():
+                            stomp_connection.subscribe(
+                                destination=topic,
+                                id=subscription_id,
+                                headers=self._headers,
+                            )
+                        # Its drop wasn't handled while it wasn't the current one
+                        if not stomp_connection.is_connected():
+                            raise ConnectionError("dropped while resubscribing")
+                        connection.stomp_connection = stomp_connection
+                        connection.connected = True
+                        connection.reconnecting = False
+                except Exception:
+                    self._close(stomp_connection)
+                    raise
+                break
+            except Exception as ex:
+                attempt += 1
+                if self._host_url:
+                    # The endpoint may have moved, fetch '/index.json' again next time
+                    get_endpoint_registry().invalidate(self._host_url)
+                logging.warning(
+                    "STOMP connection %s: reconnect attempt %s failed: %s",
+                    connection.index,
+                    attempt,
+                    ex,
+                )
+        else:
+            return
+
+        gap: float = time.time() - disconnected_at
+        metrics: Optional[Metrics] = get_metrics()
+        if metrics:
+            metrics.observe(
+                "stomp_reconnect_gap_seconds",
+                gap,
+                buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300),
+            )
+        with self._lock:
+            self._reconnects += 1
+            self._last_gap = gap
+            self._total_gap += gap
+        logging.info(
+            "STOMP connection %s: reconnected with %s subscriptions after %.1fs",
+            connection.index,
+            len(connection.subscriptions),
+            gap,
+        )
+        if self._on_reconnect:
+            self._on_reconnect(gap)
+
+    def subscribe(
+        self, topic: str, subscription_id: str, callback: Optional[Callable] = None
+    ):
+        callback = callback or self._callback
+        if callback is None:
+            raise ValueError(f"No callback for subscription {subscription_id}")
+
+        while True:
+            with self._lock:
+                if subscription_id in self._routes:
+                    raise ValueError(f"Subscription {subscription_id} already exists")
+
+                connection: Optional[_Connection] = self._get_connection()
+                if connection is not None:
+                    self._add_subscription(connection, topic, subscription_id, callback)
+                    return
+                if len(self._connections) + self._opening >= self._max_connections:
+                    # The last connections allowed are being opened, wait for them
+                    self._connection_opened.wait()
+                    continue
+
+                index: int = len(self._connections) + self._opening
+                self._opening += 1
+
+            # Opening a connection blocks, the other subscriptions must not wait
+            new_connection: Optional[_Connection] = None
+            try:
+                new_connection = self._new_connection(index)
+            finally:
+                with self._lock:
+                    self._opening -= 1
+                    if new_connection is not None and not self._closing.is_set():
+                        self._connections.append(new_connection)
+                    self._connection_opened.notify_all()
+            if self._closing.is_set():
+                self._close(new_connection.stomp_connection)
+                raise RuntimeError("The STOMP client is disconnected")
+
+    def _add_subscription(
+        self,
+        connection: _Connection,
+        topic: str,
+        subscription_id: str,
+        callback: Callable,
+    ):
+        # Called with the lock held
+        self._routes[subscription_id] = callback
+        self._subscription_connections[subscription_id] = connection
+        connection.subscriptions[subscription_id] = topic
+        if not connection.connected:
+            # Made when the connection is back
+            return
+
+        try:
+            connection.stomp_connection.subscribe(
+                destination=topic, id=subscription_id, headers=self._headers
+            )
+        except stomp.exception.NotConnectedException:
+            logging.info("Subscription %s deferred until reconnect", subscription_id)
+
+    def unsubscribe(self, subscription_id: str):
+        with self._lock:
+            connection: Optional[_Connection] = self._subscription_connections.pop(
+                subscription_id, None
+            )
+            if connection is None:
+                return
+
+            del self._routes[subscription_id]
+            del connection.subscriptions[subscription_id]
+            if not connection.connected:
+                return
+
+            try:
+                connection.stomp_connection.unsubscribe(
+                    id=subscription_id, headers=self._headers
+                )
+            except stomp.exception.NotConnectedException:
+                pass
+
+    def stats(self) -> DispatcherStats:
+        return self._dispatcher.stats()
+
+    def reconnect_stats(self) -> ReconnectStats:
+        with self._lock:
+            return ReconnectStats(
+                connections=len(self._connections),
+                connected=sum(connection.connected for connection in self._connections),
+                reconnects=self._reconnects,
+                last_gap=self._last_gap,
+                total_gap=self._total_gap,
+            )
+
+    def disconnect(self):
+        with self._lock:
+            self._closing.set()
+            connections: List[_Connection] = list(self._connections)
+        for connection in connections:
+            if connection.connected:
+                self._close(connection.stomp_connection)
+        self._dispatcher.stop()
 
 
 class StompListener(stomp.ConnectionListener):
-    def __init__(self, callback: Callable):
-        self._callback: Callable = callback
+    def __init__(
+        self,
+        dispatcher: MessageDispatcher,
+        on_disconnected: Optional[Callable] = None,
+    ):
+        self._dispatcher: MessageDispatcher = dispatcher
+        self._on_disconnected: Optional[Callable] = on_disconnected
 
     def on_error(self, headers, body):
         error_msg = json.loads(body)
         print("Received an unhandled error ", error_msg)
 
     def on_message(self, headers, body):
-        self._callback(headers, body)
+        self._dispatcher.submit(headers.get("subscription"), headers, body)
 
     def on_disconnected(self):
         print("STOMP Listener disconnected")
+        if self._on_disconnected:
+            self._on_disconnected()
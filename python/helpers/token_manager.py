@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from typing import Optional
+import weakref
+
+from helpers.metrics import Metrics, get_metrics
+from iotics.lib.identity.api.high_level_api import (
+    HighLevelIdentityApi,
+    RegisteredIdentity,
+)
+
+
+class TrackedHeaders(dict):
+    """Header dict a TokenManager keeps up to date. Plain dicts can't be
+    weakly referenced, this subclass can."""
+
+
+class TokenManager:
+    """Caches the agent auth token and refreshes it on a background thread
+    before it expires. 'get_token' only reads an attribute, so callers never
+    block on token creation.
+
+    A new token is created when 'refresh_margin' (a fraction of 'duration')
+    is left before the current one expires. Header dicts built by
+    'generate_headers(token_manager)' are tracked and get the new token too,
+    until they are garbage collected."""
+
+    def __init__(
+        self,
+        identity_api: HighLevelIdentityApi,
+        agent_identity: RegisteredIdentity,
+        user_did: str,
+        duration: int = 3600,
+        refresh_margin: float = 0.2,
+        retry_interval: float = 5.0,
+    ):
+        self._identity_api: HighLevelIdentityApi = identity_api
+        self._agent_identity: RegisteredIdentity = agent_identity
+        self._user_did: str = user_did
+        self._duration: int = duration
+        self._refresh_margin: float = refresh_margin
+        self._retry_interval: float = retry_interval
+
+        self._token: Optional[str] = None
+        self._expires_at: float = 0
+        # Header dicts by id(), weakly referenced so that a dropped one is not kept
+        self._tracked_headers: weakref.WeakValueDictionary = (
+            weakref.WeakValueDictionary()
+        )
+        self._stop: threading.Event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def expires_at(self) -> float:
+        """Expiry time of the current token, as returned by time.time()"""
+
+        return self._expires_at
+
+    def get_token(self) -> str:
+        if self._token is None:
+            self.refresh()
+
+        return self._token
+
+    def refresh(self) -> str:
+        metrics: Optional[Metrics] = get_metrics()
+        issued_at: float = time.time()
+        start: float = time.perf_counter()
+        try:
+            token: str = self._identity_api.create_agent_auth_token(
+                agent_registered_identity=self._agent_identity,
+                user_did=self._user_did,
+                duration=self._duration,
+            )
+        except Exception:
+            if metrics:
+                metrics.inc("token_refresh_errors_total")
+            raise
+        if metrics:
+            metrics.observe("token_refresh_seconds", time.perf_counter() - start)
+
+        # Swapping a reference is atomic, readers get either the old or the new token
+        self._token = token
+        self._expires_at = issued_at + self._duration
+        for headers in list(self._tracked_headers.values()):
+            headers["Authorization"] = f"Bearer {token}"
+
+        return token
+
+    def track_headers(self, headers: dict) -> TrackedHeaders:
+        """Keep the 'Authorization' header of 'headers' up to date. Use the
+        returned dict, a copy unless 'headers' is already a TrackedHeaders."""
+
+        if not isinstance(headers, TrackedHeaders):
+            headers = TrackedHeaders(headers)
+        self._tracked_headers[id(headers)] = headers
+
+        return headers
+
+    def start(self):
+        if self._token is None:
+            self.refresh()
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="token_manager", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            refresh_at: float = self._expires_at - self._duration * self._refresh_margin
+            if self._stop.wait(timeout=max(0, refresh_at - time.time())):
+                return
+
+            try:
+                self.refresh()
+            except Exception as ex:
+                # The current token is still valid for a while, try again shortly
+                logging.error("Can't refresh the token: %s", ex)
+                if self._stop.wait(timeout=self._retry_interval):
+                    return
@@ -0,0 +1,136 @@
+import json
+from typing import Iterable, List, Optional
+
+from google.protobuf import json_format
+from helpers.constants import PROPERTY_KEY_LABEL
+from iotics.api import common_pb2, twin_pb2
+from iotics.lib.grpc.helpers import create_headers, create_property
+
+_json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def label_property(label: str, lang: str = "en") -> dict:
+    return {
+        "key": PROPERTY_KEY_LABEL,
+        "langLiteralValue": {"value": label, "lang": lang},
+    }
+
+
+class TwinTemplate:
+    """Invariant part of the UPSERT_TWIN payload of many similar twins, e.g.
+    the type, comment and allow-list properties and the feeds of all the
+    temperature sensors, given once in the REST JSON form:
+
+        template = TwinTemplate(properties=[...], feeds=[...], inputs=[...])
+
+    Only the per-twin fields (ID, label, extra properties, location) are
+    built for each twin:
+    - 'rest_payload' returns a dict that shares the invariant objects;
+    - 'rest_body' returns the serialised JSON, the invariant part having
+      been serialised once, for 'RestClient.request(..., data=...)';
+    - 'grpc_request' returns an UpsertTwinRequest for the gRPC TwinAPI
+      stub, e.g. iotics_api.twin_api.stub.UpsertTwin(request). Its
+      invariant part is parsed from bytes encoded once, instead of being
+      rebuilt with 'create_property' and 'create_feed_with_meta'.
+    The invariant objects must not be modified after the template is made."""
+
+    def __init__(
+        self,
+        properties: Iterable[dict] = (),
+        feeds: Iterable[dict] = (),
+        inputs: Iterable[dict] = (),
+    ):
+        self._properties: List[dict] = list(properties)
+        self._feeds: List[dict] = list(feeds)
+        self._inputs: List[dict] = list(inputs)
+
+        # The properties' JSON is left open: per-twin ones are appended to it
+        self._properties_json: str = _json_encoder.encode(self._properties)[1:-1]
+        self._tail_json: str = (
+            f'],"feeds":{_json_encoder.encode(self._feeds)}'
+            f',"inputs":{_json_encoder.encode(self._inputs)}'
+        )
+
+        # Protobuf messages are merged by concatenating their encodings
+        self._grpc_payload: bytes = json_format.ParseDict(
+            {
+                "properties": self._properties,
+                "feeds": self._feeds,
+                "inputs": self._inputs,
+            },
+            twin_pb2.UpsertTwinRequest.Payload(),
+        ).SerializeToString()
+
+    def rest_payload(
+        self,
+        twin_id: str,
+        label: Optional[str] = None,
+        properties: Iterable[dict] = (),
+        location: Optional[dict] = None,
+    ) -> dict:
+        twin_properties: List[dict] = list(self._properties)
+        if label is not None:
+            twin_properties.append(label_property(label))
+        twin_properties.extend(properties)
+
+        payload: dict = {
+            "twinId": {"id": twin_id},
+            "properties": twin_properties,
+            "feeds": self._feeds,
+            "inputs": self._inputs,
+        }
+        if location:
+            payload["location"] = location
+
+        return payload
+
+    def rest_body(
+        self,
+        twin_id: str,
+        label: Optional[str] = None,
+        properties: Iterable[dict] = (),
+        location: Optional[dict] = None,
+    ) -> bytes:
+        parts: List[str] = ['{"twinId":{"id":', _json_encoder.encode(twin_id)]
+        parts.append('},"properties":[')
+        parts.append(self._properties_json)
+
+        twin_properties: List[dict] = [] if label is None else [label_property(label)]
+        twin_properties.extend(properties)
+        if twin_properties:
+            if self._properties:
+                parts.append(",")
+            parts.append(_json_encoder.encode(twin_properties)[1:-1])
+
+        parts.append(self._tail_json)
+        if location:
+            parts.append(',"location":')
+            parts.append(_json_encoder.encode(location))
+        parts.append("}")
+
+        return "".join(parts).encode()
+
+    def grpc_request(
+        self,
+        twin_id: str,
+        label: Optional[str] = None,
+        properties: Iterable[common_pb2.Property] = (),
+        location: Optional[common_pb2.GeoLocation] = None,
+        headers: Optional[common_pb2.Headers] = None,
+    ) -> twin_pb2.UpsertTwinRequest:
+        """'properties' and 'location' as made by 'create_property' and
+        'create_location'"""
+
+        request = twin_pb2.UpsertTwinRequest(headers=headers or create_headers())
+        payload: twin_pb2.UpsertTwinRequest.Payload = request.payload
+        payload.MergeFromString(self._grpc_payload)
+        payload.twinId.id = twin_id
+        if label is not None:
+            payload.properties.append(
+                create_property(PROPERTY_KEY_LABEL, label, language="en")
+            )
+        payload.properties.extend(properties)
+        if location is not None:
+            payload.location.CopyFrom(location)
+
+        return request
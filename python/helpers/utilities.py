@@ -1,28 +1,38 @@
-import base64
+from collections import namedtuple
 import json
 import logging
 import sys
-from typing import List, Optional
+import time
+from typing import Iterator, List, Optional, Union
 from datetime import datetime, timedelta, timezone
 import uuid
 
 import requests
+from helpers.codec import JSON_CODEC
 from helpers.constants import INDEX_JSON_PATH
+from helpers.endpoint_registry import get_endpoint_registry
+from helpers.metrics import Metrics, get_metrics
+from helpers.rest_client import RestClientError, get_default_client
+from helpers.share_spool import ShareSpool, spool_share
+from helpers.token_manager import TokenManager
 
 
 def get_host_endpoints(host_url: str) -> dict:
+    """Return the space's '/index.json'. It is fetched once and cached by
+    the shared EndpointRegistry, see 'helpers.endpoint_registry'."""
+
     if not host_url:
         logging.error("Parameter HOST_URL not set")
         sys.exit(1)
 
-    index_json: str = host_url + INDEX_JSON_PATH
     req_resp: dict = {}
 
     try:
-        req_resp = requests.get(index_json).json()
-    except requests.exceptions.ConnectionError:
+        req_resp = get_endpoint_registry().get(host_url)
+    except RestClientError:
         logging.error(
-            "Can't connect to %s. Check HOST_URL is spelt correctly", index_json
+            "Can't connect to %s. Check HOST_URL is spelt correctly",
+            host_url + INDEX_JSON_PATH,
         )
         sys.exit(1)
 
@@ -34,28 +44,53 @@ def make_api_call(
     endpoint: str,
     headers: Optional[dict] = None,
     payload: Optional[dict] = None,
+    spool: Optional[ShareSpool] = None,
 ) -> dict:
     """This method will simply execute a REST call according to a specific
-    method, endpoint and optional headers and payload."""
+    method, endpoint and optional headers and payload.
+    The connection to the host is pooled and kept alive across calls.
+
+    For SHARE_FEED_DATA calls, 'spool' keeps the publisher running through
+    an outage: the shares that can't reach the space are written to it, to
+    be replayed by a SpoolReplayer, instead of exiting. See
+    'helpers.share_spool'. A spooled share has no response yet, and the
+    response of a share is empty, so {} is returned either way."""
+
+    if spool is not None:
+        spool_share(spool, get_default_client(), endpoint, headers, payload)
+        return {}
 
     try:
-        req_resp: requests.Response = requests.request(
-            method=method, url=endpoint, headers=headers, json=payload
+        req_resp: requests.Response = get_default_client().request(
+            method=method, url=endpoint, headers=headers, payload=payload
         )
-        req_resp.raise_for_status()
-        response: dict = req_resp.json()
-    except Exception as ex:
-        print("Getting error", ex)
-        sys.exit(1)
+    except RestClientError as ex:
+        # Raised once the retries of the RestClient have run out
+        logging.error("Getting error %s", ex)
+        raise
 
-    return response
+    return req_resp.json() if req_resp.content else {}
 
 
-def search_twins(
-    method: str, endpoint: str, headers: dict, payload: dict, scope: str
-) -> List[dict]:
-    # The following variable will be used to append any Twins found by the Search operation
-    twins_found_list = []
+SearchBatch = namedtuple("SearchBatch", ["host_id", "twins"])
+
+
+def iter_search_twins(
+    method: str,
+    endpoint: str,
+    headers: dict,
+    payload: dict,
+    scope: str,
+    limit: Optional[int] = None,
+) -> Iterator[SearchBatch]:
+    """Generator version of 'search_twins'. Yields the Twins found by each Host
+    as soon as its response chunk arrives, together with the Host's ID.
+    Once 'limit' Twins have been yielded the response stream is closed."""
+
+    if limit is not None and limit <= 0:
+        return
+
+    twins_count = 0
 
     search_headers = headers.copy()
     search_headers.update(
@@ -66,48 +101,107 @@ def search_twins(
         }
     )
 
+    metrics: Optional[Metrics] = get_metrics()
+    start: float = time.perf_counter()
+    response_bytes: int = 0
+    first_batch: bool = True
+
     # We can now use the Search operation over REST by specifying the 'scope' parameter.
     # The latter defines where to search for Twins, either locally ('LOCAL') in the Space defined by the 'HOST_URL'
     # or globally ('GLOBAL') in the Network.
-    with requests.request(
+    try:
+        with get_default_client().request(
+            method=method,
+            url=endpoint,
+            headers=search_headers,
+            stream=True,
+            params={"scope": scope},
+            payload=payload,
+            # A search only reads: retried like a GET
+            retry=True,
+        ) as resp:
+            # Iterates over the response data, one Host at a time
+            for chunk in resp.iter_lines():
+                if not chunk:
+                    continue
+
+                response_bytes += len(chunk)
+                response = json.loads(chunk)
+                try:
+                    host_payload = response["result"]["payload"]
+                    twins_found = host_payload["twins"]
+                except KeyError:
+                    continue
+
+                if not twins_found:
+                    continue
+
+                if limit is not None:
+                    twins_found = twins_found[: limit - twins_count]
+                twins_count += len(twins_found)
+
+                if metrics and first_batch:
+                    first_batch = False
+                    metrics.observe(
+                        "search_first_result_seconds",
+                        time.perf_counter() - start,
+                        scope=scope,
+                    )
+
+                yield SearchBatch(host_id=host_payload.get("hostId"), twins=twins_found)
+
+                if limit is not None and twins_count >= limit:
+                    # Leaving the 'with' block closes the stream: the remaining Hosts are not read
+                    break
+    finally:
+        if metrics:
+            metrics.observe("search_seconds", time.perf_counter() - start, scope=scope)
+            metrics.inc("search_twins_found_total", twins_count, scope=scope)
+            metrics.inc("search_response_bytes_total", response_bytes, scope=scope)
+
+
+def search_twins(
+    method: str,
+    endpoint: str,
+    headers: dict,
+    payload: dict,
+    scope: str,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    # The following variable will be used to append any Twins found by the Search operation
+    twins_found_list = []
+
+    for batch in iter_search_twins(
         method=method,
-        url=endpoint,
-        headers=search_headers,
-        stream=True,
-        verify=True,
-        params={"scope": scope},
-        json=payload,
-    ) as resp:
-        resp.raise_for_status()
-        # Iterates over the response data, one Host at a time
-        for chunk in resp.iter_lines():
-            response = json.loads(chunk)
-            twins_found = []
-            try:
-                twins_found = response["result"]["payload"]["twins"]
-            except KeyError:
-                continue
-            finally:
-                if twins_found:
-                    # Append the twins found to the list of twins
-                    twins_found_list.extend(twins_found)
+        endpoint=endpoint,
+        headers=headers,
+        payload=payload,
+        scope=scope,
+        limit=limit,
+    ):
+        # Append the twins found to the list of twins
+        twins_found_list.extend(batch.twins)
 
     return twins_found_list
 
 
-def decode_data(data: str):
-    decoded_data = json.loads(base64.b64decode(data).decode("ascii"))
+def decode_data(data: str, codec=JSON_CODEC):
+    decoded_data = codec.decode(data)
 
     return decoded_data
 
 
-def encode_data(data: dict):
-    encoded_data = base64.b64encode(json.dumps(data).encode()).decode()
+def encode_data(data: dict, codec=JSON_CODEC):
+    encoded_data = codec.encode(data)
 
     return encoded_data
 
 
-def generate_headers(token: str) -> dict:
+def generate_headers(token: Union[str, TokenManager]) -> dict:
+    if isinstance(token, TokenManager):
+        # The TokenManager will update the 'Authorization' header on every refresh
+        return token.track_headers(generate_headers(token.get_token()))
+
     headers = {
         "accept": "application/json",
         "Iotics-ClientAppId": uuid.uuid4().hex,  # Namespace used to group all the requests/responses
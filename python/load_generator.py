@@ -0,0 +1,580 @@
+"""Generate synthetic load for capacity planning: create N twins with M feeds
+each, share feed data and send input messages to them at a target rate
+ramped up in steps, and report the throughput achieved and the latency
+percentiles of each step.
+
+Messages are scheduled open-loop: message n of a step is due at
+start + n / rate whatever happened to the ones before it, and its latency
+is measured from that time. A slow space or a saturated generator then
+shows up in the percentiles (and in the generator lag) instead of silently
+lowering the rate, i.e. coordinated omission doesn't hide latency.
+
+Against the local mock host, no IOTICSpace or credentials needed:
+    python load_generator.py --mock --twins 100 --feeds 2 --rates 200 400 800
+
+Against an IOTICSpace, with the seeds of 'helpers/constants.py':
+    python load_generator.py --host-url https://my-space.iotics.space \\
+        --transport grpc --rates 100 200 --step-duration 60 --report report.json
+
+The twins are deleted at the end unless '--keep' is given.
+"""
+
+import argparse
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+from helpers.bulk_identity import TwinIdentitySpec
+from helpers.bulk_provisioning import BulkProvisioner, ProvisioningReport
+from helpers.constants import (
+    AGENT_SEED,
+    PROPERTY_KEY_TYPE,
+    SEARCH_TWINS,
+    SEND_INPUT_MESSAGE,
+    SHARE_FEED_DATA,
+    TOKEN_DURATION,
+    USER_KEY_NAME,
+    USER_SEED,
+)
+from helpers.identity_auth import Identity
+from helpers.rest_client import RestClient, RestClientError
+from helpers.twin_template import TwinTemplate
+from helpers.utilities import (
+    encode_data,
+    generate_headers,
+    get_host_endpoints,
+    iter_search_twins,
+)
+from iotics.api import common_pb2, feed_pb2, feed_pb2_grpc
+from iotics.lib.grpc.helpers import create_headers
+
+HOST_URL = ""  # IOTICSpace URL
+AGENT_KEY_NAME = "LoadGenerator"
+LOAD_TWIN_TYPE = "https://example.com/load-generator#Twin"
+INPUT_ID = "load_input"
+SHARES = "shares"
+INPUTS = "inputs"
+
+StepResult = namedtuple(
+    "StepResult",
+    [
+        "step",
+        "kind",
+        "target_rate",
+        "sent",
+        "ok",
+        "errors",
+        "error_codes",
+        "unfinished",
+        "throughput",
+        "latency_p50",
+        "latency_p90",
+        "latency_p99",
+        "latency_p999",
+        "latency_max",
+        "generator_lag_max",
+    ],
+)
+
+
+class StepRecorder:
+    """Outcome and latency of the messages of one kind sent in one step"""
+
+    def __init__(self, step: int, kind: str, target_rate: float):
+        self.step: int = step
+        self.kind: str = kind
+        self.target_rate: float = target_rate
+        self.sent: int = 0
+        self.lag_max: float = 0
+        self._latencies: List[float] = []
+        self._errors: Counter = Counter()
+        self._lock: threading.Lock = threading.Lock()
+        self._start: float = time.perf_counter()
+        self._end: float = self._start
+
+    def done(self, scheduled_at: float, error: Optional[str]):
+        """Record a message, 'error' its HTTP status or gRPC code if it failed"""
+
+        now: float = time.perf_counter()
+        with self._lock:
+            if error is None:
+                self._latencies.append(now - scheduled_at)
+            else:
+                self._errors[error] += 1
+            self._end = now
+
+    @property
+    def finished(self) -> int:
+        with self._lock:
+            return len(self._latencies) + sum(self._errors.values())
+
+    def result(self) -> StepResult:
+        with self._lock:
+            latencies: List[float] = sorted(self._latencies)
+            errors: Counter = Counter(self._errors)
+            seconds: float = self._end - self._start
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return StepResult(
+            step=self.step,
+            kind=self.kind,
+            target_rate=self.target_rate,
+            sent=self.sent,
+            ok=len(latencies),
+            errors=sum(errors.values()),
+            error_codes=dict(errors),
+            unfinished=self.sent - len(latencies) - sum(errors.values()),
+            throughput=len(latencies) / seconds if seconds else 0,
+            latency_p50=percentile(0.5),
+            latency_p90=percentile(0.9),
+            latency_p99=percentile(0.99),
+            latency_p999=percentile(0.999),
+            latency_max=latencies[-1] if latencies else None,
+            generator_lag_max=self.lag_max,
+        )
+
+
+class RestSender:
+    """Shares and input messages over REST, 'threads' calls in flight"""
+
+    def __init__(
+        self,
+        host_url: str,
+        headers: dict,
+        sender_twin_id: str,
+        receiver_host_id: str,
+        threads: int,
+    ):
+        self._host_url: str = host_url
+        self._headers: dict = headers
+        self._sender_twin_id: str = sender_twin_id
+        self._receiver_host_id: str = receiver_host_id
+        # No retries: a retried call would hide the latency of the failed one
+        self._client: RestClient = RestClient(pool_maxsize=threads, max_retries=0)
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="load_rest"
+        )
+
+    def _call(
+        self, on_done: Callable[[Optional[str]], None], endpoint, payload: dict, **kw
+    ):
+        try:
+            self._client.call(
+                endpoint,
+                headers=self._headers,
+                payload=payload,
+                host=self._host_url,
+                **kw,
+            )
+        except RestClientError as ex:
+            logging.debug("%s failed: %s", endpoint.url, ex)
+            on_done(str(ex.status_code or "error"))
+        else:
+            on_done(None)
+
+    def share(
+        self,
+        twin_id: str,
+        feed_id: str,
+        data: dict,
+        on_done: Callable[[Optional[str]], None],
+    ):
+        self._executor.submit(
+            self._call,
+            on_done,
+            SHARE_FEED_DATA,
+            {"sample": {"data": encode_data(data), "mime": "application/json"}},
+            twin_id=twin_id,
+            feed_id=feed_id,
+        )
+
+    def send_input(
+        self, twin_id: str, data: dict, on_done: Callable[[Optional[str]], None]
+    ):
+        self._executor.submit(
+            self._call,
+            on_done,
+            SEND_INPUT_MESSAGE,
+            {"message": {"data": encode_data(data), "mime": "application/json"}},
+            twin_sender_id=self._sender_twin_id,
+            twin_receiver_host_id=self._receiver_host_id,
+            twin_receiver_id=twin_id,
+            input_id=INPUT_ID,
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._client.close()
+
+
+class GrpcSender(RestSender):
+    """Shares over gRPC, as non-blocking calls so that the number in flight
+    isn't capped by threads; input messages still go over REST as this
+    version of the gRPC client can't send them"""
+
+    def __init__(self, channel: grpc.Channel, timeout: float, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stub = feed_pb2_grpc.FeedAPIStub(channel)
+        self._timeout: float = timeout
+
+    def share(
+        self,
+        twin_id: str,
+        feed_id: str,
+        data: dict,
+        on_done: Callable[[Optional[str]], None],
+    ):
+        occurred_at = Timestamp()
+        occurred_at.GetCurrentTime()
+        future = self._stub.ShareFeedData.future(
+            feed_pb2.ShareFeedDataRequest(
+                headers=create_headers(),
+                args=feed_pb2.ShareFeedDataRequest.Arguments(
+                    feedId=feed_pb2.FeedID(id=feed_id, twinId=twin_id)
+                ),
+                payload=feed_pb2.ShareFeedDataRequest.Payload(
+                    sample=common_pb2.FeedData(
+                        occurredAt=occurred_at,
+                        mime="application/json",
+                        data=json.dumps(data).encode(),
+                    )
+                ),
+            ),
+            timeout=self._timeout,
+        )
+        future.add_done_callback(lambda done: on_done(_grpc_error(done)))
+
+
+def _grpc_error(future: grpc.Future) -> Optional[str]:
+    """Status code name of a failed call, None if it succeeded"""
+
+    # 'exception' raises on a cancelled future instead of returning
+    if future.cancelled():
+        return "CANCELLED"
+
+    error: Optional[grpc.RpcError] = future.exception()
+
+    return error.code().name if error else None
+
+
+def twin_template(feeds: int, with_input: bool) -> TwinTemplate:
+    return TwinTemplate(
+        properties=[{"key": PROPERTY_KEY_TYPE, "uriValue": {"value": LOAD_TWIN_TYPE}}],
+        feeds=[{"id": f"feed{m}", "storeLast": False} for m in range(feeds)],
+        inputs=[{"id": INPUT_ID}] if with_input else [],
+    )
+
+
+def run_step(
+    step: int,
+    rate: float,
+    duration: float,
+    input_fraction: float,
+    sender: RestSender,
+    feeds: List[Tuple[str, str]],
+    receivers: List[str],
+    padding: str,
+    drain: float,
+) -> Dict[str, StepRecorder]:
+    recorders: Dict[str, StepRecorder] = {
+        SHARES: StepRecorder(step, SHARES, rate * (1 - input_fraction)),
+        INPUTS: StepRecorder(step, INPUTS, rate * input_fraction),
+    }
+
+    total: int = int(rate * duration)
+    start: float = time.perf_counter()
+    shares: int = 0
+    inputs: int = 0
+    for n in range(total):
+        scheduled_at: float = start + n / rate
+        delay: float = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        # Every 1 / input_fraction messages is an input message
+        is_input: bool = int((n + 1) * input_fraction) > int(n * input_fraction)
+        recorder: StepRecorder = recorders[INPUTS if is_input else SHARES]
+        recorder.lag_max = max(recorder.lag_max, time.perf_counter() - scheduled_at)
+        recorder.sent += 1
+        data: dict = {"n": n, "padding": padding} if padding else {"n": n}
+
+        def on_done(error: Optional[str], recorder=recorder, scheduled_at=scheduled_at):
+            recorder.done(scheduled_at, error)
+
+        if is_input:
+            sender.send_input(receivers[inputs % len(receivers)], data, on_done)
+            inputs += 1
+        else:
+            twin_id, feed_id = feeds[shares % len(feeds)]
+            sender.share(twin_id, feed_id, data, on_done)
+            shares += 1
+
+    # What is still in flight after 'drain' seconds is reported as unfinished
+    deadline: float = time.perf_counter() + drain
+    while time.perf_counter() < deadline and any(
+        recorder.finished < recorder.sent for recorder in recorders.values()
+    ):
+        time.sleep(0.01)
+
+    return recorders
+
+
+def provision(
+    host_url: str, headers: dict, twin_ids: List[str], template: TwinTemplate, args
+) -> ProvisioningReport:
+    report: ProvisioningReport = BulkProvisioner(
+        host_url=host_url, headers=headers, concurrency=args.threads
+    ).upsert(
+        template.rest_payload(twin_id, label=f"Load Twin {n}")
+        for n, twin_id in enumerate(twin_ids)
+    )
+    print(f"Provisioning: {report}")
+    for outcome in report.failed:
+        logging.error("%s: %s", outcome.twin_id, outcome.error)
+
+    return report
+
+
+def local_host_id(host_url: str, headers: dict) -> str:
+    """ID of the space's host, which input messages to its twins need: the
+    one a local search for the twins just provisioned returns"""
+
+    for batch in iter_search_twins(
+        method=SEARCH_TWINS.method,
+        endpoint=SEARCH_TWINS.url.format(host=host_url),
+        headers=headers,
+        payload={
+            "responseType": "MINIMAL",
+            "filter": {
+                "properties": [
+                    {"key": PROPERTY_KEY_TYPE, "uriValue": {"value": LOAD_TWIN_TYPE}}
+                ]
+            },
+        },
+        scope="LOCAL",
+        limit=1,
+    ):
+        if batch.host_id:
+            return batch.host_id
+
+    raise RuntimeError(f"Can't find the host ID of {host_url}")
+
+
+def format_ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:9.1f}" if seconds is not None else f"{'-':>9}"
+
+
+def print_result(result: StepResult):
+    print(
+        f"{result.step:4} {result.kind:7} {result.target_rate:9.0f} {result.sent:8} "
+        f"{result.ok:8} {result.errors:7} {result.unfinished:10} "
+        f"{result.throughput:9.0f} {format_ms(result.latency_p50)} "
+        f"{format_ms(result.latency_p90)} {format_ms(result.latency_p99)} "
+        f"{format_ms(result.latency_p999)} {format_ms(result.latency_max)} "
+        f"{format_ms(result.generator_lag_max)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host-url", default=HOST_URL)
+    parser.add_argument(
+        "--mock", action="store_true", help="run against a local mock host"
+    )
+    parser.add_argument("--transport", choices=["rest", "grpc"], default="rest")
+    parser.add_argument("--twins", type=int, default=100)
+    parser.add_argument("--feeds", type=int, default=1, help="feeds per twin")
+    parser.add_argument(
+        "--rates",
+        type=float,
+        nargs="+",
+        default=[100, 200, 400],
+        help="messages per second of each step",
+    )
+    parser.add_argument("--step-duration", type=float, default=30, help="seconds")
+    parser.add_argument(
+        "--input-fraction",
+        type=float,
+        default=0,
+        help="fraction of the messages that are input messages, 0 to 1",
+    )
+    parser.add_argument(
+        "--payload-size", type=int, default=0, help="bytes of padding per message"
+    )
+    parser.add_argument("--threads", type=int, default=32, help="REST calls in flight")
+    parser.add_argument("--timeout", type=float, default=30, help="gRPC call timeout")
+    parser.add_argument(
+        "--drain", type=float, default=10, help="seconds to wait after each step"
+    )
+    parser.add_argument("--report", help="write the results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="don't delete the twins")
+    args = parser.parse_args()
+
+    if not args.mock and not args.host_url:
+        parser.error("give the --host-url of an IOTICSpace, or --mock")
+    if not 0 <= args.input_fraction <= 1:
+        parser.error("--input-fraction must be between 0 and 1")
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    with_input: bool = args.input_fraction > 0
+    template: TwinTemplate = twin_template(args.feeds, with_input)
+    mock_host = None
+    identity: Optional[Identity] = None
+
+    ##### IDENTITY MANAGEMENT #####
+    if args.mock:
+        from benchmarks.grpc_share_benchmark import SlowFeedApi, start_server
+        from benchmarks.mock_host import MockHost
+
+        mock_host = MockHost()
+        mock_host.start()
+        host_url: str = mock_host.url
+        receiver_host_id: str = mock_host.host_id
+        headers: dict = {}
+        twin_ids: List[str] = [f"did:iotics:load{n}" for n in range(args.twins)]
+        sender_twin_id: str = "did:iotics:load-sender"
+        channel: Optional[grpc.Channel] = (
+            grpc.insecure_channel(f"127.0.0.1:{start_server(SlowFeedApi(0))}")
+            if args.transport == "grpc"
+            else None
+        )
+    else:
+        host_url = args.host_url
+        endpoints: dict = get_host_endpoints(host_url=host_url)
+        identity = Identity(
+            resolver_url=endpoints.get("resolver"),
+            grpc_endpoint=endpoints.get("grpc"),
+        )
+        user_identity, agent_identity = (
+            identity.create_user_and_agent_with_auth_delegation(
+                user_seed=USER_SEED,
+                user_key_name=USER_KEY_NAME,
+                agent_seed=AGENT_SEED,
+                agent_key_name=AGENT_KEY_NAME,
+            )
+        )
+        token_manager = identity.start_token_refresh(
+            agent_identity=agent_identity,
+            user_did=user_identity.did,
+            duration=TOKEN_DURATION,
+        )
+        headers = generate_headers(token=token_manager)
+
+        identity_results = identity.create_twins_with_control_delegation(
+            specs=[
+                TwinIdentitySpec(twin_key_name=key_name, twin_seed=AGENT_SEED)
+                for key_name in [f"LoadTwin{n}" for n in range(args.twins)]
+                + ["LoadSender"]
+            ],
+            agent_identity=agent_identity,
+        )
+        failures = [result for result in identity_results if result.error]
+        if failures:
+            for result in failures:
+                logging.error("%s: %s", result.spec.twin_key_name, result.error)
+            sys.exit(1)
+        twin_ids = [result.identity.did for result in identity_results[:-1]]
+        sender_twin_id = identity_results[-1].identity.did
+        channel = identity.get_channel() if args.transport == "grpc" else None
+
+    ##### TWIN SETUP #####
+    report = provision(host_url, headers, twin_ids + [sender_twin_id], template, args)
+    if report.failed:
+        sys.exit(1)
+    if identity is not None:
+        receiver_host_id = local_host_id(host_url, headers)
+
+    sender_args: tuple = (
+        host_url,
+        headers,
+        sender_twin_id,
+        receiver_host_id,
+        args.threads,
+    )
+    sender: RestSender = (
+        GrpcSender(channel, args.timeout, *sender_args)
+        if channel is not None
+        else RestSender(*sender_args)
+    )
+    feeds: List[Tuple[str, str]] = [
+        (twin_id, f"feed{m}") for m in range(args.feeds) for twin_id in twin_ids
+    ]
+
+    ##### LOAD #####
+    print(
+        f"{args.twins} twins x {args.feeds} feeds over {args.transport}, "
+        f"{args.input_fraction:.0%} input messages, {args.step_duration:.0f}s steps"
+    )
+    print(
+        f"{'step':>4} {'kind':7} {'target/s':>9} {'sent':>8} {'ok':>8} {'errors':>7} "
+        f"{'unfinished':>10} {'msgs/s':>9} {'p50 ms':>9} {'p90 ms':>9} "
+        f"{'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9} {'lag ms':>9}"
+    )
+    results: List[StepResult] = []
+    try:
+        for step, rate in enumerate(args.rates, start=1):
+            recorders = run_step(
+                step,
+                rate,
+                args.step_duration,
+                args.input_fraction,
+                sender,
+                feeds,
+                twin_ids,
+                "x" * args.payload_size,
+                args.drain,
+            )
+            for recorder in recorders.values():
+                if recorder.sent:
+                    results.append(recorder.result())
+                    print_result(results[-1])
+                    if results[-1].error_codes:
+                        logging.warning(
+                            "Step %s errors: %s", step, results[-1].error_codes
+                        )
+    except KeyboardInterrupt:
+        logging.info("Interrupted, reporting the steps done")
+    finally:
+        sender.close()
+        if channel is not None:
+            channel.close()
+
+        if not args.keep:
+            teardown: ProvisioningReport = BulkProvisioner(
+                host_url=host_url, headers=headers, concurrency=args.threads
+            ).delete(twin_ids + [sender_twin_id])
+            print(f"Teardown: {teardown}")
+        if identity is not None:
+            token_manager.stop()
+        if mock_host is not None:
+            mock_host.stop()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(
+                {
+                    "config": vars(args),
+                    "steps": [result._asdict() for result in results],
+                },
+                report_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
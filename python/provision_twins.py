@@ -0,0 +1,179 @@
+"""Provision a fleet of twins from a file, or tear them down again.
+
+The file is a JSON list of twin specs, e.g.
+[
+    {
+        "twin_key_name": "TemperatureSensor1",
+        "properties": [{"key": "...", "uriValue": {"value": "..."}}],
+        "feeds": [{"id": "temperature", "storeLast": true, "properties": [], "values": []}],
+        "inputs": [],
+        "location": {"lat": 51.5, "lon": -0.1}
+    }
+]
+
+Usage, from the 'python' folder:
+    python provision_twins.py provision twins.json --state .provisioning_state.json
+    python provision_twins.py teardown --state .provisioning_state.json
+
+Teardown only deletes the twins recorded in the state file for the host, never
+twins found by a search that may belong to someone else.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from helpers.bulk_identity import TwinIdentitySpec, create_twins_with_control_delegation
+from helpers.bulk_provisioning import (
+    FAILED,
+    BulkProvisioner,
+    ProvisioningReport,
+    TwinOutcome,
+    TwinSpec,
+    twin_payload,
+)
+from helpers.constants import (
+    AGENT_SEED,
+    TOKEN_DURATION,
+    USER_KEY_NAME,
+    USER_SEED,
+)
+from helpers.token_manager import TokenManager
+from helpers.utilities import generate_headers, get_host_endpoints
+from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
+
+HOST_URL = ""  # IOTICSpace URL
+AGENT_KEY_NAME = "ProvisioningAgent"
+
+
+def provision(args, endpoints: dict, agent_identity, headers: dict):
+    with open(args.file, encoding="utf-8") as specs_file:
+        specs = [TwinSpec(**spec) for spec in json.load(specs_file)]
+
+    # Twin identities are deterministic: re-running re-creates the same DIDs
+    identity_results = create_twins_with_control_delegation(
+        resolver_url=endpoints.get("resolver"),
+        specs=[
+            TwinIdentitySpec(twin_key_name=spec.twin_key_name, twin_seed=AGENT_SEED)
+            for spec in specs
+        ],
+        agent_identity=agent_identity,
+    )
+
+    payloads = []
+    identity_failures = []
+    for spec, identity_result in zip(specs, identity_results):
+        if identity_result.error:
+            # Reported under its key name: the twin has no DID
+            identity_failures.append(
+                TwinOutcome(
+                    twin_id=spec.twin_key_name,
+                    status=FAILED,
+                    error=identity_result.error,
+                    seconds=0,
+                )
+            )
+            continue
+        payloads.append(twin_payload(identity_result.identity.did, spec))
+
+    provisioner = BulkProvisioner(
+        host_url=args.host_url,
+        headers=headers,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        state_path=args.state,
+    )
+
+    report = provisioner.upsert(payloads)
+    report.outcomes.extend(identity_failures)
+
+    return report
+
+
+def teardown(args, endpoints: dict, agent_identity, headers: dict):
+    provisioner = BulkProvisioner(
+        host_url=args.host_url,
+        headers=headers,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        state_path=args.state,
+    )
+    twin_ids = provisioner.provisioned_twin_ids()[: args.limit]
+
+    if args.dry_run:
+        print("\n".join(twin_ids))
+        print(f"{len(twin_ids)} twins would be deleted")
+        sys.exit(0)
+
+    return provisioner.delete(twin_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host-url", default=HOST_URL)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, help="max calls per second")
+    parser.add_argument("--state", help="file of the twins already provisioned")
+    parser.add_argument("--report", help="write the outcome of each twin to this file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    provision_parser = subparsers.add_parser(
+        "provision", help="upsert the twins of a file"
+    )
+    provision_parser.add_argument("file")
+    provision_parser.set_defaults(run=provision)
+
+    teardown_parser = subparsers.add_parser(
+        "teardown", help="delete the twins recorded in the state file"
+    )
+    teardown_parser.add_argument("--limit", type=int)
+    teardown_parser.add_argument("--dry-run", action="store_true")
+    teardown_parser.set_defaults(run=teardown)
+
+    args = parser.parse_args()
+    if args.command == "teardown" and not args.state:
+        parser.error("teardown needs --state, the file the twins were recorded in")
+
+    ##### IDENTITY MANAGEMENT #####
+    endpoints = get_host_endpoints(host_url=args.host_url)
+    identity_api = get_rest_high_level_identity_api(
+        resolver_url=endpoints.get("resolver")
+    )
+    (
+        user_identity,
+        agent_identity,
+    ) = identity_api.create_user_and_agent_with_auth_delegation(
+        user_seed=USER_SEED,
+        user_key_name=USER_KEY_NAME,
+        agent_seed=AGENT_SEED,
+        agent_key_name=AGENT_KEY_NAME,
+    )
+    token_manager = TokenManager(
+        identity_api=identity_api,
+        agent_identity=agent_identity,
+        user_did=user_identity.did,
+        duration=TOKEN_DURATION,
+    )
+    token_manager.start()
+    headers = generate_headers(token=token_manager)
+
+    ##### PROVISIONING #####
+    report: ProvisioningReport = args.run(args, endpoints, agent_identity, headers)
+    token_manager.stop()
+
+    for outcome in report.failed:
+        logging.error("%s: %s", outcome.twin_id, outcome.error)
+    print(report)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump([outcome._asdict() for outcome in report.outcomes], report_file)
+
+    sys.exit(1 if report.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ from helpers.constants import (
     PROPERTY_VALUE_MODEL,
     SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
     SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
+    TOKEN_DURATION,
     UNIT_DEGREE_CELSIUS,
     USER_KEY_NAME,
     USER_SEED,
@@ -48,14 +49,17 @@ def main():
         agent_key_name=AGENT_KEY_NAME,
     )
 
-    ### 3. GENERATE NEW TOKEN
-    identity_api.refresh_token(
-        agent_identity=agent_identity, user_did=user_identity.did, duration=600
+    ### 3. GENERATE NEW TOKEN, REFRESHED IN THE BACKGROUND BEFORE IT EXPIRES
+    identity_api.start_token_refresh(
+        agent_identity=agent_identity,
+        user_did=user_identity.did,
+        duration=TOKEN_DURATION,
     )
 
     ##### TWIN SETUP #####
     ### 4. INSTANTIATE IOTICSviagRPC
-    iotics_api = IOTICSviagRPC(auth=identity_api)
+    # The channel reads the current token on every call
+    iotics_api = IOTICSviagRPC(auth=identity_api, channel=identity_api.get_channel())
 
     ##### TWIN INTERACTION #####
 
@@ -17,11 +17,13 @@ from helpers.constants import (
     SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
     SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
     SHARE_FEED_DATA,
+    TOKEN_DURATION,
     UNIT_DEGREE_CELSIUS,
     UPSERT_TWIN,
     USER_KEY_NAME,
     USER_SEED,
 )
+from helpers.token_manager import TokenManager
 from helpers.utilities import (
     encode_data,
     get_host_endpoints,
@@ -53,14 +55,16 @@ def main():
         agent_key_name=AGENT_KEY_NAME,
     )
 
-    ### 3. GENERATE NEW TOKEN AND HEADERS
-    token = identity_api.create_agent_auth_token(
-        agent_registered_identity=agent_identity,
+    ### 3. GENERATE NEW TOKEN AND HEADERS, REFRESHED IN THE BACKGROUND BEFORE THE TOKEN EXPIRES
+    token_manager = TokenManager(
+        identity_api=identity_api,
+        agent_identity=agent_identity,
         user_did=user_identity.did,
-        duration=600,
+        duration=TOKEN_DURATION,
     )
+    token_manager.start()
 
-    headers = generate_headers(token=token)
+    headers = generate_headers(token=token_manager)
 
     ##### TWIN SETUP #####
     ##### TWIN INTERACTION #####
@@ -0,0 +1,192 @@
+import asyncio
+from datetime import datetime, timezone
+from random import randint
+
+from helpers.async_rest_client import AsyncRestClient
+from helpers.constants import (
+    AGENT_SEED,
+    PROPERTY_KEY_COMMENT,
+    PROPERTY_KEY_HOST_ALLOW_LIST,
+    PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+    PROPERTY_KEY_LABEL,
+    PROPERTY_KEY_TYPE,
+    PROPERTY_VALUE_ALLOW_ALL,
+    SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+    SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
+    SHARE_FEED_DATA,
+    TOKEN_DURATION,
+    UNIT_DEGREE_CELSIUS,
+    UPSERT_TWIN,
+    USER_KEY_NAME,
+    USER_SEED,
+)
+from helpers.token_manager import TokenManager
+from helpers.twin_template import TwinTemplate
+from helpers.utilities import encode_data, generate_headers
+from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
+
+HOST_URL = ""  # IOTICSpace URL
+AGENT_KEY_NAME = "PublisherConnector"
+SENSORS_COUNT = 100
+SENSOR_MODELS = ["T1000", "T2000"]
+FEED_ID = "temperature"
+SHARE_PERIOD = 5  # seconds
+
+
+# The properties and feed shared by all the sensors are serialised once
+SENSOR_TEMPLATE = TwinTemplate(
+    properties=[
+        {
+            "key": PROPERTY_KEY_COMMENT,
+            "langLiteralValue": {
+                "value": "A temperature sensor that shares temperature data",
+                "lang": "en",
+            },
+        },
+        {
+            "key": PROPERTY_KEY_HOST_ALLOW_LIST,
+            "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+        },
+        {
+            "key": PROPERTY_KEY_HOST_METADATA_ALLOW_LIST,
+            "uriValue": {"value": PROPERTY_VALUE_ALLOW_ALL},
+        },
+        {
+            "key": PROPERTY_KEY_TYPE,
+            "uriValue": {"value": SAREF_TEMPERATURE_SENSOR_ONTOLOGY},
+        },
+    ],
+    feeds=[
+        {
+            "id": FEED_ID,
+            "storeLast": True,
+            "properties": [
+                {
+                    "key": PROPERTY_KEY_LABEL,
+                    "langLiteralValue": {"value": "Temperature", "lang": "en"},
+                }
+            ],
+            "values": [
+                {
+                    "comment": "Temperature in degrees Celsius",
+                    "dataType": "decimal",
+                    "label": "reading",
+                    "unit": UNIT_DEGREE_CELSIUS,
+                }
+            ],
+        }
+    ],
+)
+
+
+def sensor_twin_body(twin_did: str, sensor_number: int) -> bytes:
+    return SENSOR_TEMPLATE.rest_body(
+        twin_did,
+        label=f"Temperature Sensor {sensor_number}",
+        properties=[
+            {
+                "key": SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+                "stringLiteralValue": {
+                    "value": SENSOR_MODELS[sensor_number % len(SENSOR_MODELS)]
+                },
+            }
+        ],
+    )
+
+
+async def main():
+    ##### IDENTITY MANAGEMENT #####
+    client = AsyncRestClient(max_concurrency=200)
+
+    ### 1. INSTANTIATE AN IDENTITY API OBJECT
+    endpoints = await client.get_host_endpoints(host_url=HOST_URL)
+    identity_api = get_rest_high_level_identity_api(
+        resolver_url=endpoints.get("resolver")
+    )
+
+    ### 2. CREATE AGENT AND USER IDENTITY, THEN DELEGATE
+    (
+        user_identity,
+        agent_identity,
+    ) = identity_api.create_user_and_agent_with_auth_delegation(
+        user_seed=USER_SEED,
+        user_key_name=USER_KEY_NAME,
+        agent_seed=AGENT_SEED,
+        agent_key_name=AGENT_KEY_NAME,
+    )
+
+    ### 3. GENERATE NEW TOKEN AND HEADERS, REFRESHED IN THE BACKGROUND BEFORE THE TOKEN EXPIRES
+    token_manager = TokenManager(
+        identity_api=identity_api,
+        agent_identity=agent_identity,
+        user_did=user_identity.did,
+        duration=TOKEN_DURATION,
+    )
+    token_manager.start()
+
+    headers = generate_headers(token=token_manager)
+
+    ##### TWIN SETUP #####
+    ### 4. CREATE THE SENSOR TWIN IDENTITIES
+    # The Identity library is blocking, so run the calls in the default executor
+    loop = asyncio.get_running_loop()
+    twin_identities = await asyncio.gather(
+        *[
+            loop.run_in_executor(
+                None,
+                lambda n=n: identity_api.create_twin_with_control_delegation(
+                    twin_seed=AGENT_SEED,
+                    twin_key_name=f"TemperatureSensor{n}",
+                    agent_registered_identity=agent_identity,
+                ),
+            )
+            for n in range(SENSORS_COUNT)
+        ]
+    )
+
+    ### 5. UPSERT ALL THE SENSOR TWINS CONCURRENTLY
+    await asyncio.gather(
+        *[
+            client.call(
+                UPSERT_TWIN,
+                headers=headers,
+                data=sensor_twin_body(twin_identity.did, n),
+                host=HOST_URL,
+            )
+            for n, twin_identity in enumerate(twin_identities)
+        ]
+    )
+    print(f"{SENSORS_COUNT} Temperature Sensor Twins created")
+
+    ##### TWIN INTERACTION #####
+    ### 6. SHARE ONE VALUE PER TWIN EVERY PERIOD, ALL THE SHARES IN FLIGHT AT ONCE
+    try:
+        while True:
+            timestamp = datetime.now(tz=timezone.utc).isoformat()
+            await asyncio.gather(
+                *[
+                    client.call(
+                        SHARE_FEED_DATA,
+                        headers=headers,
+                        payload={
+                            "sample": {
+                                "data": encode_data({"reading": randint(15, 30)}),
+                                "mime": "application/json",
+                                "timestamp": timestamp,
+                            }
+                        },
+                        host=HOST_URL,
+                        twin_id=twin_identity.did,
+                        feed_id=FEED_ID,
+                    )
+                    for twin_identity in twin_identities
+                ]
+            )
+            print(f"Shared {len(twin_identities)} values")
+            await asyncio.sleep(SHARE_PERIOD)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,232 @@
+import asyncio
+import json
+
+from helpers.aggregation import AggregationEngine
+from helpers.async_rest_client import AsyncRestClient
+from helpers.constants import (
+    AGENT_SEED,
+    PROPERTY_KEY_COMMENT,
+    PROPERTY_KEY_LABEL,
+    PROPERTY_KEY_TYPE,
+    RADIATOR_ONTOLOGY,
+    SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY,
+    SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
+    SEARCH_TWINS,
+    SUBSCRIBE_TO_FEED,
+    TOKEN_DURATION,
+    UPSERT_TWIN,
+    USER_KEY_NAME,
+    USER_SEED,
+)
+from helpers.input_sender import InputSender
+from helpers.stomp_client import StompClient
+from helpers.token_manager import TokenManager
+from helpers.utilities import decode_data, generate_headers
+from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
+
+HOST_URL = ""  # IOTICSpace URL
+AGENT_KEY_NAME = "SynthesiserConnector"
+TWIN_KEY_NAME = "SynthesiserTwin"
+RADIATOR_INPUT_ID = "on_off_switch"
+TEMPERATURE_THRESHOLD = 20
+
+
+def get_property_value(twin: dict, key: str):
+    for twin_property in twin.get("properties", []):
+        if twin_property["key"] == key:
+            for value_type, value in twin_property.items():
+                if value_type != "key":
+                    return value.get("value")
+
+    return None
+
+
+async def main():
+    ##### IDENTITY MANAGEMENT #####
+    client = AsyncRestClient(max_concurrency=200)
+
+    ### 1. INSTANTIATE AN IDENTITY API OBJECT
+    endpoints = await client.get_host_endpoints(host_url=HOST_URL)
+    identity_api = get_rest_high_level_identity_api(
+        resolver_url=endpoints.get("resolver")
+    )
+
+    ### 2. CREATE AGENT AND USER IDENTITY, THEN DELEGATE
+    (
+        user_identity,
+        agent_identity,
+    ) = identity_api.create_user_and_agent_with_auth_delegation(
+        user_seed=USER_SEED,
+        user_key_name=USER_KEY_NAME,
+        agent_seed=AGENT_SEED,
+        agent_key_name=AGENT_KEY_NAME,
+    )
+
+    ### 3. GENERATE NEW TOKEN AND HEADERS, REFRESHED IN THE BACKGROUND BEFORE THE TOKEN EXPIRES
+    token_manager = TokenManager(
+        identity_api=identity_api,
+        agent_identity=agent_identity,
+        user_did=user_identity.did,
+        duration=TOKEN_DURATION,
+    )
+    token_manager.start()
+
+    headers = generate_headers(token=token_manager)
+
+    ##### TWIN SETUP #####
+    ### 4. CREATE THE SYNTHESISER TWIN
+    synthesiser_identity = identity_api.create_twin_with_control_delegation(
+        twin_seed=AGENT_SEED,
+        twin_key_name=TWIN_KEY_NAME,
+        agent_registered_identity=agent_identity,
+    )
+    await client.call(
+        UPSERT_TWIN,
+        headers=headers,
+        payload={
+            "twinId": {"id": synthesiser_identity.did},
+            "properties": [
+                {
+                    "key": PROPERTY_KEY_LABEL,
+                    "langLiteralValue": {"value": "Synthesiser Twin", "lang": "en"},
+                },
+                {
+                    "key": PROPERTY_KEY_COMMENT,
+                    "langLiteralValue": {
+                        "value": "Turns the Radiators on when it is cold",
+                        "lang": "en",
+                    },
+                },
+            ],
+        },
+        host=HOST_URL,
+    )
+
+    ### 5. SEARCH FOR TEMPERATURE SENSORS AND RADIATORS CONCURRENTLY
+    async def search(twin_type: str) -> list:
+        return [
+            twin
+            async for twin in client.search_twins(
+                method=SEARCH_TWINS.method,
+                endpoint=SEARCH_TWINS.url.format(host=HOST_URL),
+                headers=headers,
+                payload={
+                    "responseType": "FULL",
+                    "filter": {
+                        "properties": [
+                            {"key": PROPERTY_KEY_TYPE, "uriValue": {"value": twin_type}}
+                        ]
+                    },
+                },
+                scope="LOCAL",
+            )
+        ]
+
+    sensors, radiators = await asyncio.gather(
+        search(SAREF_TEMPERATURE_SENSOR_ONTOLOGY), search(RADIATOR_ONTOLOGY)
+    )
+    print(f"Found {len(sensors)} Temperature Sensors and {len(radiators)} Radiators")
+
+    ##### TWIN INTERACTION #####
+    ### 6. FOLLOW THE SENSOR FEEDS
+    # The STOMP client calls back from its own thread: hand the frames over to the event loop
+    loop = asyncio.get_running_loop()
+    frames: asyncio.Queue = asyncio.Queue()
+
+    def on_frame(headers, body):
+        loop.call_soon_threadsafe(frames.put_nowait, body)
+
+    stomp_client = StompClient(
+        stomp_endpoint=endpoints.get("stomp"),
+        callback=on_frame,
+        token=token_manager,
+        host_url=HOST_URL,
+    )
+
+    # Latest reading of each sensor, averaged per sensor model and overall
+    readings = AggregationEngine(window_count=1, initial_feeds=max(1, len(sensors)))
+    sensor_models = {}
+    for sensor in sensors:
+        sensor_id = sensor["twinId"]["id"]
+        sensor_models[sensor_id] = get_property_value(
+            sensor, SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY
+        )
+        readings.add_feed(sensor_id, group=sensor_models[sensor_id])
+        for feed in sensor.get("feeds", []):
+            feed_id = feed["feedId"]["id"]
+            stomp_client.subscribe(
+                topic=SUBSCRIBE_TO_FEED.url.format(
+                    twin_follower_id=synthesiser_identity.did,
+                    twin_publisher_host_id=sensor["twinId"]["hostId"],
+                    twin_publisher_id=sensor_id,
+                    feed_id=feed_id,
+                ),
+                subscription_id=f"{sensor_id}-{feed_id}",
+            )
+
+    ### 7. AVERAGE THE LATEST READINGS AND DRIVE THE RADIATORS
+    # A radiator with a sensor model follows the sensors of that model, the others all the sensors
+    radiator_models = {
+        radiator["twinId"]["id"]: get_property_value(
+            radiator, SAREF_TEMPERATURE_SENSOR_HAS_MODEL_ONTOLOGY
+        )
+        for radiator in radiators
+    }
+
+    # Input messages are sent in the background, at most one per second per radiator
+    input_sender = InputSender(
+        host_url=HOST_URL,
+        headers=headers,
+        sender_twin_id=synthesiser_identity.did,
+        min_interval=1,
+    )
+    input_sender.start()
+
+    # The frames received meanwhile are handled as one batch: one evaluation of the averages
+    try:
+        while True:
+            bodies = [await frames.get()]
+            while not frames.empty():
+                bodies.append(frames.get_nowait())
+
+            for body in bodies:
+                body = json.loads(body)
+                sensor_id = body["interest"]["followedFeedId"]["twinId"]
+                readings.add(
+                    sensor_id, decode_data(body["feedData"]["data"])["reading"]
+                )
+
+            model_stats = readings.group_stats()
+            sensor_stats = readings.evaluate().values()
+            overall_average = sum(
+                stats.mean * stats.count for stats in sensor_stats
+            ) / sum(stats.count for stats in sensor_stats)
+
+            # One setpoint per radiator per batch. Not awaited: a radiator only
+            # gets the latest setpoint, the ones superseded while it was busy
+            # are never sent
+            radiators_on = 0
+            for radiator in radiators:
+                model = radiator_models[radiator["twinId"]["id"]]
+                average = (
+                    model_stats[model].mean if model in model_stats else overall_average
+                )
+                turn_on = average < TEMPERATURE_THRESHOLD
+                radiators_on += turn_on
+                input_sender.send(
+                    receiver_host_id=radiator["twinId"]["hostId"],
+                    receiver_twin_id=radiator["twinId"]["id"],
+                    input_id=RADIATOR_INPUT_ID,
+                    value={"turn_on": turn_on},
+                )
+            print(
+                f"Average {overall_average:.1f}, "
+                f"{radiators_on} of {len(radiators)} radiators on"
+            )
+    finally:
+        input_sender.stop()
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,11 +9,13 @@ from helpers.constants import (
     SAREF_TEMPERATURE_SENSOR_ONTOLOGY,
     SEARCH_TWINS,
     SUBSCRIBE_TO_FEED,
+    TOKEN_DURATION,
     UPSERT_TWIN,
     USER_KEY_NAME,
     USER_SEED,
 )
 from helpers.stomp_client import StompClient
+from helpers.token_manager import TokenManager
 from helpers.utilities import (
     decode_data,
     generate_headers,
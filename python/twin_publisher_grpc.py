@@ -13,6 +13,7 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
     AGENT_SEED,
+    TOKEN_DURATION,
 )
 from helpers.identity_auth import Identity
 from helpers.utilities import get_host_endpoints
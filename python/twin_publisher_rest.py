@@ -15,7 +15,9 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
     AGENT_SEED,
+    TOKEN_DURATION,
 )
+from helpers.token_manager import TokenManager
 from helpers.utilities import get_host_endpoints, make_api_call, encode_data
 from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
 
@@ -14,8 +14,10 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
     AGENT_SEED,
+    TOKEN_DURATION,
 )
 from helpers.stomp_client import StompClient
+from helpers.token_manager import TokenManager
 from helpers.utilities import get_host_endpoints, make_api_call, decode_data
 from iotics.lib.identity.api.high_level_api import get_rest_high_level_identity_api
 
@@ -7,6 +7,7 @@ from helpers.constants import (
     PROPERTY_KEY_LABEL,
     PROPERTY_KEY_TYPE,
     RADIATOR_ONTOLOGY,
+    TOKEN_DURATION,
     USER_KEY_NAME,
     USER_SEED,
 )
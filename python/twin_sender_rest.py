@@ -10,10 +10,12 @@ from helpers.constants import (
     RADIATOR_ONTOLOGY,
     SEARCH_TWINS,
     SEND_INPUT_MESSAGE,
+    TOKEN_DURATION,
     UPSERT_TWIN,
     USER_KEY_NAME,
     USER_SEED,
 )
+from helpers.token_manager import TokenManager
 from helpers.utilities import (
     encode_data,
     generate_headers,